@@ -0,0 +1,81 @@
+#!/bin/env python
+
+ScomcapUsageStr = "\n\
+Usage: scomcap.py <args> [optionals]\n\
+Mandatory args:\n\
+     -f <CapFile>   : Binary capture file (.scap) written by sercom.py -b\n\
+                      Its index file <CapFile>.idx must be alongside\n\
+optionals: If an optional is not given, records are not filtered on it\n\
+     -c <Cmd>       : Only records of this command (sent and received)\n\
+                      e.g. -c 'at#wlanscan=0'\n\
+     -t <From>[,<To>] : Only records in this time range, in seconds from\n\
+                      start of capture, e.g. -t 3600,7200 or -t 3600\n\
+     -e <Sentry#|none> : Only responses ended by sentry number Sentry#\n\
+                      (0 for 1st sentry= line in .conf, 1 for 2nd, ...\n\
+                      sentrx= lines are numbered after all sentry= lines)\n\
+                      none - only timed-out responses\n\
+     -S <Sources>   : Only records from these sources, any of -\n\
+                      A - Auto (scom), M - Manual, U - Unsolicited,\n\
+                      S - sercom messages. e.g. -S AM\n\
+     -o <OutFile>   : Export matching records to OutFile in sercom -l log\n\
+                      text format, instead of printing them on stdout\n\
+     -n             : Only print number of matching records\n\
+NOTE:\n\
+1. With no optionals, whole capture is exported/printed as sercom -l log\n\
+2. Capture and index files are mmap'ed and the queries run on the index,\n\
+   so only matching records are ever read from the capture file\n\
+"
+
+import sys
+import getopt
+from sercomlib.capture import CaptureReader, CapFormatText, CapTimedOut
+
+######################### Start-Of-Python-Script (SOPS)
+
+if len (sys.argv) == 1 : sys.exit (ScomcapUsageStr)
+
+CapFile = None
+Cmd = None
+Start = None
+End = None
+Sentry = None
+Srcs = None
+OutFile = None
+CountOnly = False
+
+try : opts, args = getopt.getopt (sys.argv[1:], 'f:c:t:e:S:o:n')
+except getopt.GetoptError as e : sys.exit (str (e) + "\n" + ScomcapUsageStr)
+for opt, arg in opts :
+    if opt == "-f" : CapFile = arg
+    elif opt == "-c" : Cmd = arg
+    elif opt == "-t" :
+        try :
+            t = arg.split (",")
+            if t[0] : Start = float (t[0])
+            if len (t) > 1 and t[1] : End = float (t[1])
+        except ValueError : sys.exit ("Bad time range - " + arg)
+    elif opt == "-e" :
+        if arg == "none" : Sentry = CapTimedOut
+        else :
+            try : Sentry = int (arg)
+            except ValueError : sys.exit ("Bad sentry number - " + arg)
+    elif opt == "-S" : Srcs = arg.upper ()
+    elif opt == "-o" : OutFile = arg
+    elif opt == "-n" : CountOnly = True
+
+if not CapFile : sys.exit ("Need capture file\n" + ScomcapUsageStr)
+
+try : Cap = CaptureReader (CapFile)
+except (IOError, OSError, ValueError) :
+    sys.exit ("Unable to read capture: " + str (sys.exc_info ()[1]))
+
+Out = sys.stdout
+if OutFile : Out = open (OutFile, "w")
+Count = 0
+for Rec in Cap.query (Cmd, Start, End, Sentry, Srcs) :
+    Count += 1
+    if not CountOnly : Out.write (CapFormatText (Rec))
+if OutFile : Out.close ()
+Cap.close ()
+
+if CountOnly or OutFile : print (str (Count) + " records")
@@ -0,0 +1,263 @@
+#!/bin/env python
+
+FleetUsageStr = "\n\
+Usage: scomfleet.py <args> [optionals]\n\
+Mandatory args:\n\
+     -f <Manifest>  : Fleet manifest file, one port per line -\n\
+                      <Device#> <SerConf> <ScomFile> [Name]\n\
+                      e.g. /dev/ttyUSB0 sample.conf example.scom modem0\n\
+                      Lines starting with '#' are comments\n\
+                      Name defaults to device name e.g. ttyUSB0\n\
+optionals:\n\
+     -j <Workers>   : Number of ports run concurrently\n\
+                      Default - all ports of the manifest\n\
+     -o <OutDir>    : Directory for per-port files and report\n\
+                      Default - <MonthName-Date-Year_Hour-Minute-Second>_fleet\n\
+     -b             : Also write binary capture of each port (refer -b of\n\
+                      sercom.py)\n\
+     -a             : Run all ports in one thread on an asyncio event loop\n\
+                      (refer sercomlib/aio.py) instead of a thread per\n\
+                      worker; scales to hundreds of ports\n\
+NOTE:\n\
+1. Each port runs its scom like sercom.py -d <Device#> -c <SerConf> -s\n\
+   <ScomFile> -l, in its own session. Per port, OutDir has\n\
+   <Name>_sercom.log (-l log), <Name>.out (console output) and\n\
+   <Name>.scap (with -b)\n\
+2. A port PASSes if its scom runs to the end with no command timed-out.\n\
+   It FAILs on a bad scom/conf, port open or scvcmd/scvrsp failure, or\n\
+   any command time-out\n\
+3. Aggregated pass/fail and timing report is printed at the end and\n\
+   written to OutDir/report.json. Exit status is 1 if any port FAILed\n\
+4. scom_enman is ignored, Manual mode needs a console per port\n\
+"
+
+import os
+import sys
+import json
+import time
+import queue
+import getopt
+import datetime
+import asyncio
+import threading
+from sercomlib.scomc import CompileScom, ScomError
+from sercomlib.portconf import PortConfig, PortConfError
+from sercomlib.session import SercomSession, SessionError
+from sercomlib.aio import AioSercomSession
+
+# Function to read a fleet manifest
+# Usage  : ReadManifest (path)
+# Return : list of {"port", "conf", "scom", "name"} dicts
+def ReadManifest (path) :
+    entries = []
+    names = {}
+    fh = open (path, "r")
+    for num, line in enumerate (fh) :
+        words = line.split ()
+        if not words or words[0][0] == '#' : continue
+        if len (words) not in (3, 4) :
+            fh.close ()
+            sys.exit (path + ":" + str (num + 1) + ": Bad manifest line - " \
+                    + line.strip ())
+        name = words[3] if len (words) == 4 else os.path.basename (words[0])
+        # Keep per-port file names apart
+        if name in names :
+            names[name] += 1
+            name = name + "-" + str (names[name])
+        else : names[name] = 0
+        entries.append ({"port" : words[0], "conf" : words[1], \
+                "scom" : words[2], "name" : name})
+    fh.close ()
+    return entries
+
+# Function to setup the session of a port of the fleet
+# Usage  : PortSession (entry, outdir, capture, out, cls)
+#          entry   - manifest entry (refer ReadManifest)
+#          outdir  - directory for per-port files
+#          capture - write binary capture too
+#          out     - console output file of the port
+#          cls     - SercomSession or AioSercomSession
+# Return : (session, compiled scom)
+def PortSession (entry, outdir, capture, out, cls) :
+    name = entry["name"]
+    prog = CompileScom (entry["scom"])
+    conf = PortConfig (entry["conf"])
+    sess = cls (entry["port"], conf, out=out, \
+            logfile=os.path.join (outdir, name + "_sercom.log"), \
+            capfile=os.path.join (outdir, name + ".scap") if capture else None)
+    sess.manualen = False
+    if conf.bad != "none" :
+        sess.slogprint ("Bad parameter '" + conf.bad + "' in " + \
+                entry["conf"] + ". Using Default Serial Port Configuration")
+    return sess, prog
+
+# Function to close the session of a port and finish its result
+# Usage  : PortResult (res, sess, out, start)
+#          res   - result dict with status/reason of the run
+#          sess  - session of the port, None if it couldn't be setup
+#          out   - console output file of the port, None if not open
+#          start - time the port started at
+# Return : res
+def PortResult (res, sess, out, start) :
+    if sess :
+        for st in sess.stats.cmds.values () :
+            res["commands"] += st.count
+            res["timeouts"] += st.timeouts
+        if res["status"] == "PASS" and res["timeouts"] :
+            res["status"] = "FAIL"
+            res["reason"] = str (res["timeouts"]) + " command(s) timed-out"
+        if res["reason"] : sess.slogprint ("FAIL: " + res["reason"])
+        sess.close ()
+    if out : out.close ()
+    res["seconds"] = round (time.time () - start, 3)
+    return res
+
+# Function to run a scom on one port of the fleet
+# Usage  : RunPort (entry, outdir, capture)
+#          entry   - manifest entry (refer ReadManifest)
+#          outdir  - directory for per-port files
+#          capture - write binary capture too
+# Return : result dict of the port (refer report.json)
+def RunPort (entry, outdir, capture) :
+    res = dict (entry, status="FAIL", reason="", commands=0, timeouts=0)
+    start = time.time ()
+    sess = None
+    out = None
+    try :
+        out = open (os.path.join (outdir, entry["name"] + ".out"), "w")
+        sess, prog = PortSession (entry, outdir, capture, out, SercomSession)
+        sess.open ()
+        if not sess.validate () :
+            raise SessionError ("Basic " + sess.conf.scvcmd + "-" + \
+                    sess.conf.scvrsp + " session failed")
+        sess.RunScomStack ([prog])
+        res["status"] = "PASS"
+    except (ScomError, PortConfError, SessionError) as e :
+        res["reason"] = str (e).split ("\n")[0]
+    except Exception as e :
+        # e.g. port unplugged mid-run, don't take the whole fleet down
+        res["reason"] = type (e).__name__ + ": " + str (e)
+    return PortResult (res, sess, out, start)
+
+# Coroutine counterpart of RunPort, on an asyncio session
+# Usage  : await AioRunPort (entry, outdir, capture)
+# Return : result dict of the port (refer report.json)
+async def AioRunPort (entry, outdir, capture) :
+    res = dict (entry, status="FAIL", reason="", commands=0, timeouts=0)
+    start = time.time ()
+    sess = None
+    out = None
+    try :
+        out = open (os.path.join (outdir, entry["name"] + ".out"), "w")
+        sess, prog = PortSession (entry, outdir, capture, out, AioSercomSession)
+        await sess.open ()
+        if not await sess.validate () :
+            raise SessionError ("Basic " + sess.conf.scvcmd + "-" + \
+                    sess.conf.scvrsp + " session failed")
+        await sess.RunScomStack ([prog])
+        res["status"] = "PASS"
+    except (ScomError, PortConfError, SessionError) as e :
+        res["reason"] = str (e).split ("\n")[0]
+    except Exception as e :
+        res["reason"] = type (e).__name__ + ": " + str (e)
+    return PortResult (res, sess, out, start)
+
+# Function to format a result as a report line
+def ReportLine (res) :
+    return "{0:<4} {1:<16} {2:>9.1f}s {3:>7} cmds {4:>5} t/o  {5}".format ( \
+            res["status"], res["name"], res["seconds"], res["commands"], \
+            res["timeouts"], res["reason"])
+
+# Thread: run ports from the work queue till it's empty
+def FleetWorker (work, results, outdir, capture, lock) :
+    while 1 :
+        try : entry = work.get (False)
+        except queue.Empty : return
+        res = RunPort (entry, outdir, capture)
+        lock.acquire ()
+        results.append (res)
+        print (ReportLine (res))
+        sys.stdout.flush ()
+        lock.release ()
+
+# Coroutine: run all ports on the event loop, upto workers at a time
+async def AioFleet (entries, workers, results, outdir, capture) :
+    slots = asyncio.Semaphore (workers or len (entries))
+    async def worker (entry) :
+        async with slots : res = await AioRunPort (entry, outdir, capture)
+        results.append (res)
+        print (ReportLine (res))
+        sys.stdout.flush ()
+    await asyncio.gather (*[worker (e) for e in entries])
+
+######################### Start-Of-Python-Script (SOPS)
+
+if len (sys.argv) == 1 : sys.exit (FleetUsageStr)
+
+Manifest = None
+Workers = 0
+OutDir = datetime.datetime.now ().strftime ('%b-%d-%Y_%H-%M-%S') + "_fleet"
+Capture = False
+AioMode = False
+
+try : opts, args = getopt.getopt (sys.argv[1:], 'f:j:o:ba')
+except getopt.GetoptError as e : sys.exit (str (e) + "\n" + FleetUsageStr)
+for opt, arg in opts :
+    if opt == "-f" : Manifest = arg
+    elif opt == "-j" :
+        try : Workers = int (arg)
+        except ValueError : Workers = 0
+        if Workers <= 0 : sys.exit ("Bad number of workers - " + arg)
+    elif opt == "-o" : OutDir = arg
+    elif opt == "-b" : Capture = True
+    elif opt == "-a" : AioMode = True
+
+if not Manifest : sys.exit ("Need fleet manifest\n" + FleetUsageStr)
+try : Entries = ReadManifest (Manifest)
+except (IOError, OSError) :
+    sys.exit ("Unable to read manifest: " + str (sys.exc_info ()[1]))
+if not Entries : sys.exit ("No ports in manifest " + Manifest)
+if not os.path.isdir (OutDir) : os.makedirs (OutDir)
+
+Results = []
+Start = time.time ()
+print ("Running " + str (len (Entries)) + " ports, per-port files in " + OutDir)
+if AioMode :
+    Loop = asyncio.new_event_loop ()
+    asyncio.set_event_loop (Loop)
+    try : Loop.run_until_complete (AioFleet (Entries, Workers, Results, \
+            OutDir, Capture))
+    except KeyboardInterrupt : sys.exit ("\nInterrupted, report not written")
+    Loop.close ()
+else :
+    Work = queue.Queue ()
+    for Entry in Entries : Work.put (Entry)
+    Lock = threading.Lock ()
+    Threads = []
+    for i in range (min (Workers or len (Entries), len (Entries))) :
+        t = threading.Thread (target=FleetWorker, args=(Work, Results, \
+                OutDir, Capture, Lock))
+        t.daemon = True
+        t.start ()
+        Threads.append (t)
+    try :
+        # join() with timeout, so Ctrl+C is seen
+        for t in Threads :
+            while t.is_alive () : t.join (0.5)
+    except KeyboardInterrupt : sys.exit ("\nInterrupted, report not written")
+Elapsed = time.time () - Start
+
+# Report in manifest order
+Order = dict ((e["name"], i) for i, e in enumerate (Entries))
+Results.sort (key=lambda r : Order[r["name"]])
+Passed = len ([r for r in Results if r["status"] == "PASS"])
+print ("\n----------------- Fleet report")
+for Res in Results : print (ReportLine (Res))
+print (str (Passed) + "/" + str (len (Results)) + " ports passed in " + \
+        "%.1f" % Elapsed + "s")
+fh = open (os.path.join (OutDir, "report.json"), "w")
+json.dump ({"manifest" : Manifest, "seconds" : round (Elapsed, 3), \
+        "passed" : Passed, "failed" : len (Results) - Passed, \
+        "ports" : Results}, fh, indent=2, sort_keys=True)
+fh.close ()
+sys.exit (0 if Passed == len (Results) else 1)
@@ -0,0 +1,219 @@
+#!/bin/env python
+
+BenchUsageStr = "\n\
+Usage: sercombench.py [optionals]\n\
+optionals:\n\
+     -o <JsonFile>  : Write results to JsonFile (default - stdout)\n\
+     -n <Iters>     : Commands per measurement (default 200)\n\
+     -B <Bauds>     : Comma separated baud rates for round-trip benchmark\n\
+                      (default - all baudrt values from 9600 up)\n\
+     -S <Sizes>     : Comma separated response sizes in bytes for sentry\n\
+                      matching benchmark (default 64,1024,16384,262144,1048576)\n\
+     -k <Bench>     : Run only these benchmarks, comma separated, any of\n\
+                      rtt, sentry, loop (default - all)\n\
+NOTE:\n\
+1. Runs sercom.py against a virtual modem (refer vmodem.py) on a pty, so\n\
+   it needs a posix system and measures sercom itself, not a modem\n\
+2. Per-command timings are taken from sercom's own -b capture, round-trip\n\
+   is from command record to its response record (nanosecond timestamps)\n\
+3. rtt    - HandleCmdAndGetResp round-trip at each baud rate, with the\n\
+            virtual modem pacing its output at that baud rate\n\
+   sentry - round-trip and throughput as response size grows\n\
+   loop   - scom loop iterations per second with logging off, -l and -b\n\
+            (runs 50 x Iters iterations)\n\
+4. Compare JSON of two runs to catch regressions in the receive path\n\
+"
+
+import os
+import sys
+import json
+import time
+import shutil
+import getopt
+import platform
+import tempfile
+import subprocess
+from sercomlib.vmodem import VirtualModem
+from sercomlib.capture import CaptureReader
+from sercomlib.portconf import SerBauds as BenchBauds
+BenchSercom = os.path.join (os.path.dirname (os.path.abspath (__file__)), \
+        "sercom.py")
+BenchConf = "scvcmd=AT\nscvrsp=OK\nsentry=\\r\\nOK\\r\\n\n" + \
+        "sentry=\\r\\nERROR\\r\\n\nbaudrt={baud}\n"
+
+# Function to get summary statistics of a list of seconds in milliseconds
+# Usage  : BenchSummary (secs)
+# Return : dict of count, mean, min, p50, p95, p99, max
+def BenchSummary (secs) :
+    if not secs : return {"count" : 0}
+    s = sorted (secs)
+    pct = lambda p : s[min (len (s) - 1, int (p * len (s)))] * 1000
+    return {"count" : len (s), "mean" : sum (s) * 1000 / len (s), \
+            "min" : s[0] * 1000, "p50" : pct (0.50), "p95" : pct (0.95), \
+            "p99" : pct (0.99), "max" : s[-1] * 1000}
+
+# Function to get a response body of about size bytes with no sentry in it
+# Usage  : BenchBigResp (size)
+# Return : response string (modem output after command echo)
+def BenchBigResp (size) :
+    line = "+BIG: " + "x" * 56 + "\r\n"
+    return "\r\n" + line * max (1, size // len (line)) + "\r\nOK\r\n"
+
+# Function to run sercom.py on a scom file against a virtual modem
+# Usage  : BenchRun (workdir, modem, baud, cmds, iters, opts)
+#          workdir - directory to run sercom in (scom/conf/log files)
+#          modem   - started VirtualModem
+#          baud    - baudrt for .conf
+#          cmds    - commands in scom loop body
+#          iters   - scom loop iterations
+#          opts    - extra sercom options e.g. ["-b"]
+# Return : (wall-clock seconds, capture file path or None)
+def BenchRun (workdir, modem, baud, cmds, iters, opts) :
+    for f in os.listdir (workdir) :
+        if f.endswith ((".scap", ".idx", ".log")) :
+            os.remove (os.path.join (workdir, f))
+    fh = open (os.path.join (workdir, "bench.conf"), "w")
+    fh.write (BenchConf.format (baud=baud))
+    fh.close ()
+    fh = open (os.path.join (workdir, "bench.scom"), "w")
+    fh.write ("scom_loopbegin iter=" + str (iters) + "\n" + \
+            "\n".join (cmds) + "\nscom_loopend\n")
+    fh.close ()
+    env = dict (os.environ, SERCOM_CACHE_DIR=workdir)
+    devnull = open (os.devnull, "w")
+    start = time.time ()
+    subprocess.call ([sys.executable, BenchSercom, "-d", modem.port, "-c", \
+            "bench.conf", "-s", "bench.scom"] + opts, cwd=workdir, env=env, \
+            stdout=devnull, stderr=devnull, stdin=devnull)
+    elapsed = time.time () - start
+    devnull.close ()
+    caps = [f for f in os.listdir (workdir) if f.endswith (".scap")]
+    if not caps : return elapsed, None
+    return elapsed, os.path.join (workdir, caps[0])
+
+# Function to get command round-trip times from a sercom capture
+# Usage  : BenchRtts (capfile, cmd)
+#          cmd - only this command's round trips
+# Return : list of round-trip seconds (session validation command skipped)
+def BenchRtts (capfile, cmd) :
+    cap = CaptureReader (capfile)
+    rtts = []
+    sent = None
+    for rec in cap.query (cmd=cmd, srcs="A") :
+        if rec.dir == "O" : sent = rec.ts
+        elif rec.dir == "I" and sent is not None :
+            rtts.append ((rec.ts - sent) / 1e9)
+            sent = None
+    cap.close ()
+    return rtts[1:] if cmd == "AT" else rtts
+
+# Function to benchmark round-trip latency across baud rates
+# Usage  : BenchRtt (workdir, bauds, iters)
+# Return : list of per-baud result dicts
+def BenchRtt (workdir, bauds, iters) :
+    results = []
+    for baud in bauds :
+        modem = VirtualModem ({"AT" : [(None, "\r\nOK\r\n")]}, baud=baud)
+        modem.start ()
+        # Keep slow bauds within reasonable run time
+        n = max (5, min (iters, baud // 100))
+        elapsed, capfile = BenchRun (workdir, modem, baud, ["AT"], n, ["-b"])
+        modem.stop ()
+        res = {"baud" : baud, "rtt_ms" : BenchSummary (BenchRtts (capfile, \
+                "AT") if capfile else [])}
+        results.append (res)
+        BenchProgress ("rtt", res)
+    return results
+
+# Function to benchmark sentry matching/receive path as response grows
+# Usage  : BenchSentry (workdir, sizes, iters)
+# Return : list of per-size result dicts
+def BenchSentry (workdir, sizes, iters) :
+    results = []
+    for size in sizes :
+        resp = BenchBigResp (size)
+        modem = VirtualModem ({"AT" : [(None, "\r\nOK\r\n")], \
+                "AT+BIG" : [(None, resp)]})
+        modem.start ()
+        # Keep total bytes per size bounded
+        n = max (5, min (iters, (64 << 20) // len (resp)))
+        elapsed, capfile = BenchRun (workdir, modem, 115200, ["AT+BIG"], n, \
+                ["-b"])
+        modem.stop ()
+        rtts = BenchRtts (capfile, "AT+BIG") if capfile else []
+        res = {"size" : len (resp), "rtt_ms" : BenchSummary (rtts)}
+        if rtts : res["mbps"] = len (resp) * len (rtts) / sum (rtts) / 1e6
+        results.append (res)
+        BenchProgress ("sentry", res)
+    return results
+
+# Function to benchmark scom loop iterations per second, logging off/on
+# Usage  : BenchLoop (workdir, iters)
+# Return : list of per-logging-mode result dicts
+def BenchLoop (workdir, iters) :
+    results = []
+    modem = VirtualModem ({"AT" : [(None, "\r\nOK\r\n")]})
+    modem.start ()
+    # Per iteration cost is tiny next to sercom startup, so loop a lot
+    iters *= 50
+    for name, opts in (("off", []), ("log", ["-l"]), ("capture", ["-b"])) :
+        # Startup (interpreter, port open, validation) is measured with an
+        # empty loop (best of 3) and taken off
+        base = min ([BenchRun (workdir, modem, 115200, ["AT"], 0, opts)[0] \
+                for i in range (3)])
+        elapsed, capfile = BenchRun (workdir, modem, 115200, ["AT"], iters, \
+                opts)
+        res = {"logging" : name, "iters" : iters, \
+                "seconds" : elapsed - base, \
+                "iters_per_sec" : iters / max (elapsed - base, 1e-9)}
+        results.append (res)
+        BenchProgress ("loop", res)
+    modem.stop ()
+    return results
+
+# Function to show progress of benchmarks on stderr
+def BenchProgress (bench, res) :
+    sys.stderr.write (bench + ": " + json.dumps (res, sort_keys=True) + "\n")
+    sys.stderr.flush ()
+
+######################### Start-Of-Python-Script (SOPS)
+
+if os.name != "posix" : sys.exit ("sercombench.py needs a posix pty")
+
+OutFile = None
+Iters = 200
+Bauds = [b for b in BenchBauds if b >= 9600]
+Sizes = [64, 1024, 16384, 262144, 1048576]
+Benches = ["rtt", "sentry", "loop"]
+
+try :
+    opts, args = getopt.getopt (sys.argv[1:], 'o:n:B:S:k:h')
+    for opt, arg in opts :
+        if opt == "-o" : OutFile = arg
+        elif opt == "-n" : Iters = int (arg)
+        elif opt == "-B" : Bauds = [int (b) for b in arg.split (",")]
+        elif opt == "-S" : Sizes = [int (s) for s in arg.split (",")]
+        elif opt == "-k" : Benches = arg.split (",")
+        elif opt == "-h" : sys.exit (BenchUsageStr)
+except (getopt.GetoptError, ValueError) as e :
+    sys.exit (str (e) + "\n" + BenchUsageStr)
+for b in Bauds :
+    if b not in BenchBauds : sys.exit ("Bad baud rate - " + str (b))
+for b in Benches :
+    if b not in ("rtt", "sentry", "loop") : sys.exit ("Bad benchmark - " + b)
+
+Results = {"timestamp" : time.strftime ("%Y-%m-%dT%H:%M:%S"), \
+        "python" : platform.python_version (), \
+        "platform" : platform.platform (), "iters" : Iters}
+WorkDir = tempfile.mkdtemp (prefix="sercombench")
+try :
+    if "rtt" in Benches : Results["rtt"] = BenchRtt (WorkDir, Bauds, Iters)
+    if "sentry" in Benches :
+        Results["sentry"] = BenchSentry (WorkDir, Sizes, Iters)
+    if "loop" in Benches : Results["loop"] = BenchLoop (WorkDir, Iters)
+finally : shutil.rmtree (WorkDir, True)
+
+Out = json.dumps (Results, indent=2, sort_keys=True)
+if OutFile :
+    fh = open (OutFile, "w"); fh.write (Out + "\n"); fh.close ()
+else : print (Out)
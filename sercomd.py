@@ -0,0 +1,122 @@
+#!/bin/env python
+
+SercomdUsageStr = "\n\
+Usage: sercomd.py <args> [optionals]\n\
+Daemon - keep ports open and validated, run jobs submitted by clients:\n\
+     -f <Manifest>  : Daemon manifest file, one port per line -\n\
+                      <Device#> <SerConf> [Name]\n\
+                      e.g. /dev/ttyUSB0 sample.conf modem0\n\
+                      Lines starting with '#' are comments\n\
+                      Name defaults to device name e.g. ttyUSB0\n\
+     -o <LogDir>    : Write -l log of each port as LogDir/<Name>_sercom.log\n\
+                      Default - No logging\n\
+Client - submit a job to the daemon and stream its output:\n\
+     -p <Name>      : Port to run the job on (Name from manifest)\n\
+     -s <ScomFile>  : Run a scom file on the port\n\
+     -x <Cmd>       : Send a single command to the port\n\
+     -t <Timeout>   : Response timeout in seconds for -x\n\
+                      Default - as configured for the port\n\
+     -P             : List ports of the daemon with their state\n\
+Both:\n\
+     -u <Socket>    : Unix socket of the daemon\n\
+                      Default - /tmp/sercomd-<uid>.sock\n\
+NOTE:\n\
+1. Daemon opens and validates (scvcmd/scvrsp) all ports at start. A port\n\
+   that's down (open/validation failed, unplugged) is retried by its next\n\
+   job\n\
+2. Jobs of a port run one after another in submission order, different\n\
+   ports run in parallel. Ports stay open between jobs; scom_timeout\n\
+   settings and command statistics carry over to later jobs\n\
+3. Client exit status is 0 if the job ran with no command timed-out, else\n\
+   1 (reason is printed to stderr)\n\
+4. scom_enman is ignored, Manual mode needs a console\n\
+5. Daemon runs till Ctrl+C/SIGTERM\n\
+"
+
+import os
+import sys
+import getopt
+import signal
+from sercomlib.daemon import SercomDaemon, DaemonError, DaemonRequest, \
+        ReadDaemonManifest, DaemonSockPath
+
+# Function to run the daemon till it's stopped
+# Usage  : RunDaemon (manifest, sockpath, logdir)
+# Return : None
+def RunDaemon (manifest, sockpath, logdir) :
+    try : ports = ReadDaemonManifest (manifest)
+    except (IOError, OSError) :
+        sys.exit ("Unable to read manifest: " + str (sys.exc_info ()[1]))
+    except DaemonError as e : sys.exit (str (e))
+    if not ports : sys.exit ("No ports in manifest " + manifest)
+    if logdir and not os.path.isdir (logdir) : os.makedirs (logdir)
+    try : daemon = SercomDaemon (ports, sockpath, logdir)
+    except (DaemonError, IOError, OSError) as e : sys.exit (str (e))
+    # SIGTERM stops the daemon the same way as Ctrl+C
+    def OnTerm (signum, frame) : raise KeyboardInterrupt
+    signal.signal (signal.SIGTERM, OnTerm)
+    try :
+        for st in daemon.start () :
+            print ("{0:<16} {1:<16} {2:<5} {3}".format (st["name"], \
+                    st["device"], st["state"] if st["state"] != "idle" else \
+                    "up", st["reason"]))
+        print ("sercomd serving " + str (len (ports)) + " ports on " + sockpath)
+        sys.stdout.flush ()
+        daemon.serve_forever ()
+    except KeyboardInterrupt : pass
+    print ("sercomd stopping")
+    daemon.stop ()
+
+# Function to submit a job to the daemon, streaming its output to stdout
+# Usage  : RunClient (req, sockpath)
+# Return : None, exits with 0 on success, 1 on failure
+def RunClient (req, sockpath) :
+    try :
+        if req["op"] == "ports" :
+            for st in DaemonRequest (req, sockpath)["ports"] :
+                print ("{0:<16} {1:<16} {2:<5} {3:>6} jobs {4:>3} queued  {5}" \
+                        .format (st["name"], st["device"], st["state"], \
+                        st["jobs"], st["queued"], st["reason"]))
+            sys.exit (0)
+        for msg in DaemonRequest (req, sockpath) :
+            if "out" in msg :
+                sys.stdout.write (msg["out"])
+                sys.stdout.flush ()
+    except DaemonError as e : sys.exit (str (e))
+    if not msg["ok"] : sys.stderr.write ("sercomd: " + msg["reason"] + "\n")
+    sys.exit (0 if msg["ok"] else 1)
+
+######################### Start-Of-Python-Script (SOPS)
+
+if len (sys.argv) == 1 : sys.exit (SercomdUsageStr)
+if not hasattr (os, "getuid") : sys.exit ("sercomd.py needs Unix sockets")
+
+Manifest = None
+LogDir = None
+SockPath = DaemonSockPath
+Req = {}
+
+try : opts, args = getopt.getopt (sys.argv[1:], 'f:o:p:s:x:t:Pu:')
+except getopt.GetoptError as e : sys.exit (str (e) + "\n" + SercomdUsageStr)
+for opt, arg in opts :
+    if opt == "-f" : Manifest = arg
+    elif opt == "-o" : LogDir = arg
+    elif opt == "-u" : SockPath = arg
+    elif opt == "-p" : Req["port"] = arg
+    elif opt == "-s" :
+        # Daemon doesn't run in our directory, scom paths are relative to it
+        Req["op"] = "scom"; Req["scom"] = os.path.abspath (arg)
+        Req["cwd"] = os.getcwd ()
+    elif opt == "-x" : Req["op"] = "cmd"; Req["cmd"] = arg
+    elif opt == "-P" : Req["op"] = "ports"
+    elif opt == "-t" :
+        try : Req["tout"] = float (arg)
+        except ValueError : Req["tout"] = 0
+        if Req["tout"] <= 0 : sys.exit ("Bad timeout - " + arg)
+
+if Manifest : RunDaemon (Manifest, SockPath, LogDir)
+elif "op" not in Req :
+    sys.exit ("Need -f (daemon) or -s/-x/-P (client)\n" + SercomdUsageStr)
+elif Req["op"] != "ports" and "port" not in Req :
+    sys.exit ("Need port (-p) to run the job on\n" + SercomdUsageStr)
+else : RunClient (Req, SockPath)
@@ -0,0 +1,15 @@
+# sercomlib - reusable building blocks of sercom.py
+# (serial session helpers which are independent of the sercom CLI)
+#
+# Library API - a persistent session on a serial port, e.g. for test suites:
+#   from sercomlib import Session
+#   with Session ("/dev/ttyUSB0", "sample.conf") as s :
+#       Resp = s.send_command ("AT+CSQ")
+#       s.run_scom ("example.scom")
+# (asyncio sessions are in sercomlib.aio, python 3 only)
+
+from sercomlib.portconf import PortConfig, PortConfError
+from sercomlib.scomc import CompileScom, ScomError
+from sercomlib.session import Session, SercomSession, SessionError, \
+        CommandTimeout
+from sercomlib.xfer import XferError
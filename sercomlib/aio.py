@@ -0,0 +1,279 @@
+# asyncio sercom session
+#
+# SercomSession blocks its caller till a response is complete, so driving
+# many ports at once needs a thread per port (refer scomfleet.py).
+# AioSercomSession instead puts the serial port fd in the asyncio event loop:
+# a reader callback receives whatever arrives, scans it for sentries while a
+# command is in flight and routes it as URCs/unsolicited data otherwise.
+# command() and the scom runner are coroutines, so hundreds of ports can run
+# their scoms concurrently in one thread, all sleeping in the event loop's
+# select/epoll while their modems are quiet.
+# Needs python 3.5+ and a POSIX serial port (a pollable fd).
+#
+# Usage:
+#   sess = AioSercomSession ("/dev/ttyUSB0", "sample.conf")
+#   await sess.open ()
+#   if await sess.validate () :
+#       Resp = await sess.command ("AT+CSQ")
+#       await sess.RunScomStack ([CompileScom ("example.scom")])
+#   sess.close ()
+
+import os
+import codecs
+import asyncio
+import serial
+from sercomlib.scomc import SOP_CMD, SOP_SLEEP, SOP_WAITURC, SOP_LOOP, \
+        SOP_SCOM, SOP_BREAK, SOP_ENMAN, SOP_EXPECT, SOP_TIMEOUT, SOP_SENDFILE
+from sercomlib.session import SercomSession, SessionError, SCmd, MonoTime, \
+        RecvSerialData, SendSerialData, LoopSchedule
+from sercomlib.xfer import XferError
+
+class AioSercomSession (SercomSession) : #{
+    """ A sercom session on one serial port, driven by an asyncio loop """
+    # Event loop the port is registered with, None till open()
+    loop = None
+    # Manual mode reads stdin, which would block the event loop
+    manualen = False
+    # Setup session on class instantiation, call open() to open the port
+    # Usage  : AioSercomSession (portid, conf, out, logfile, logmax, capfile)
+    #          Same as SercomSession
+    def __init__ (self, *args, **kwargs) :
+        SercomSession.__init__ (self, *args, **kwargs)
+        # Future of response in flight (resolved with (SentryIdx, EoR) by
+        # OnRx), None while port is idle
+        self.rxwait = None
+        self.nrx = 0
+        self.firstrx = None
+        # Error which took the port down while it was idle, raised by the
+        # next command
+        self.rxerror = None
+        # Rx buffer and decoder for data received while port is idle
+        self.idlebuf = bytearray (self.conf.rxblks)
+        self.idledecoder = codecs.getincrementaldecoder ("utf-8") ( \
+                errors="replace")
+        # [prefix, seq seen, future] of scom_waiturc's in progress
+        self.urcwaiters = []
+        self.cmdlock = None
+    # Open and configure the serial port and start receiving from it
+    # Usage  : await open ()
+    # Return : None, raises SessionError if port can't be opened
+    async def open (self) :
+        if os.name != "posix" :
+            raise SessionError ("asyncio sessions need a POSIX serial port")
+        SercomSession.open (self)
+        self.loop = asyncio.get_event_loop ()
+        # One Command-Response session at a time on the port
+        self.cmdlock = asyncio.Lock ()
+        self.loop.add_reader (self.port.fd, self.OnRx)
+    # Validate basic command before actual serial communication and start
+    # routing configured URCs
+    # Usage  : await validate ()
+    # Return : True if scvcmd got scvrsp, else False
+    async def validate (self) :
+        if self.conf.autobd and self.port.baudrate :
+            # Probing reads the port itself and sleeps, in a worker thread
+            self.loop.remove_reader (self.port.fd)
+            try : Found = await self.loop.run_in_executor (None, self.AutoBaud)
+            finally : self.loop.add_reader (self.port.fd, self.OnRx)
+            if not Found : return False
+        Resp = await self.command (self.conf.scvcmd, SCmd)
+        if self.conf.scvrsp not in Resp : return False
+        if self.conf.echoff :
+            Steps = self.EchoOffSteps ()
+            Cmd = next (Steps)
+            try :
+                while 1 : Cmd = Steps.send (await self.command (Cmd))
+            except StopIteration : pass
+        # URCs arriving while port is idle are routed by OnRx, no thread
+        self.RouteUrcs ()
+        return True
+    # Stop receiving, close serial port, log and capture files
+    # Usage  : close ()
+    # Return : None
+    def close (self) :
+        if self.loop and self.port and self.port.is_open :
+            self.loop.remove_reader (self.port.fd)
+        if self.rxwait and not self.rxwait.done () : self.rxwait.cancel ()
+        SercomSession.close (self)
+    # Event loop callback: serial port fd is readable
+    def OnRx (self) :
+        try :
+            if self.rxwait is None : self.IdleRx (); return
+            # Keep at least a block of free space in rx buffer before reading
+            BlkSz = self.conf.rxblks
+            if len (self.rxbuf) - self.nrx < BlkSz :
+                self.rxbuf.extend (bytearray (max (len (self.rxbuf), BlkSz)))
+            nBytes = RecvSerialData (self.port, \
+                    memoryview (self.rxbuf)[self.nrx:])
+        except (serial.SerialException, OSError) as e :
+            # Port is gone, stop polling it and fail whoever uses it next
+            self.loop.remove_reader (self.port.fd)
+            if self.rxwait is None :
+                self.rxerror = e
+                self.slogprint ("Serial port gone - " + str (e))
+            elif not self.rxwait.done () : self.rxwait.set_exception (e)
+            return
+        if nBytes == 0 : return
+        if self.nrx == 0 : self.firstrx = MonoTime ()
+        self.nrx += nBytes
+        # Only the new chunk (plus sentry tail overlap) is scanned here
+        Sentry = self.sentries.scan (self.rxbuf, self.nrx)
+        if Sentry and not self.rxwait.done () :
+            self.rxwait.set_result (Sentry)
+            # Anything after this chunk is no longer part of the response
+            self.rxwait = None
+    # Receive data while no command is in flight and route the URCs in it
+    # (asyncio counterpart of UrcRxLoop)
+    def IdleRx (self) :
+        nBytes = RecvSerialData (self.port, memoryview (self.idlebuf))
+        if nBytes == 0 : return
+        Data = self.idledecoder.decode (bytes (self.idlebuf[:nBytes]))
+        # Anything that's not a URC is shown/logged as is
+        for line in self.urcs.feed (Data) :
+            self.logio ("UI", line)
+            self.write (line)
+        self.flush ()
+        self.WakeUrcWaiters ()
+    # Resolve scom_waiturc's whose URC has been routed
+    def WakeUrcWaiters (self) :
+        for Prefix, Seen, Fut in self.urcwaiters :
+            if Fut.done () : continue
+            for Seq, Line in self.urcs.recent :
+                if Seq > Seen and Line.startswith (Prefix) :
+                    Fut.set_result ((Seq, Line)); break
+    # Recv full response before 'RespTout' seconds
+    # Usage  : await recv (RespTout)
+    # Return : Same as SercomSession.recv
+    async def recv (self, RespTout) :
+        if self.rxerror : raise self.rxerror
+        self.nrx = 0
+        self.firstrx = None
+        self.sentries.reset ()
+        self.rxwait = self.loop.create_future ()
+        try :
+            Sentry = await asyncio.wait_for (self.rxwait, RespTout)
+            RxTimedOut = False
+        except asyncio.TimeoutError : Sentry = None; RxTimedOut = True
+        finally : self.rxwait = None
+        # Decode the response just once, now that it's complete
+        Resp = self.rxdecoder.decode (memoryview (self.rxbuf)[:self.nrx])
+        return RxTimedOut, Resp, Sentry, self.firstrx, self.nrx
+    # Handle a Command-Response session; returns once a sentry matches or
+    # the command times-out
+    # Usage  : await command (Cmd, CmdSrc, Tout)
+    #          Cmd        - Command string
+    #          CmdSrc     - refer cmd_src_types, default SCmd
+    #          Tout       - response timeout, None for the configured one
+    # Return : String buffer containing Serial data received
+    async def command (self, Cmd, CmdSrc=SCmd, Tout=None) :
+        async with self.cmdlock :
+            _cmd, Cmd, RespTout = self.CmdBegin (Cmd, CmdSrc, Tout)
+            TxTime = MonoTime ()
+            ret = SendSerialData (self.port, Cmd)
+            if ret < 0 :
+                self.slogprint ("Serial Write Timeout")
+                self.timedout = True; self.iterfail = True
+                return ''
+            Rx = await self.recv (RespTout)
+        Resp = self.CmdEnd (_cmd, CmdSrc, RespTout, TxTime, ret, Rx)
+        # URCs filtered out of the response may be waited for
+        self.WakeUrcWaiters ()
+        return Resp
+    # Wait for a URC from scom
+    # Usage  : await WaitForUrc (Tout, Pat)
+    #          Tout - max time in seconds to wait
+    #          Pat  - URC line prefix to wait for
+    # Return : URC line, None if timed-out
+    async def WaitForUrc (self, Tout, Pat) :
+        # URC must be routed for us to see it
+        if not self.urcs.match (Pat) : self.urcs.register (Pat, self.ShowUrc)
+        # URCs routed since the last command was sent match too (refer
+        # SercomSession.urcseq)
+        Waiter = [Pat.strip (), self.urcseq, self.loop.create_future ()]
+        self.urcwaiters.append (Waiter)
+        self.WakeUrcWaiters ()
+        try :
+            Seq, Urc = await asyncio.wait_for (Waiter[2], Tout)
+            self.urcseq = Seq
+        except asyncio.TimeoutError : Urc = None
+        finally : self.urcwaiters.remove (Waiter)
+        if Urc is None : self.slogprint ("'" + Pat + "' URC not received in " \
+                + str (Tout) + " seconds")
+        return Urc
+    # Send a file over the serial port (refer SercomSession.sendfile), in
+    # a worker thread as it blocks. Failure is reported, not raised
+    # Usage  : await AioSendFile (Path, Proto)
+    # Return : (bytes sent, seconds), None on failure
+    async def AioSendFile (self, Path, Proto="raw") :
+        async with self.cmdlock :
+            # XMODEM/YMODEM acknowledgements are read by the transfer itself
+            self.loop.remove_reader (self.port.fd)
+            try : return await self.loop.run_in_executor (None, \
+                    self.sendfile, Path, Proto)
+            except XferError : return None
+            finally : self.loop.add_reader (self.port.fd, self.OnRx)
+    # Manual mode reads stdin, not available here
+    def manual (self) :
+        raise SessionError ("Manual mode not available in asyncio sessions")
+    # Run compiled scom instructions (refer sercomlib/scomc.py)
+    # Usage  : await RunScomInstrs (Instrs, ScomPath)
+    # Return : Same as SercomSession.RunScomInstrs
+    async def RunScomInstrs (self, Instrs, ScomPath) :
+        for Instr in Instrs :
+            Op = Instr[0]
+            if Op == SOP_CMD : Resp = await self.command (Instr[1], SCmd)
+            elif Op == SOP_SLEEP : await asyncio.sleep (Instr[1])
+            elif Op == SOP_WAITURC : await self.WaitForUrc (Instr[1], Instr[2])
+            elif Op == SOP_LOOP :
+                if await self.RunScomLoop (Instr, ScomPath) : return True
+            elif Op == SOP_SCOM :
+                self.slogprint ("Switching to child scom: " + Instr[1])
+                await self.RunScomFile (Instr)
+                self.slogprint ("Continuing mother scom: " + ScomPath)
+            elif Op == SOP_BREAK : return True
+            elif Op == SOP_ENMAN :
+                self.slogprint ("Manual mode not available, " + \
+                        "ignoring scom_enman")
+            elif Op == SOP_TIMEOUT :
+                if Instr[2] : self.cmdtouts[Instr[2].upper ()] = Instr[1]
+                else : self.rsptout = Instr[1]
+            elif Op == SOP_SENDFILE :
+                await self.AioSendFile (Instr[1], Instr[2])
+            elif Op == SOP_EXPECT :
+                raise SessionError ("Need to update!")
+        return False
+    # Run a scom loop (refer SercomSession.RunScomLoop)
+    # Usage  : await RunScomLoop (Instr, ScomPath)
+    # Return : True if scom_break was hit, else False
+    async def RunScomLoop (self, Instr, ScomPath) :
+        # If no iteration count specified (-1), loop indefinitely
+        Iters = Instr[1]
+        Sched = LoopSchedule (Instr[3]) if Instr[3] or self.soak else None
+        try :
+            while Iters :
+                Iter = self.IterBegin (Sched)
+                try : Break = await self.RunScomInstrs (Instr[2], ScomPath)
+                finally : Wait = self.IterEnd (Instr[4], Sched, Iter)
+                if Break : return True
+                Iters -= 1
+                if Iters and Wait : await asyncio.sleep (Wait)
+        finally :
+            if Sched : self.LoopReport (Instr[4], Sched)
+        return False
+    # Run a compiled scom file
+    # Usage  : await RunScomFile (Prog)
+    # Return : None
+    async def RunScomFile (self, Prog) :
+        if await self.RunScomInstrs (Prog[2], Prog[1]) : reason = "scom_break"
+        else : reason = "EOF"
+        self.slogprint (reason + " on " + os.path.basename (Prog[1]))
+    # Run compiled scom files sequentially
+    # Usage  : await RunScomStack (ScomStack)
+    # Return : None
+    async def RunScomStack (self, ScomStack) :
+        while ScomStack != [] :
+            await self.RunScomFile (ScomStack.pop ())
+            if ScomStack != [] : self.slogprint ("Continuing mother scom: " + \
+                    ScomStack[-1][1])
+        self.slogprint ("Exiting scom mode")
+#}
@@ -0,0 +1,75 @@
+# Serial baud rate detection and negotiation helpers
+#
+# With autobd (refer sample.conf) a session finds the rate the modem is at by
+# probing scvcmd/scvrsp across SerBauds, and optionally (autobd=F) switches
+# the modem and port to the highest rate that passes a stress check, stepping
+# down on failure (refer SercomSession.AutoBaud). The result is cached per
+# device, so that the next run probes the known rate first and doesn't
+# renegotiate a rate already found to be the best.
+
+import os
+import json
+import tempfile
+from sercomlib.portconf import SerBauds
+from sercomlib.scomc import ScomCacheDir
+
+# scvcmd/scvrsp sessions a new rate must pass in a row
+BaudChecks = 20
+# Seconds a probe waits for scvrsp, on top of its transmission time
+BaudProbeTout = 0.3
+# Seconds given to the modem to switch rate after acknowledging it
+BaudSwitchDelay = 0.1
+
+# Baud rate cache file, in the compiled scom cache directory
+BaudCacheFile = os.path.join (ScomCacheDir, "bauds.json")
+
+# Function to get the order baud rates are probed in
+# Usage  : BaudProbeOrder (first)
+#          first - rates to probe first (e.g. cached and configured), None
+#                  entries are skipped
+# Return : list of rates, first ones and then rest of SerBauds, fastest first
+def BaudProbeOrder (first) :
+    order = []
+    for baud in list (first) + sorted (SerBauds, reverse=True) :
+        if baud and baud not in order : order.append (baud)
+    return order
+
+# Function to get time a probe of a baud rate may take
+# Usage  : BaudProbeTime (baud, nbytes)
+#          nbytes - bytes of command and its response
+# Return : seconds
+def BaudProbeTime (baud, nbytes) :
+    return BaudProbeTout + nbytes * 10.0 / baud
+
+# Function to read the cached baud rates of a device
+# Usage  : LoadBaudCache (portid)
+# Return : {"baud": rate modem was last found at, "best": highest rate it
+#          passed the stress check at (if negotiated)}, {} if not cached
+def LoadBaudCache (portid) :
+    try :
+        fh = open (BaudCacheFile, "r")
+        try : entry = json.load (fh).get (portid)
+        finally : fh.close ()
+    except (IOError, OSError, ValueError, AttributeError) : return {}
+    return entry if isinstance (entry, dict) else {}
+
+# Function to cache baud rates of a device (refer LoadBaudCache)
+# Usage  : SaveBaudCache (portid, entry)
+# Return : None, cache is best effort and failures are ignored
+def SaveBaudCache (portid, entry) :
+    try :
+        try :
+            fh = open (BaudCacheFile, "r")
+            try : cache = json.load (fh)
+            finally : fh.close ()
+            if not isinstance (cache, dict) : cache = {}
+        except (IOError, OSError, ValueError) : cache = {}
+        cache[portid] = entry
+        if not os.path.isdir (ScomCacheDir) : os.makedirs (ScomCacheDir)
+        fd, tmp = tempfile.mkstemp (dir=ScomCacheDir)
+        fh = os.fdopen (fd, "w")
+        json.dump (cache, fh)
+        fh.close ()
+        # A concurrent reader never sees half of it
+        getattr (os, "replace", os.rename) (tmp, BaudCacheFile)
+    except (IOError, OSError) : pass
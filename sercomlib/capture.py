@@ -0,0 +1,242 @@
+# Compact indexed binary capture of a sercom session
+#
+# Capture file (.scap) - header followed by length-prefixed records:
+#   header : magic 'SCAP', version, header size, wall-clock ns and
+#            monotonic ns at capture start (to convert record timestamps)
+#   record : payload length (u32), monotonic timestamp ns (u64),
+#            source (A|M|U|S), direction (O|I|M), sentry (u8), payload
+#            source    - (A)uto/scom, (M)anual, (U)nsolicited, (S)ercom msg
+#            direction - (O)ut to modem, (I)n from modem, (M)essage
+#            sentry    - index of sentry ending a response, 254 for a
+#                        timed-out response, 255 if none (e.g. a URC, or
+#                        a streamed piece before the end of a response)
+# Index file (.scap.idx) - header followed by one fixed size entry per
+# record: record offset, timestamp, crc32 of the command the record belongs
+# to, source, direction and sentry. Queries by command, time range or
+# sentry run on the index alone and only touch the payloads they return.
+# Records can be held back in memory and later written or dropped as a whole
+# (hold/release), e.g. to keep only failing iterations of a soak test.
+
+import os
+import time
+import mmap
+import zlib
+import struct
+import threading
+import collections
+
+CapMagic = b"SCAP"
+CapIdxMagic = b"SCPI"
+CapVersion = 2
+CapHdr = struct.Struct ("<4sHHQQ")
+CapRecHdr = struct.Struct ("<IQccB")
+CapIdxHdr = struct.Struct ("<4sHH")
+CapIdxEntry = struct.Struct ("<QQIccB")
+# Sentry value of timed-out responses (version 1 captures have
+# CapNoSentry instead), and of records which are not ended by any sentry
+CapTimedOut = 254
+CapNoSentry = 255
+# Max payload bytes held back (refer CaptureWriter.hold), oldest records
+# are dropped beyond it
+CapHoldMax = 4 * 1024 * 1024
+
+# Monotonic clock in nanoseconds (monotonic_ns is there from python 3.7)
+if hasattr (time, "monotonic_ns") : CapMonoNs = time.monotonic_ns
+elif hasattr (time, "monotonic") :
+    CapMonoNs = lambda : int (time.monotonic () * 1e9)
+else : CapMonoNs = lambda : int (time.time () * 1e9)
+
+# Function to get key of a command to index its records with
+# Usage  : CapCmdKey (cmd)
+#          cmd - command string (line endings are ignored)
+# Return : crc32 of the command
+def CapCmdKey (cmd) :
+    if not cmd : return 0
+    return zlib.crc32 (cmd.strip ("\r\n").encode ("utf-8")) & 0xffffffff
+
+class CaptureWriter : #{
+    """ Writer of binary capture file and its sidecar index """
+    # Capture file name, index file name is this + '.idx'
+    filename = ""
+    # Create capture and index files on class instantiation
+    def __init__ (self, filename) :
+        self.filename = filename
+        self.lock = threading.Lock ()
+        self.fh = open (filename, "wb")
+        self.ih = open (filename + ".idx", "wb")
+        self.monobase = CapMonoNs ()
+        self.wallbase = int (time.time () * 1e9)
+        self.fh.write (CapHdr.pack (CapMagic, CapVersion, CapHdr.size, \
+                self.wallbase, self.monobase))
+        self.ih.write (CapIdxHdr.pack (CapIdxMagic, CapVersion, 0))
+        self.offset = CapHdr.size
+        # Records held back, None while records are written as they come
+        self.held = None
+        self.heldbytes = 0
+        # Held records dropped, by release() or as they didn't fit
+        self.dropped = 0
+    # Append a record
+    # Usage  : write (src, dir, data, cmd, sentry)
+    #          src    - 'A', 'M', 'U' or 'S' (refer file header above)
+    #          dir    - 'O', 'I' or 'M' (refer file header above)
+    #          data   - payload string/bytes
+    #          cmd    - command the record belongs to ('' if none)
+    #          sentry - sentry index ending the response, CapTimedOut if
+    #                   it timed-out, None if none
+    # Return : None
+    def write (self, src, dir, data, cmd="", sentry=None) :
+        ts = CapMonoNs ()
+        if not isinstance (data, bytes) : data = data.encode ("utf-8")
+        if sentry is None : sentry = CapNoSentry
+        src = src.encode ("ascii"); dir = dir.encode ("ascii")
+        key = CapCmdKey (cmd)
+        self.lock.acquire ()
+        try :
+            if self.held is None : self.append (ts, src, dir, sentry, key, data)
+            else :
+                self.held.append ((ts, src, dir, sentry, key, data))
+                self.heldbytes += len (data)
+                while self.heldbytes > CapHoldMax and len (self.held) > 1 :
+                    self.heldbytes -= len (self.held.popleft ()[5])
+                    self.dropped += 1
+        finally : self.lock.release ()
+    # Write a record to capture and index files (lock held by caller)
+    def append (self, ts, src, dir, sentry, key, data) :
+        self.fh.write (CapRecHdr.pack (len (data), ts, src, dir, sentry))
+        self.fh.write (data)
+        self.ih.write (CapIdxEntry.pack (self.offset, ts, key, src, dir, \
+                sentry))
+        self.offset += CapRecHdr.size + len (data)
+    # Hold back records written from now on, till release()
+    # Usage  : hold ()
+    # Return : None
+    def hold (self) :
+        self.lock.acquire ()
+        if self.held is None : self.held = collections.deque ()
+        self.lock.release ()
+    # Write or drop the records held back and write records as they come
+    # again
+    # Usage  : release (keep)
+    #          keep - True to write held records, False to drop them
+    # Return : None
+    def release (self, keep) :
+        self.lock.acquire ()
+        try :
+            held = self.held or ()
+            self.held = None
+            self.heldbytes = 0
+            if not keep : self.dropped += len (held); return
+            for rec in held : self.append (*rec)
+        finally : self.lock.release ()
+    # Flush and close capture and index files
+    # Usage  : close ()
+    # Return : None
+    def close (self) :
+        # Whatever is still held back is kept
+        self.release (True)
+        self.lock.acquire ()
+        if not self.fh.closed : self.fh.close (); self.ih.close ()
+        self.lock.release ()
+#}
+
+class CaptureRecord : #{
+    """ A record read from a capture file """
+    def __init__ (self, ts, wallns, src, dir, sentry, data) :
+        # monotonic ns since capture start
+        self.ts = ts
+        # wall-clock ns since epoch
+        self.wallns = wallns
+        self.src = src
+        self.dir = dir
+        self.sentry = sentry
+        self.data = data
+#}
+
+class CaptureReader : #{
+    """ mmap based reader/query engine of a capture file and its index """
+    # Map capture and index files on class instantiation
+    def __init__ (self, filename) :
+        self.filename = filename
+        self.fh = open (filename, "rb")
+        self.cap = CaptureReader.Map (self.fh)
+        if self.cap is None or len (self.cap) < CapHdr.size :
+            raise ValueError ("Not a capture file - " + filename)
+        magic, ver, hdrsz, self.wallbase, self.monobase = \
+                CapHdr.unpack_from (self.cap, 0)
+        if magic != CapMagic or ver not in (1, CapVersion) :
+            raise ValueError ("Not a capture file - " + filename)
+        self.version = ver
+        self.ih = open (filename + ".idx", "rb")
+        self.idx = CaptureReader.Map (self.ih)
+        # Index entries fully written (writer may have been killed)
+        self.count = 0
+        if self.idx is not None :
+            self.count = (len (self.idx) - CapIdxHdr.size) // CapIdxEntry.size
+    # mmap a whole file read-only, None if it's empty
+    @staticmethod
+    def Map (fh) :
+        if os.fstat (fh.fileno ()).st_size == 0 : return None
+        return mmap.mmap (fh.fileno (), 0, access=mmap.ACCESS_READ)
+    # Get index entry i as (offset, ts, key, src, dir, sentry)
+    def entry (self, i) :
+        return CapIdxEntry.unpack_from (self.idx, \
+                CapIdxHdr.size + i * CapIdxEntry.size)
+    # Find first index entry with timestamp >= ts (binary search on index)
+    def bisect (self, ts) :
+        lo, hi = 0, self.count
+        while lo < hi :
+            mid = (lo + hi) // 2
+            if self.entry (mid)[1] < ts : lo = mid + 1
+            else : hi = mid
+        return lo
+    # Read the record at offset in capture file
+    def record (self, offset) :
+        n, ts, src, dir, sentry = CapRecHdr.unpack_from (self.cap, offset)
+        start = offset + CapRecHdr.size
+        data = self.cap[start:start + n].decode ("utf-8", "replace")
+        return CaptureRecord (ts - self.monobase, \
+                self.wallbase + ts - self.monobase, src.decode ("ascii"), \
+                dir.decode ("ascii"), sentry, data)
+    # Query records
+    # Usage  : query (cmd, start, end, sentry, srcs)
+    #          cmd    - only records (sent or received) of this command
+    #          start  - only records at/after start seconds from capture start
+    #          end    - only records before end seconds from capture start
+    #          sentry - only responses ended by this sentry index
+    #                   (CapTimedOut for timed-out responses)
+    #          srcs   - only records with source in this string e.g. "AM"
+    #          None for any of above means no filtering on it
+    # Return : generator of matching CaptureRecords in capture order
+    def query (self, cmd=None, start=None, end=None, sentry=None, srcs=None) :
+        first = 0
+        last = self.count
+        if start is not None : first = self.bisect (self.monobase + \
+                int (start * 1e9))
+        if end is not None : last = self.bisect (self.monobase + \
+                int (end * 1e9))
+        key = CapCmdKey (cmd) if cmd is not None else None
+        if sentry == CapTimedOut and self.version == 1 : sentry = CapNoSentry
+        for i in range (first, last) :
+            offset, ts, k, src, dir, snt = self.entry (i)
+            # Capture file cut short (e.g. writer killed), no more records
+            if offset + CapRecHdr.size > len (self.cap) : break
+            if key is not None and k != key : continue
+            if sentry is not None and (dir != b"I" or snt != sentry) : continue
+            if srcs is not None and src.decode ("ascii") not in srcs : continue
+            yield self.record (offset)
+    # Close capture and index files
+    def close (self) :
+        self.cap.close (); self.fh.close ()
+        if self.idx is not None : self.idx.close ()
+        self.ih.close ()
+#}
+
+# Function to format a capture record as a sercom text log line
+# Usage  : CapFormatText (rec)
+#          rec - CaptureRecord
+# Return : log line (refer -l option of sercom.py)
+def CapFormatText (rec) :
+    stamp = time.strftime ("%b %d %H:%M:%S", time.localtime (rec.wallns // \
+            1000000000))
+    if rec.dir == "M" : return stamp + " " + rec.data + "\n"
+    return stamp + " [" + rec.src + rec.dir + "] " + repr (rec.data) + "\n"
@@ -0,0 +1,308 @@
+# Resident sercom daemon
+#
+# Keeps a set of serial ports open and validated (scvcmd/scvrsp) and runs
+# jobs on them submitted over a local Unix socket, so that short scoms and
+# single commands don't pay for port open, .conf parsing and validation
+# every time (refer sercomd.py).
+# Jobs of a port run one at a time in its worker thread, in the order they
+# were submitted; different ports run in parallel.
+#
+# Protocol: one JSON object per line (utf-8) in both directions.
+#   Request  - {"op": "scom", "port": <name>, "scom": <path>,
+#               "cwd": <client's directory, child scoms and files sent are
+#                       found relative to it>}
+#              {"op": "cmd", "port": <name>, "cmd": <command>,
+#               "tout": <secs, optional>}
+#              {"op": "ports"}
+#   Replies  - {"out": <text>} for every piece of console output of the job
+#              as it's produced, then one
+#              {"done": true, "ok": <bool>, "reason": <text>, "commands": n,
+#               "timeouts": n, "seconds": s[, "resp": <cmd response>]}
+#              or, for "ports", {"done": true, "ok": true, "ports": [...]}
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from sercomlib.scomc import CompileScom, ScomError
+from sercomlib.portconf import PortConfig, PortConfError
+from sercomlib.session import Session, SessionError, CommandTimeout
+
+if sys.version_info[0] == 2 :
+    import Queue as queue
+    import SocketServer as socketserver
+else :
+    import queue
+    import socketserver
+
+# Default daemon socket path
+DaemonSockPath = os.path.join ("/tmp", "sercomd-" + \
+        str (getattr (os, "getuid", lambda : 0) ()) + ".sock")
+
+class DaemonError (Exception) :
+    """ Daemon request failed, message tells the cause """
+    pass
+
+# Function to read a daemon manifest
+# Usage  : ReadDaemonManifest (path)
+#          path - manifest file, one '<Device#> <SerConf> [Name]' per line
+# Return : list of (name, device, conf) tuples
+#          Raises DaemonError on a bad line or duplicate name
+def ReadDaemonManifest (path) :
+    ports = []
+    fh = open (path, "r")
+    for num, line in enumerate (fh) :
+        words = line.split ()
+        if not words or words[0][0] == '#' : continue
+        name = words[2] if len (words) == 3 else os.path.basename (words[0])
+        if len (words) not in (2, 3) or name in [p[0] for p in ports] :
+            fh.close ()
+            raise DaemonError (path + ":" + str (num + 1) + \
+                    ": Bad or duplicate manifest line - " + line.strip ())
+        ports.append ((name, words[0], words[1]))
+    fh.close ()
+    return ports
+
+class JobOutput : #{
+    """ Console output stream of a job, streamed to its client """
+    # Setup on class instantiation
+    # Usage  : JobOutput (wfile)
+    #          wfile - client connection's write file
+    def __init__ (self, wfile) :
+        self.wfile = wfile
+        # Client went away, output is dropped but the job runs to the end
+        self.gone = False
+    # Send a JSON message to the client
+    def send (self, msg) :
+        if self.gone : return
+        try :
+            self.wfile.write ((json.dumps (msg) + "\n").encode ("utf-8"))
+            self.wfile.flush ()
+        except (IOError, OSError, ValueError) : self.gone = True
+    # Stream interface used by the session (refer SercomSession.out)
+    def write (self, text) :
+        if text : self.send ({"out" : text})
+    def flush (self) :
+        pass
+#}
+
+class DaemonPort : #{
+    """ A port of the daemon with its session and job queue """
+    # Setup port on class instantiation, call start() to open it
+    # Usage  : DaemonPort (name, device, conffile, logdir)
+    #          logdir - directory for the session log, None for no log
+    def __init__ (self, name, device, conffile, logdir=None) :
+        self.name = name
+        self.device = device
+        self.conffile = conffile
+        self.logdir = logdir
+        self.session = None
+        # "down" till opened and validated, then "idle" or "busy"
+        self.state = "down"
+        self.reason = "not opened yet"
+        self.jobs = queue.Queue ()
+        self.njobs = 0
+        self.thread = None
+    # (Re-)open and validate the port if it's down
+    # Usage  : ensure ()
+    # Return : True if port is up
+    def ensure (self) :
+        if self.session : return True
+        logfile = None
+        if self.logdir :
+            logfile = os.path.join (self.logdir, self.name + "_sercom.log")
+        try :
+            sess = Session (self.device, PortConfig (self.conffile), \
+                    logfile=logfile)
+            try : sess.open ()
+            except SessionError : sess.close (); raise
+        except (PortConfError, SessionError) as e :
+            self.reason = str (e).split ("\n")[0]
+            return False
+        self.session = sess
+        self.state = "idle"
+        self.reason = ""
+        return True
+    # Start the worker thread, opening the port first
+    # Usage  : start ()
+    # Return : True if port is up (if not, it's retried on next job)
+    def start (self) :
+        up = self.ensure ()
+        self.thread = threading.Thread (target=self.WorkLoop)
+        self.thread.daemon = True
+        self.thread.start ()
+        return up
+    # Stop the worker thread and close the port
+    def stop (self) :
+        self.jobs.put (None)
+        if self.thread : self.thread.join ()
+        if self.session : self.session.close ()
+        self.session = None
+        self.state = "down"
+    # Queue a job, its result is set in job["result"] and job["event"] set
+    # when it's done
+    def submit (self, job) :
+        job["event"] = threading.Event ()
+        self.jobs.put (job)
+    # Thread: run queued jobs one by one
+    def WorkLoop (self) :
+        while 1 :
+            job = self.jobs.get ()
+            if job is None : return
+            job["result"] = self.RunJob (job)
+            job["event"].set ()
+    # Run a job on the port
+    # Usage  : RunJob (job)
+    #          job - request dict plus "output" (JobOutput)
+    # Return : result dict (refer "done" message in file header)
+    def RunJob (self, job) :
+        res = {"done" : True, "ok" : False, "reason" : "", "commands" : 0, \
+                "timeouts" : 0}
+        start = time.time ()
+        if not self.ensure () :
+            res["reason"] = "port " + self.name + " is down: " + self.reason
+            return res
+        sess = self.session
+        before = [(st.count, st.timeouts) for st in sess.stats.cmds.values ()]
+        self.state = "busy"
+        sess.out = job["output"]
+        try :
+            if job["op"] == "scom" :
+                # Not chdir'ed to, other ports' jobs run in parallel
+                sess.run_scom (CompileScom (job["scom"], cwd=job.get ("cwd")))
+            else :
+                res["resp"] = sess.send_command (job["cmd"], job.get ("tout"))
+            res["ok"] = True
+        except CommandTimeout as e :
+            res["reason"] = str (e)
+            res["resp"] = e.resp
+        except (ScomError, SessionError) as e :
+            res["reason"] = str (e).split ("\n")[0]
+        except Exception as e :
+            # e.g. port unplugged, reopen it on next job
+            res["reason"] = type (e).__name__ + ": " + str (e)
+            sess.close ()
+            self.session = None
+            self.state = "down"
+            self.reason = res["reason"]
+        sess.out = None
+        if self.session : self.state = "idle"
+        after = [(st.count, st.timeouts) for st in sess.stats.cmds.values ()]
+        res["commands"] = sum (c for c, t in after) - sum (c for c, t in before)
+        res["timeouts"] = sum (t for c, t in after) - sum (t for c, t in before)
+        if res["ok"] and res["timeouts"] :
+            res["ok"] = False
+            res["reason"] = str (res["timeouts"]) + " command(s) timed-out"
+        res["seconds"] = round (time.time () - start, 3)
+        self.njobs += 1
+        return res
+    # Port status as a dict
+    def status (self) :
+        return {"name" : self.name, "device" : self.device, \
+                "conf" : self.conffile, "state" : self.state, \
+                "reason" : self.reason, "jobs" : self.njobs, \
+                "queued" : self.jobs.qsize ()}
+#}
+
+class DaemonHandler (socketserver.StreamRequestHandler) : #{
+    """ Serves one client request of the daemon """
+    def handle (self) :
+        output = JobOutput (self.wfile)
+        try :
+            req = json.loads (self.rfile.readline ().decode ("utf-8"))
+            op = req.get ("op")
+            if op == "ports" :
+                output.send ({"done" : True, "ok" : True, "ports" : \
+                        [p.status () for p in self.server.ports]})
+                return
+            port = self.server.byname.get (req.get ("port"))
+            if port is None : raise DaemonError ("no such port - " + \
+                    str (req.get ("port")))
+            if op == "scom" and not req.get ("scom") or \
+                    op == "cmd" and not req.get ("cmd") or \
+                    op not in ("scom", "cmd") :
+                raise DaemonError ("bad request - " + json.dumps (req))
+        except (ValueError, AttributeError, DaemonError) as e :
+            output.send ({"done" : True, "ok" : False, "reason" : str (e)})
+            return
+        req["output"] = output
+        port.submit (req)
+        req["event"].wait ()
+        output.send (req["result"])
+#}
+
+class SercomDaemon (socketserver.ThreadingMixIn, \
+        socketserver.UnixStreamServer) : #{
+    """ Unix socket server running jobs on resident sercom ports """
+    daemon_threads = True
+    # Setup daemon on class instantiation, call start() to open the ports
+    # Usage  : SercomDaemon (ports, sockpath, logdir)
+    #          ports    - list of (name, device, conf) (refer
+    #                     ReadDaemonManifest)
+    #          sockpath - Unix socket path
+    #          logdir   - directory for per-port session logs, None for none
+    def __init__ (self, ports, sockpath=DaemonSockPath, logdir=None) :
+        self.ports = [DaemonPort (n, d, c, logdir) for n, d, c in ports]
+        self.byname = dict ((p.name, p) for p in self.ports)
+        self.sockpath = sockpath
+        # A stale socket of a dead daemon is in the way, a live one isn't
+        if os.path.exists (sockpath) :
+            try : DaemonRequest ({"op" : "ports"}, sockpath)
+            except DaemonError : os.unlink (sockpath)
+            else : raise DaemonError ("daemon already running on " + sockpath)
+        # Only our user may submit jobs; the socket is created owner-only,
+        # so that nobody can connect before it's chmod'ed
+        umask = os.umask (0o077)
+        try :
+            socketserver.UnixStreamServer.__init__ (self, sockpath, \
+                    DaemonHandler)
+        finally : os.umask (umask)
+        os.chmod (sockpath, 0o600)
+    # Open and validate all ports
+    # Usage  : start ()
+    # Return : list of port status dicts
+    def start (self) :
+        for p in self.ports : p.start ()
+        return [p.status () for p in self.ports]
+    # Stop serving, close all ports and remove the socket
+    def stop (self) :
+        self.server_close ()
+        for p in self.ports : p.stop ()
+        if os.path.exists (self.sockpath) : os.unlink (self.sockpath)
+#}
+
+# Function to send a request to the daemon and get its replies as they come
+# Usage  : DaemonRequest (req, sockpath)
+#          req      - request dict (refer file header)
+#          sockpath - daemon's Unix socket path
+# Return : For "ports", the "done" reply. Otherwise a generator of replies
+#          ending with the "done" reply.
+#          Raises DaemonError if daemon isn't reachable
+def DaemonRequest (req, sockpath=DaemonSockPath) :
+    sock = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+    try :
+        sock.connect (sockpath)
+        sock.sendall ((json.dumps (req) + "\n").encode ("utf-8"))
+    except (IOError, OSError) as e :
+        sock.close ()
+        raise DaemonError ("sercom daemon not reachable on " + sockpath + \
+                ": " + str (e))
+    replies = DaemonReplies (sock)
+    if req.get ("op") == "ports" : return list (replies)[-1]
+    return replies
+
+# Generator of daemon replies on a connection (refer DaemonRequest)
+def DaemonReplies (sock) :
+    fh = sock.makefile ("rb")
+    try :
+        for line in fh :
+            msg = json.loads (line.decode ("utf-8"))
+            yield msg
+            if msg.get ("done") : return
+        yield {"done" : True, "ok" : False, "reason" : \
+                "daemon closed connection"}
+    finally :
+        fh.close ()
+        sock.close ()
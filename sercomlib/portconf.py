@@ -0,0 +1,215 @@
+# Serial port configuration (.conf) parser
+#
+# Refer -c option of sercom.py and sample.conf for the syntax. A .conf is
+# parsed into a PortConfig, one per serial port, so that many ports (refer
+# scomfleet.py) can each have their own configuration.
+
+import os
+
+# Baud rates allowed for baudrt
+SerBauds = [110, 300, 600, 1200, 2400, 4800, 9600, 14400, 19200, 38400, \
+        57600, 115200, 230400, 460800, 921600]
+
+class PortConfError (Exception) :
+    """ Port configuration error, message tells the cause """
+    pass
+
+# Function to correct str with Esc-sequences \\r & \\n as \r & \n
+# Usage  : RecodeEscSeq (s)
+# Return : Updated string with correct escape sequence characters
+def RecodeEscSeq (s) :
+    s = s.replace ("\\r","\r")
+    s = s.replace ("\\n","\n")
+    return s
+
+class PortConfig : #{
+    """ Serial port configuration of a sercom session """
+    # Configuration file name, "undefined" if none
+    filename = "undefined"
+    # Name of the first bad parameter in file, "none" if all are fine.
+    # If any, serial parameters (bytesz .. adtout) keep their defaults
+    bad = "none"
+    # Setup default configuration on class instantiation, optionally
+    # updated from a .conf file
+    # Usage  : PortConfig (filename)
+    #          Raises PortConfError if file is not found/invalid
+    def __init__ (self, filename=None) :
+        self.scvcmd = "undefined"
+        self.scvrsp = "undefined"
+        # Command disabling target's echo, None to leave echo on
+        self.echoff = None
+        self.sentries = []
+        self.sentrx = []
+        self.urcpats = []
+        self.baud = 115200
+        # Baud rate detection - None (use baud), 'D' (detect modem's rate) or
+        # 'F' (detect, then switch to the fastest working rate upto bdrmax
+        # with bdrcmd followed by the rate)
+        self.autobd = None
+        self.bdrcmd = "AT+IPR="
+        self.bdrmax = SerBauds[-1]
+        self.bytesz = 8
+        self.parity = 'N'
+        self.stpbit = 1
+        self.rdtout = 0.01
+        self.flowct = None
+        self.wrtout = 0.01
+        self.rxblks = 4096
+        self.rstout = 20.0
+        # {COMMAND-PREFIX: secs}
+        self.cmtouts = {}
+        self.adtout = 0
+        if filename is not None : self.load (filename)
+    # Parse a .conf file into this configuration
+    # Usage  : load (filename)
+    # Return : None, check self.bad for a bad parameter
+    def load (self, filename) :
+        if not os.path.isfile (filename) or filename[-5:] != ".conf" :
+            raise PortConfError ("PortConfig file not found or invalid - " \
+                    + filename)
+        self.filename = filename
+        PortCfgFH = open (filename, 'r')
+        BadSerParams = "none"
+        _bytesz = self.bytesz
+        _parity = self.parity
+        _stpbit = self.stpbit
+        _rdtout = self.rdtout
+        _flowct = self.flowct
+        _wrtout = self.wrtout
+        _rxblks = self.rxblks
+        _rstout = self.rstout
+        _cmtout = {}
+        _adtout = self.adtout
+        while 1 :
+            Cfg = PortCfgFH.readline ()
+            if not Cfg : break
+            if Cfg[0] == '#' or Cfg[0] == '\n': continue
+            # Remove newline character in Cmd read
+            Cfg = Cfg[:-1]
+            # Remove all spaces in line only for those not needing spaced
+            # strings; sentry strings may have spaces, we shouldn't remove them
+            if Cfg[0:6] == "sentry" :
+                if Cfg[6] != "=" : BadSerParams = "sentry"; break
+                self.sentries.append (RecodeEscSeq (Cfg[7:]))
+                continue
+            # Regex sentries are taken as is, regex itself understands \r & \n
+            if Cfg[0:6] == "sentrx" :
+                if Cfg[6] != "=" or not Cfg[7:] : BadSerParams = "sentrx"; break
+                self.sentrx.append (Cfg[7:])
+                continue
+            # cmtout command prefix may have spaces too
+            if Cfg[0:6] == "cmtout" :
+                Args = Cfg[7:].split (None, 1)
+                try : f = float (Args[0]); Prefix = Args[1].strip ()
+                except (ValueError, IndexError) :
+                    BadSerParams = "cmtout"; break
+                if Cfg[6] != "=" or f <= 0 or not Prefix :
+                    BadSerParams = "cmtout"; break
+                _cmtout[Prefix.upper ()] = f
+                continue
+            # Echo-off command may have spaces too (e.g. stty -echo)
+            if Cfg[0:6] == "echoff" :
+                if Cfg[6] != "=" or not Cfg[7:].strip () :
+                    BadSerParams = "echoff"; break
+                self.echoff = Cfg[7:].strip ()
+                continue
+            if Cfg[0:6] == "urcpat" :
+                if Cfg[6] != "=" or not Cfg[7:].strip () :
+                    BadSerParams = "urcpat"; break
+                self.urcpats.append (Cfg[7:].strip ())
+                continue
+            Cfg = Cfg.replace (" ", "")
+            if Cfg[0:6] == "scvcmd" :
+                if Cfg[6] != "=" : BadSerParams = "scvcmd"; break
+                self.scvcmd = Cfg[7:]
+            elif Cfg[0:6] == "scvrsp" :
+                if Cfg[6] != "=" : BadSerParams = "scvrsp"; break
+                self.scvrsp = Cfg[7:]
+            elif Cfg[0:6] == "baudrt" :
+                if Cfg[6] != "=" or int (Cfg[7:]) not in SerBauds :
+                    BadSerParams = "baudrt"; break
+                self.baud = int (Cfg[7:])
+            elif Cfg[0:6] == "autobd" :
+                if Cfg[6] != "=" or Cfg[7:] not in ["N", "D", "F"] :
+                    BadSerParams = "autobd"; break
+                self.autobd = Cfg[7] if Cfg[7] != "N" else None
+            elif Cfg[0:6] == "bdrcmd" :
+                if Cfg[6] != "=" or not Cfg[7:] : BadSerParams = "bdrcmd"; break
+                self.bdrcmd = Cfg[7:]
+            elif Cfg[0:6] == "bdrmax" :
+                try : n = int (Cfg[7:])
+                except ValueError : n = 0
+                if Cfg[6] != "=" or n not in SerBauds :
+                    BadSerParams = "bdrmax"; break
+                self.bdrmax = n
+            elif Cfg[0:6] == "bytesz" :
+                if Cfg[6] != "=" or (int (Cfg[7:]) not in [5, 6, 7, 8]) :
+                    BadSerParams = "bytesz"; break
+                _bytesz = int (Cfg[7:])
+            elif Cfg[0:6] == "parity" :
+                parr = ["N", "E", "O", "M", "S"]
+                if Cfg[6] != "=" or (not any (i in Cfg[7:] for i in parr)) :
+                    BadSerParams = "parity"; break
+                _parity = Cfg[7]
+            elif Cfg[0:6] == "stpbit" :
+                sarr = ["1", "1.5", "2"]
+                if Cfg[6] != "=" or (not any (i in Cfg[7:] for i in sarr)) :
+                    BadSerParams = "stpbit"; break
+                if Cfg[7:] == "1.5" : _stpbit = float (Cfg[7:])
+                else : _stpbit = int (Cfg[7:])
+            elif Cfg[0:6] == "rdtout" :
+                if Cfg[6] != "=" : BadSerParams = "rdtout"; break
+                try : f = float (Cfg[7:])
+                except ValueError : BadSerParams = "rdtout"; break
+                _rdtout = f
+            elif Cfg[0:6] == "flowct" :
+                farr = ["N", "X", "R", "D"]
+                if Cfg[6] != "=" or (not any (i in Cfg[7:] for i in farr)) :
+                    BadSerParams = "flowct"; break
+                _flowct = Cfg[7]
+            elif Cfg[0:6] == "wrtout" :
+                if Cfg[6] != "=" : BadSerParams = "wrtout"; break
+                try : f = float (Cfg[7:])
+                except ValueError : BadSerParams = "wrtout"; break
+                _wrtout = f
+            elif Cfg[0:6] == "rxblks" :
+                if Cfg[6] != "=" : BadSerParams = "rxblks"; break
+                try : n = int (Cfg[7:])
+                except ValueError : BadSerParams = "rxblks"; break
+                if n <= 0 : BadSerParams = "rxblks"; break
+                _rxblks = n
+            elif Cfg[0:6] == "rstout" :
+                if Cfg[6] != "=" : BadSerParams = "rstout"; break
+                try : f = float (Cfg[7:])
+                except ValueError : BadSerParams = "rstout"; break
+                if f <= 0 : BadSerParams = "rstout"; break
+                _rstout = f
+            elif Cfg[0:6] == "adtout" :
+                if Cfg[6] != "=" : BadSerParams = "adtout"; break
+                try : f = float (Cfg[7:])
+                except ValueError : BadSerParams = "adtout"; break
+                if f < 0 : BadSerParams = "adtout"; break
+                _adtout = f
+        PortCfgFH.close ()
+        self.bad = BadSerParams
+        if BadSerParams != "none" : return
+        # filename has valid parameters, update serial parameters
+        self.bytesz = _bytesz
+        self.parity = _parity
+        self.stpbit = _stpbit
+        self.rdtout = _rdtout
+        self.flowct = _flowct
+        self.wrtout = _wrtout
+        self.rxblks = _rxblks
+        self.rstout = _rstout
+        self.cmtouts = _cmtout
+        self.adtout = _adtout
+    # Check mandatory parameters are there
+    # Usage  : check ()
+    # Return : None, raises PortConfError if any is missing
+    def check (self) :
+        if self.scvcmd == "undefined" or self.scvrsp == "undefined" :
+            raise PortConfError ("Need proper SCV cmd & resp strings")
+        if self.sentries == [] and self.sentrx == [] :
+            raise PortConfError ("Need proper Sentry strings")
+#}
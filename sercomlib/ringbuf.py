@@ -0,0 +1,129 @@
+# Fixed capacity byte ring buffer
+#
+# Used by threaded serial rx loops (e.g. SerialRxLoop in wip/t.py) to hold
+# received data till a response is claimed from it. Memory is bounded by
+# the capacity given at instantiation and data is never moved around:
+# searches run on memoryviews of the backing bytearray and only the bytes
+# of a claimed response are ever copied out.
+#
+# Overflow policy: the rx side must never block on a slow consumer, so
+# when a write doesn't fit, the OLDEST data is dropped to make room and the
+# number of dropped bytes is accounted in 'dropped'.
+
+class RingBuffer : #{
+    """ Fixed capacity byte ring buffer with zero-copy search/extraction """
+    # Backing store
+    buf = None
+    # Capacity in bytes
+    capacity = 0
+    # Physical offset of oldest byte in buf
+    head = 0
+    # Number of valid bytes in buf
+    count = 0
+    # Total number of bytes dropped due to overflow
+    dropped = 0
+    # Stream offset of the oldest byte, i.e. number of bytes ever consumed
+    # or dropped; lets a reader keep stream offsets across skip/overflow
+    base = 0
+    # Allocate backing store on class instantiation
+    def __init__ (self, capacity) :
+        if capacity <= 0 : raise ValueError ("RingBuffer capacity must be > 0")
+        self.buf = bytearray (capacity)
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self.base = 0
+    def __len__ (self) :
+        return self.count
+    # Append data at the end, dropping oldest data if it doesn't fit
+    # Usage  : write (data)
+    #          data - bytes-like object to append
+    # Return : number of (oldest) bytes dropped to make room for data
+    def write (self, data) :
+        data = memoryview (data)
+        n = len (data)
+        drop = 0
+        # Data bigger than the whole ring, only its last 'capacity' bytes fit
+        if n > self.capacity :
+            drop = self.count + n - self.capacity
+            data = data[n - self.capacity:]
+            n = self.capacity
+            self.head = 0
+            self.count = 0
+            self.base += drop
+        elif self.count + n > self.capacity :
+            drop = self.count + n - self.capacity
+            self.skip (drop)
+        tail = (self.head + self.count) % self.capacity
+        first = min (n, self.capacity - tail)
+        self.buf[tail:tail + first] = data[:first]
+        if first < n : self.buf[0:n - first] = data[first:]
+        self.count += n
+        self.dropped += drop
+        return drop
+    # Get views of a logical range of valid data without copying
+    # Usage  : views (start, end)
+    #          start - logical offset from oldest byte (default 0)
+    #          end   - logical end offset, exclusive (default all valid data)
+    # Return : list of 0, 1 or 2 memoryviews covering the range in order
+    def views (self, start=0, end=None) :
+        if end is None or end > self.count : end = self.count
+        if start >= end : return []
+        mv = memoryview (self.buf)
+        pstart = (self.head + start) % self.capacity
+        pend = pstart + (end - start)
+        if pend <= self.capacity : return [mv[pstart:pend]]
+        return [mv[pstart:], mv[:pend - self.capacity]]
+    # Find a byte string in valid data
+    # Usage  : find (sub, start, end)
+    #          sub   - bytes to search for
+    #          start - logical offset to start search from (default 0)
+    #          end   - logical end offset, exclusive (default all valid data)
+    # Return : logical offset of first occurrence of sub, -1 if not found
+    def find (self, sub, start=0, end=None) :
+        if end is None or end > self.count : end = self.count
+        if start < 0 : start = 0
+        if end - start < len (sub) : return -1
+        pstart = (self.head + start) % self.capacity
+        pend = pstart + (end - start)
+        # Contiguous range, search in place
+        if pend <= self.capacity :
+            pos = self.buf.find (sub, pstart, pend)
+            return -1 if pos < 0 else pos - self.head + \
+                    (self.capacity if pos < self.head else 0)
+        # Wrapped range - search 1st segment, then the wrap boundary and
+        # then 2nd segment; only the boundary (< 2*len(sub)) is ever copied
+        pos = self.buf.find (sub, pstart, self.capacity)
+        if pos >= 0 : return start + pos - pstart
+        seg1len = self.capacity - pstart
+        seg2len = pend - self.capacity
+        k = len (sub) - 1
+        if k > 0 :
+            b1 = min (k, seg1len)
+            edge = bytes (self.buf[self.capacity - b1:]) + \
+                    bytes (self.buf[:min (k, seg2len)])
+            pos = edge.find (sub)
+            if pos >= 0 : return start + seg1len - b1 + pos
+        pos = self.buf.find (sub, 0, seg2len)
+        if pos >= 0 : return start + seg1len + pos
+        return -1
+    # Copy out and consume oldest n bytes
+    # Usage  : read (n)
+    #          n - number of bytes to read (clipped to valid data)
+    # Return : bytes read
+    def read (self, n) :
+        data = b"".join ([v.tobytes () for v in self.views (0, n)])
+        self.skip (len (data))
+        return data
+    # Consume (discard) oldest n bytes without copying
+    # Usage  : skip (n)
+    #          n - number of bytes to discard (clipped to valid data)
+    # Return : None
+    def skip (self, n) :
+        n = min (n, self.count)
+        self.head = (self.head + n) % self.capacity
+        self.count -= n
+        self.base += n
+        if self.count == 0 : self.head = 0
+#}
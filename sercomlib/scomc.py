@@ -0,0 +1,238 @@
+# Scom compiler
+#
+# Parses a scom file and the whole chain of child scom files it enables
+# (scom_enscom) into an instruction list before anything is run, so that a
+# bad line, a missing child file or an include cycle is reported before the
+# serial port is even opened. Compiled programs are cached on disk, keyed by
+# scom file path, and reused as long as none of the files in the chain (or
+# files they send) has changed (mtime/size).
+#
+# Instruction list - list of tuples, first element is the opcode:
+#   (SOP_CMD, cmd)                 - send cmd to modem and get its response
+#   (SOP_SLEEP, secs)              - sleep for secs seconds
+#   (SOP_WAITURC, secs, prefix)    - wait upto secs seconds for a URC
+#   (SOP_LOOP, iters, instrs, period, where)
+#                                  - run instrs iters times (-1 is forever),
+#                                    starting one every period seconds (0 -
+#                                    back to back); where is "file:line"
+#   (SOP_SCOM, path, instrs)       - run instrs of child scom file path
+#   (SOP_BREAK,)                   - leave current scom file (scom_break)
+#   (SOP_ENMAN,)                   - switch to Manual mode (scom_enman)
+#   (SOP_EXPECT, line)             - scom_expect (not supported yet)
+#   (SOP_TIMEOUT, secs, prefix)    - response timeout for commands starting
+#                                    with prefix ('' - all commands)
+#   (SOP_SENDFILE, path, proto)    - send file path with proto (refer
+#                                    sercomlib/xfer.py)
+
+import os
+import re
+import marshal
+import hashlib
+import tempfile
+from sercomlib.xfer import XferProtos
+
+SOP_CMD = "cmd"
+SOP_SLEEP = "sleep"
+SOP_WAITURC = "waiturc"
+SOP_LOOP = "loop"
+SOP_SCOM = "scom"
+SOP_BREAK = "break"
+SOP_ENMAN = "enman"
+SOP_EXPECT = "expect"
+SOP_TIMEOUT = "timeout"
+SOP_SENDFILE = "sendfile"
+
+# Bump whenever instruction format changes, to invalidate old cache entries
+ScomCompilerVersion = 3
+
+# Directory for compiled scom cache, override with SERCOM_CACHE_DIR env var
+ScomCacheDir = os.environ.get ("SERCOM_CACHE_DIR", \
+        os.path.join (os.path.expanduser ("~"), ".cache", "sercom"))
+
+class ScomError (Exception) :
+    """ Scom compilation error, message tells file:line and the cause """
+    pass
+
+# Function to compile a scom file with its whole chain of child scoms
+# Usage  : CompileScom (path, usecache, cwd)
+#          path     - mother scom file path
+#          usecache - use/update on-disk cache of compiled scoms
+#          cwd      - directory relative paths (scom file, child scoms, files
+#                     sent) are found in, None for PWD; e.g. the client's
+#                     directory for a daemon job
+# Return : (SOP_SCOM, path, instrs) instruction for path
+#          Raises ScomError on any error in the chain
+def CompileScom (path, usecache=True, cwd=None) :
+    entry = None
+    if usecache : entry = LoadScomCache (path, cwd)
+    if entry : return entry["prog"]
+    deps = {}
+    prog = CompileScomFile (path, [], deps, None, cwd)
+    if usecache : SaveScomCache (path, prog, deps, cwd)
+    return prog
+
+# Function to find a path named in a scom
+# Usage  : ScomPath (path, cwd)
+#          cwd - refer CompileScom
+# Return : path, relative to cwd if it's relative and cwd is given
+def ScomPath (path, cwd) :
+    if cwd is None or os.path.isabs (path) : return path
+    return os.path.join (cwd, path)
+
+# Function to check and compile one scom file (and its children)
+# Usage  : CompileScomFile (path, chain, deps, where, cwd)
+#          path  - scom file path
+#          chain - real paths of scom files enabling this one (cycle check)
+#          deps  - dict updated with {realpath: (mtime, size)} of all files
+#                  (scom files and files they send)
+#          where - "file:line" enabling this file, None for mother scom
+#          cwd   - refer CompileScom
+# Return : (SOP_SCOM, path, instrs)
+def CompileScomFile (path, chain, deps, where, cwd=None) :
+    at = (where + ": ") if where else ""
+    found = ScomPath (path, cwd)
+    if path[-5:] != ".scom" or not os.path.isfile (found) :
+        raise ScomError (at + "Scom file not found or invalid - " + path)
+    real = os.path.realpath (found)
+    if real in chain :
+        names = [os.path.basename (p) for p in chain + [real]]
+        raise ScomError (at + "Scom include cycle - " + " -> ".join (names))
+    st = os.stat (found)
+    deps[real] = (st.st_mtime, st.st_size)
+    fh = open (found, "r")
+    lines = fh.readlines ()
+    fh.close ()
+    # Strip line endings, number lines and drop comments/blank lines
+    lines = [(n + 1, l.rstrip ("\r\n")) for n, l in enumerate (lines)]
+    lines = [(n, l) for n, l in lines if l.strip () and l[0] != '#']
+    instrs, pos = CompileScomBlock (path, lines, 0, chain + [real], deps, \
+            False, cwd)
+    return (SOP_SCOM, path, instrs)
+
+# Function to compile a block of scom lines till EOF or scom_loopend
+# Usage  : CompileScomBlock (path, lines, pos, chain, deps, inloop, cwd)
+#          path   - scom file path (for error messages)
+#          lines  - list of (line-number, line) of path
+#          pos    - index in lines to start from
+#          chain  - refer CompileScomFile
+#          deps   - refer CompileScomFile
+#          inloop - True if block is a loop body (ends with scom_loopend)
+#          cwd    - refer CompileScom
+# Return : (instrs, index in lines after the block)
+def CompileScomBlock (path, lines, pos, chain, deps, inloop, cwd=None) :
+    instrs = []
+    while pos < len (lines) :
+        num, line = lines[pos]
+        pos += 1
+        at = path + ":" + str (num)
+        words = line.split (None, 1)
+        word = words[0]
+        arg = words[1].strip () if len (words) > 1 else ""
+        # Not a scom directive, it's a command for the modem
+        if word[0:5] != "scom_" : instrs.append ((SOP_CMD, line)); continue
+        if word == "scom_loopend" :
+            if not inloop : raise ScomError (at + ": scom_loopend without " \
+                    + "scom_loopbegin")
+            return instrs, pos
+        elif word == "scom_loopbegin" :
+            # Remove extra spaces and parse number of iterations and period
+            iters = -1 # If no iteration count specified, loop indefinitely
+            period = 0.0
+            for opt in re.sub (" *= *", "=", arg).split () :
+                m = re.match (r"(iter|period)=(\d+(\.\d*)?)$", opt)
+                if not m or m.group (1) == "iter" and m.group (3) :
+                    raise ScomError (at + ": Bad loop - " + line)
+                if m.group (1) == "iter" : iters = int (m.group (2))
+                else : period = float (m.group (2))
+            body, pos = CompileScomBlock (path, lines, pos, chain, deps, \
+                    True, cwd)
+            instrs.append ((SOP_LOOP, iters, body, period, \
+                    os.path.basename (path) + ":" + str (num)))
+        elif word == "scom_sleep" :
+            try : secs = float (arg)
+            except ValueError : raise ScomError (at + ": Bad sleep - " + line)
+            instrs.append ((SOP_SLEEP, secs))
+        elif word == "scom_waiturc" :
+            args = arg.split (None, 1)
+            try : secs = float (args[0]); prefix = args[1].strip ()
+            except (ValueError, IndexError) :
+                raise ScomError (at + ": Bad syntax - " + line)
+            instrs.append ((SOP_WAITURC, secs, prefix))
+        elif word == "scom_timeout" :
+            args = arg.split (None, 1)
+            try : secs = float (args[0])
+            except (ValueError, IndexError) :
+                raise ScomError (at + ": Bad timeout - " + line)
+            if secs <= 0 : raise ScomError (at + ": Bad timeout - " + line)
+            prefix = args[1].strip () if len (args) > 1 else ""
+            instrs.append ((SOP_TIMEOUT, secs, prefix))
+        elif word == "scom_sendfile" :
+            # Optional protocol, then file path (which may have spaces)
+            args = arg.split (None, 1)
+            proto = "raw"
+            if len (args) == 2 and args[0].lower () in XferProtos :
+                proto = args[0].lower (); arg = args[1].strip ()
+            if not arg : raise ScomError (at + ": Bad syntax - " + line)
+            # Like child scoms, file is found relative to PWD (or cwd)
+            found = ScomPath (arg, cwd)
+            if not os.path.isfile (found) :
+                raise ScomError (at + ": File not found - " + arg)
+            # A cached program is stale once the file is gone or changed
+            st = os.stat (found)
+            deps[os.path.realpath (found)] = (st.st_mtime, st.st_size)
+            instrs.append ((SOP_SENDFILE, os.path.abspath (found), proto))
+        elif word == "scom_enscom" :
+            instrs.append (CompileScomFile (arg, chain, deps, at, cwd))
+        elif word == "scom_break" :
+            instrs.append ((SOP_BREAK,))
+            # Nothing after scom_break in this file is ever executed
+            if not inloop : return instrs, len (lines)
+        elif word == "scom_enman" : instrs.append ((SOP_ENMAN,))
+        elif word == "scom_expect" : instrs.append ((SOP_EXPECT, line))
+        else : raise ScomError (at + ": Unknown scom directive - " + word)
+    if inloop : raise ScomError (path + ": EOF before scom_loopend")
+    return instrs, pos
+
+# Function to get path of cache file for a scom file
+# Usage  : ScomCachePath (path, cwd)
+# Return : cache file path
+def ScomCachePath (path, cwd=None) :
+    # Child scoms are found relative to PWD (or cwd), so it's part of the key
+    cwd = os.path.abspath (cwd or os.getcwd ())
+    key = os.path.realpath (os.path.join (cwd, path)) + "\0" + cwd
+    return os.path.join (ScomCacheDir, \
+            hashlib.sha1 (key.encode ("utf-8")).hexdigest () + ".scomc")
+
+# Function to load compiled scom from cache, if still valid
+# Usage  : LoadScomCache (path, cwd)
+# Return : cache entry dict if valid, None otherwise
+def LoadScomCache (path, cwd=None) :
+    try :
+        fh = open (ScomCachePath (path, cwd), "rb")
+        entry = marshal.load (fh)
+        fh.close ()
+    except Exception : return None
+    if not isinstance (entry, dict) : return None
+    if entry.get ("version") != ScomCompilerVersion : return None
+    # Valid only if no file in the chain has changed since compilation
+    for dep, stamp in entry["deps"].items () :
+        try : st = os.stat (dep)
+        except OSError : return None
+        if (st.st_mtime, st.st_size) != stamp : return None
+    return entry
+
+# Function to save compiled scom in cache (best effort, errors are ignored)
+# Usage  : SaveScomCache (path, prog, deps, cwd)
+# Return : None
+def SaveScomCache (path, prog, deps, cwd=None) :
+    entry = {"version" : ScomCompilerVersion, "prog" : prog, "deps" : deps}
+    try :
+        if not os.path.isdir (ScomCacheDir) : os.makedirs (ScomCacheDir)
+        fd, tmp = tempfile.mkstemp (dir=ScomCacheDir)
+        fh = os.fdopen (fd, "wb")
+        # Plain data only; unlike pickle, loading it never runs code
+        marshal.dump (entry, fh, 2)
+        fh.close ()
+        # os.replace overwrites atomically on Windows too (not in python 2)
+        getattr (os, "replace", os.rename) (tmp, ScomCachePath (path, cwd))
+    except (OSError, IOError) : pass
@@ -0,0 +1,139 @@
+# Sentry matching engine
+#
+# A sentry marks the end of a modem response. Responses arrive in chunks, so
+# instead of searching every sentry in the whole accumulated response after
+# each chunk, all sentries are compiled once into a single alternation and
+# every scan resumes where the last one left off, only going back by a tail
+# overlap precomputed from the sentries. Regex sentries having their own
+# groups (e.g. backreferences) or global flags are searched on their own.
+# Sentries can be:
+#   literal  - e.g. \r\nOK\r\n
+#   wildcard - literal with '.*' standing for any text upto what follows it,
+#              e.g. \r\n+CME ERROR:.*\r\n ends the response only after the
+#              whole error line has arrived
+#   regex    - python regular expression e.g. \r\n\+CMS ERROR: \d+\r\n
+# Wildcard and regex sentries of unbounded length are matched within a line:
+# their variable part is assumed not to span lines, so a scan resumes from
+# the start of the line in progress (less the tail) and never from the start
+# of the response.
+# Matching is done on raw received bytes, so responses need not be decoded
+# until they're complete.
+
+import re
+
+try : from re import _parser as SreParse # python 3.11+
+except ImportError : import sre_parse as SreParse
+
+# A regex sentry this wide or wider is treated as unbounded
+SentryMaxWidth = 4096
+
+class SentryMatcher : #{
+    """ Streaming matcher of literal, wildcard and regex sentries """
+    # Sentry byte strings/patterns in the order given by the caller (sentry
+    # list first, then regex list); scan() returns index in this list
+    sentries = []
+    # Number of bytes of overlap to rescan on next scan
+    tail = 0
+    # True if any sentry is unbounded (wildcard/regex), see file header
+    unbounded = False
+    # Offset in response buffer till which scanning is already done
+    scanned = 0
+    # Setup matcher from the sentry lists on class instantiation
+    # Usage  : SentryMatcher (SentryList, RegexList)
+    #          SentryList - literal/wildcard sentry strings (e.g. gSerSentry)
+    #          RegexList  - regex sentry strings (e.g. gSerSentryRx)
+    #          Raises re.error on a bad regex sentry
+    def __init__ (self, SentryList, RegexList=None) :
+        enc = lambda s : s if isinstance (s, bytes) else s.encode ("utf-8")
+        self.sentries = [enc (s) for s in SentryList]
+        nlit = len (self.sentries)
+        self.sentries += [enc (s) for s in (RegexList or [])]
+        pats = []
+        widths = []
+        # Regex sentries with their own groups or global flags (e.g. (\w)\1
+        # or (?i)ok) would break in the alternation, with their group
+        # numbers shifted or flags not at its start; they're searched
+        # separately
+        self.alone = []
+        for i, s in enumerate (self.sentries) :
+            if i >= nlit :
+                pat = s
+                rx = re.compile (pat)
+                if rx.groups or rx.flags : self.alone.append ((i, rx))
+            else :
+                # '.*' matches the least text upto what follows it
+                pat = b"[\\s\\S]*?".join ([re.escape (p) for p in \
+                        s.split (b".*")])
+            lo, hi = SreParse.parse (pat).getwidth ()
+            # Bounded sentries' tail covers their full width, unbounded
+            # ones' covers their fixed part (refer file header)
+            if hi >= SentryMaxWidth :
+                self.unbounded = True
+                hi = lo
+            pats.append (pat)
+            widths.append (hi)
+        # Wildcard/regex sentries go first, then literals longest first, so
+        # the most specific sentry wins if more than one matches at the same
+        # position
+        order = sorted (range (len (pats)), key=lambda i : \
+                (i < nlit and b".*" not in self.sentries[i], -widths[i], i))
+        self.rank = dict ((i, r) for r, i in enumerate (order))
+        # One named group per sentry in the combined rule
+        alone = [i for i, rx in self.alone]
+        order = [i for i in order if i not in alone]
+        self.rule = None
+        if order : self.rule = re.compile (b"|".join ([b"(?P<s" + \
+                str (i).encode () + b">" + pats[i] + b")" for i in order]))
+        # Group number of each sentry's group -> sentry index
+        self.groupmap = {}
+        for i in order :
+            self.groupmap[self.rule.groupindex["s" + str (i)]] = i
+        self.tail = max (widths + [1]) - 1
+        self.reset ()
+    # Forget scan state; call before receiving a new response
+    # Usage  : reset (start)
+    #          start - offset where the new response starts (scans never
+    #                  go before it)
+    def reset (self, start=0) :
+        self.start = start
+        self.scanned = start
+        self.linestart = start
+    # Get offset the next scan resumes from
+    # Usage  : resume ()
+    # Return : offset in response buffer (or stream, refer scan)
+    def resume (self) :
+        pos = self.scanned - self.tail
+        if self.unbounded : pos = min (pos, self.linestart - self.tail)
+        return max (self.start, pos)
+    # Scan response buffer for any sentry from where last scan left off
+    # Usage  : scan (buf, end, base)
+    #          buf  - bytes/bytearray holding the response received so far
+    #          end  - offset of end of valid data (buf may be preallocated)
+    #          base - offset of buf[0]; lets a caller keep offsets in a
+    #                 stream and pass just the data from resume() onwards
+    #                 (e.g. copied out of a ring buffer). Default 0
+    # Return : On Match    - (SentryIdx, EndPos) where SentryIdx indexes
+    #                        the sentry list and EndPos is the offset right
+    #                        after the matched sentry
+    #          On No-Match - None
+    def scan (self, buf, end, base=0) :
+        if not self.sentries : return None
+        pos = max (0, self.resume () - base)
+        # Earliest match wins, the most specific one at the same position
+        best = None
+        if self.rule :
+            m = self.rule.search (buf, pos, end - base)
+            if m :
+                i = self.groupmap[m.lastindex]
+                best = (m.start (), self.rank[i], i, m.end ())
+        for i, rx in self.alone :
+            m = rx.search (buf, pos, end - base)
+            if m and (not best or (m.start (), self.rank[i]) < best[:2]) :
+                best = (m.start (), self.rank[i], i, m.end ())
+        if self.unbounded :
+            nl = buf.rfind (b"\n", max (0, self.scanned - base), end - base)
+            if nl >= 0 : self.linestart = base + nl + 1
+        self.scanned = end
+        if not best : return None
+        return best[2], base + best[3]
+#}
@@ -0,0 +1,1158 @@
+# Sercom session - one serial port driven by sercom
+#
+# Holds everything that used to be sercom.py module globals for its single
+# port: port handle and configuration, sentry matcher, rx buffer, URC
+# demultiplexer and its rx thread, scom timeouts, log/capture files and run
+# statistics. Any number of sessions can run side by side in one process
+# (refer scomfleet.py), sercom.py runs just one. Session wraps it up for
+# library use (refer Session at the end).
+
+import os
+import re
+import sys
+import time
+import codecs
+import errno
+import select
+import platform
+import threading
+import serial
+from sercomlib.sentry import SentryMatcher
+from sercomlib.urc import UrcDemux
+from sercomlib.scomc import CompileScom, ScomError, SOP_CMD, SOP_SLEEP, \
+        SOP_WAITURC, SOP_LOOP, SOP_SCOM, SOP_BREAK, SOP_ENMAN, SOP_EXPECT, \
+        SOP_TIMEOUT, SOP_SENDFILE
+from sercomlib.slog import AsyncLogger
+from sercomlib.capture import CaptureWriter, CapTimedOut
+from sercomlib.stats import RunStats, Histogram
+from sercomlib.portconf import PortConfig, PortConfError, SerBauds
+from sercomlib.xfer import XferSend, XferError, LineRate
+from sercomlib.transport import IsTransport, OpenTransport, TransportError
+from sercomlib.baud import BaudChecks, BaudSwitchDelay, BaudProbeOrder, \
+        BaudProbeTime, LoadBaudCache, SaveBaudCache
+
+# Making this module version-agnostic, we need version number to abstract
+# and call version-specific Serial/File IO and other API functions
+gPyVer = int (platform.python_version()[0])
+
+# Monotonic clock used for timeout deadlines (not there in python 2)
+if gPyVer != 2 : MonoTime = time.monotonic
+else : MonoTime = time.time
+
+# Peak memory use (max RSS) for soak summaries, not there on Windows
+try : import resource
+except ImportError : resource = None
+# ru_maxrss is in KB on Linux, bytes on macOS
+RssPerMB = 1024.0 * 1024 if sys.platform == "darwin" else 1024.0
+
+# cmd_src_types
+SCmd = 0 # Modem Cmd read from scom file (Scom mode)
+MCmd = 1 # Modem Cmd read from stdin (Manual mode)
+
+# Longest partial line stream() holds back waiting for its line end
+StreamMaxLine = 65536
+
+# Responses of a command needed before its timeout adapts, and the lowest
+# timeout adaptation may set (refer adtout in sample.conf)
+AdaptMinResps = 10
+AdaptMinTout = 1.0
+
+class LoopSchedule : #{
+    """ Deadline schedule of a fixed-rate scom loop's iterations """
+    # With period 0 iterations run back to back and are only timed
+    # Iteration n is due at n periods after the loop started, however long
+    # earlier ones ran, so that command latency doesn't add up as drift.
+    # An iteration ending after the next one was due (overrun) starts the
+    # next one at once; if that's a whole period or more behind, the due
+    # times missed are dropped rather than made up in a burst, keeping the
+    # loop in phase
+    # Setup schedule on class instantiation, first iteration is due now
+    # Usage  : LoopSchedule (period)
+    def __init__ (self, period) :
+        self.period = period
+        self.due = MonoTime ()
+        self.start = self.due
+        # Iterations, overruns and due times missed so far, and the longest
+        # busy time and start lateness seen
+        self.iters = 0
+        self.overruns = 0
+        self.missed = 0
+        self.busymax = 0.0
+        self.latemax = 0.0
+    # Mark an iteration starting now
+    # Usage  : begin ()
+    # Return : seconds it started after it was due
+    def begin (self) :
+        self.start = MonoTime ()
+        Late = self.start - self.due
+        self.latemax = max (self.latemax, Late)
+        return Late
+    # Mark the iteration ending now and schedule the next one
+    # Usage  : end ()
+    # Return : (seconds it was busy, seconds till next one is due,
+    #           True on overrun, due times missed)
+    def end (self) :
+        Now = MonoTime ()
+        self.iters += 1
+        self.busymax = max (self.busymax, Now - self.start)
+        if not self.period :
+            self.due = Now
+            return Now - self.start, 0.0, False, 0
+        self.due += self.period
+        Overrun = Now > self.due
+        Missed = 0
+        if Now - self.due >= self.period :
+            Missed = int ((Now - self.due) / self.period)
+            self.due += Missed * self.period
+        self.overruns += Overrun
+        self.missed += Missed
+        return Now - self.start, max (0.0, self.due - Now), Overrun, Missed
+#}
+
+class SessionError (Exception) :
+    """ Irrecoverable error in a session, message tells the cause """
+    pass
+
+class CommandTimeout (SessionError) :
+    """ Command got no/incomplete response in time (refer Session) """
+    # Command and whatever was received of its response
+    cmd = ""
+    resp = ""
+    def __init__ (self, cmd, resp, tout) :
+        SessionError.__init__ (self, "'" + cmd + "' Timed-out with " + \
+                "no/incomplete response in " + str (tout) + " seconds")
+        self.cmd = cmd
+        self.resp = resp
+
+# Function to receive data over Serial port into a preallocated buffer
+# Usage  : RecvSerialData (SerialPort, RxBuf)
+#          SerialPort - Serial Port Interface handle
+#          RxBuf      - writable buffer (memoryview) to receive data into
+# Return : number of bytes received into RxBuf
+if os.name == "posix" and gPyVer != 2 :
+    # Read all that's waiting (up to len(RxBuf)) straight into RxBuf
+    def RecvSerialData (SerialPort, RxBuf) :
+        try : nBytes = os.readv (SerialPort.fd, [RxBuf])
+        except BlockingIOError : return 0
+        if nBytes == 0 :
+            raise serial.SerialException ("device reports readiness to " + \
+                    "read but returned no data (device disconnected?)")
+        return nBytes
+else :
+    def RecvSerialData (SerialPort, RxBuf) :
+        nBytes = min (len (RxBuf), max (SerialPort.in_waiting, 1))
+        try : Data = SerialPort.read (nBytes)
+        except serial.serialutil.SerialTimeoutException : Data = b''
+        RxBuf[:len (Data)] = Data
+        return len (Data)
+
+# Function to block till receive data is available on Serial port
+# Usage  : WaitSerialRx (SerialPort, timeout)
+#          SerialPort - Serial Port Interface handle
+#          timeout    - max time in seconds to wait for receive data
+# Return : number of bytes ready to recv, 0 if timed-out
+if os.name == "posix" :
+    # Serial port fd is pollable, sleep in kernel till data arrives
+    def WaitSerialRx (SerialPort, timeout) :
+        try : rl, wl, el = select.select ([SerialPort], [], [], timeout)
+        except (select.error, OSError, ValueError) as e :
+            # Interrupted, retry; anything else (e.g. fd closed as ssh/TCP
+            # peer went away) would spin here till the deadline
+            if e.args and e.args[0] == errno.EINTR : return 0
+            raise serial.SerialException ("Unable to wait for port " + \
+                    "data - " + str (e))
+        if not rl : return 0
+        # Readable with nothing waiting means a hang-up; let read report it
+        return max (SerialPort.in_waiting, 1)
+else :
+    # COM ports can't be select()ed on Windows, poll input queue instead
+    def WaitSerialRx (SerialPort, timeout) :
+        deadline = MonoTime () + timeout
+        while 1 :
+            nBytes = SerialPort.in_waiting
+            if nBytes > 0 : return nBytes
+            if MonoTime () >= deadline : return 0
+            time.sleep (0.001)
+
+# Function to send data over Serial port in python-version independent way
+# Usage  : SendSerialData (SerialPort, buf)
+#          SerialPort - Serial Port Interface handle
+#          buf        - buffer containing data to be send over serial port
+# Return : number of data bytes sent over the serial port
+def SendSerialData (SerialPort, buf) :
+    if gPyVer != 2 : buf = buf.encode ()
+    try : numTxBytes = SerialPort.write (buf)
+    except serial.serialutil.SerialTimeoutException : numTxBytes = -1
+    SerialPort.flush ()
+    return numTxBytes
+
+# Function to read console (stdin) input being python-version-agnostic
+# Usage  : ReadConsoleInput (prompt)
+#          prompt     - prompt string (optional)
+# Return : Console input data given by user from stdin console
+if gPyVer != 2 : ReadConsoleInput = input
+else : ReadConsoleInput = raw_input
+
+# First line of a response (the command echo), refer StripStartOfString
+StripRule = re.compile (r'([^\n]+)')
+
+# Function to strip the Command from the Response
+# Usage  : StripStartOfString (buf)
+#          buf        - buffer containing data to be processed
+# Return : Stripped string
+def StripStartOfString (buf) :
+    m = StripRule.search (buf)
+    if not m : return buf
+    return buf[len (m.group (1)) + 1:]
+
+# Function to skip first word and following spaces to point to next word
+# Usage  : SkipToNextWord (line, word1len)
+#          line - line to skip first word and spaces for next word
+#          word1len - length of first word to skip
+# Return : line with next word as start of line
+def SkipToNextWord (line, word1len) :
+    line = line[word1len:]
+    return line[len(line) - len(line.lstrip()):]
+
+class SercomSession : #{
+    """ A sercom session on one serial port """
+    # Serial port device e.g. /dev/ttyUSB0, COM6
+    portid = "undefined"
+    # PortConfig of the port
+    conf = None
+    # Serial port IO handle, None till open()
+    port = None
+    # Console output stream (None - no console output)
+    out = sys.stdout
+    # Allow scom_enman to read Manual commands from stdin
+    manualen = True
+    # True if last command timed-out (or couldn't be sent)
+    timedout = False
+    # Target echoes commands back, False once echoff has disabled it
+    echo = True
+    # Show/log responses of scom/manual commands as they arrive, with
+    # bounded memory (refer stream() and -i of sercom.py)
+    streamed = False
+    # Soak mode summary interval in seconds, 0 if not in soak mode (refer
+    # StartSoak)
+    soak = 0
+    # A command failed (timed-out or ended by any sentry but the first one)
+    # in the current loop iteration
+    iterfail = False
+    # Depth of loop iterations in progress
+    loopdepth = 0
+    # URC seq (refer UrcDemux.seq) when the last command was sent;
+    # scom_waiturc matches URCs routed after it, including ones routed
+    # from that command's response
+    urcseq = 0
+    # Setup session on class instantiation, call open() to open the port
+    # Usage  : SercomSession (portid, conf, out, logfile, logmax, capfile)
+    #          portid  - serial port device
+    #          conf    - PortConfig (or .conf file name)
+    #          out     - console output stream, None for no console output
+    #          logfile - session log file name (refer -l of sercom.py),
+    #                    None for no logging
+    #          logmax  - rotate log file beyond these many bytes, 0 never
+    #          capfile - binary capture file name (refer -b of sercom.py),
+    #                    None for no capture
+    #          Raises PortConfError on a bad configuration
+    def __init__ (self, portid, conf, out=sys.stdout, logfile=None, \
+            logmax=0, capfile=None) :
+        if not isinstance (conf, PortConfig) : conf = PortConfig (conf)
+        conf.check ()
+        self.portid = portid
+        self.conf = conf
+        self.out = out
+        try : self.sentries = SentryMatcher (conf.sentries, conf.sentrx)
+        except re.error as e :
+            raise PortConfError ("Bad sentrx regex - " + str (e))
+        # Preallocated serial rx buffer (reused, grows if a response
+        # outgrows it) and its decoder which carries multibyte chars split
+        # across responses
+        self.rxbuf = bytearray (conf.rxblks)
+        self.rxdecoder = codecs.getincrementaldecoder ("utf-8") ( \
+                errors="replace")
+        # Serial port owner lock - held by a Command-Response session, so
+        # that URC rx loop doesn't read any part of a response
+        self.portlock = threading.Lock ()
+        # URC registry/router (refer urcpat in sample.conf)
+        self.urcs = UrcDemux ()
+        self.urcthread = None
+        self.urcalive = False
+        # Response timeouts, scom_timeout changes these for this session
+        self.rsptout = conf.rstout
+        self.cmdtouts = dict (conf.cmtouts)
+        # Per-command statistics of this session
+        self.stats = RunStats ()
+        self.logger = None
+        if logfile : self.logger = AsyncLogger (logfile, logmax)
+        self.capture = None
+        if capfile : self.capture = CaptureWriter (capfile)
+    # Open and configure the serial port, or the transport portid names
+    # (ssh://, tcp://, exec:, refer sercomlib/transport.py)
+    # Usage  : open ()
+    # Return : None, raises SessionError if port can't be opened
+    def open (self) :
+        conf = self.conf
+        if IsTransport (self.portid) :
+            try : self.port = OpenTransport (self.portid, conf)
+            except TransportError as e : raise SessionError (str (e))
+            # Login messages and prompt shown before any command
+            if self.port.banner : self.logio ("UI", \
+                    self.port.banner.decode ("utf-8", "replace"))
+            return
+        try :
+            self.port = serial.Serial (port=self.portid, baudrate=conf.baud, \
+                    bytesize=conf.bytesz, parity=conf.parity, \
+                    stopbits=conf.stpbit, timeout=conf.rdtout, \
+                    xonxoff=conf.flowct=='X', rtscts=conf.flowct=='R', \
+                    dsrdtr=conf.flowct=='D')
+            if gPyVer != 2 : self.port.writeTimeout = conf.wrtout
+            else : self.port.write_timeout = conf.wrtout
+        except serial.serialutil.SerialException :
+            raise SessionError ("Unable to open Serial port: " + \
+                    self.portid + "\n" + str (sys.exc_info()[1]))
+    # Validate basic command before actual serial communication and start
+    # routing configured URCs
+    # Usage  : validate ()
+    # Return : True if scvcmd got scvrsp, else False
+    def validate (self) :
+        # Transports have no baud rate to detect
+        if self.conf.autobd and self.port.baudrate and \
+                not self.AutoBaud () :
+            return False
+        Resp = self.command (self.conf.scvcmd, SCmd)
+        if self.conf.scvrsp not in Resp : return False
+        if self.conf.echoff : self.EchoOff ()
+        # Route configured URCs and keep receiving them while port is idle
+        if self.conf.urcpats : self.RouteUrcs (); self.StartUrcRx ()
+        return True
+    # Route configured URCs (refer urcpat in sample.conf) to ShowUrc, once
+    # however many times the port is validated
+    # Usage  : RouteUrcs ()
+    # Return : None
+    def RouteUrcs (self) :
+        for pat in self.conf.urcpats :
+            self.urcs.unregister (pat)
+            self.urcs.register (pat, self.ShowUrc)
+    # Disable command echo of the target with echoff (refer sample.conf)
+    # and confirm it with scvcmd, so that responses needn't be stripped of
+    # their echo
+    # Usage  : EchoOff ()
+    # Return : True if echo is off
+    def EchoOff (self) :
+        Steps = self.EchoOffSteps ()
+        Cmd = next (Steps)
+        try :
+            while 1 : Cmd = Steps.send (self.command (Cmd, SCmd))
+        except StopIteration : pass
+        return not self.echo
+    # Command sequence of EchoOff, shared with asyncio sessions which only
+    # differ in awaiting the responses
+    # Usage  : Steps = EchoOffSteps (); Cmd = next (Steps), then
+    #          Cmd = Steps.send (response of Cmd) till StopIteration
+    # Return : generator of commands to send, self.echo tells the outcome
+    def EchoOffSteps (self) :
+        yield self.conf.echoff
+        if self.timedout : self.EchoCheck (None); return
+        self.echo = False
+        self.EchoCheck ((yield self.conf.scvcmd))
+    # Check scvcmd response got with echo off doesn't start with its echo
+    # Usage  : EchoCheck (Resp)
+    #          Resp - scvcmd response, None if echoff itself failed
+    # Return : True if echo is off, else it's stripped as before
+    def EchoCheck (self, Resp) :
+        if Resp is not None and not Resp.lstrip ("\r\n").startswith ( \
+                self.conf.scvcmd) :
+            return True
+        self.echo = True
+        self.slogprint ("Unable to disable echo with '" + self.conf.echoff + \
+                "', stripping it from responses")
+        return False
+    # Find the baud rate the modem is at and, with autobd=F, switch modem
+    # and port to the fastest rate that works (refer sercomlib/baud.py)
+    # Usage  : AutoBaud ()
+    # Return : True if modem answered scvcmd at some rate, port is left at
+    #          the rate to use
+    def AutoBaud (self) :
+        conf = self.conf
+        Cached = LoadBaudCache (self.portid)
+        Baud = self.DetectBaud ([Cached.get ("baud"), conf.baud])
+        if not Baud :
+            self.slogprint ("No " + conf.scvcmd + "-" + conf.scvrsp + \
+                    " session at any baud rate")
+            return False
+        self.slogprint ("Modem found at " + str (Baud) + " baud")
+        Entry = {"baud" : Baud}
+        if conf.autobd == 'F' :
+            # Best rate found before is tried first, faster ones failed
+            Top = conf.bdrmax
+            if Cached.get ("max") == Top : Top = Cached.get ("best", Top)
+            if Baud < Top : Baud = self.FastestBaud (Baud, Top)
+            if not Baud : return False
+            Entry = {"baud" : Baud, "best" : Baud, "max" : conf.bdrmax}
+        SaveBaudCache (self.portid, Entry)
+        return True
+    # Find the baud rate modem answers scvcmd at
+    # Usage  : DetectBaud (First)
+    #          First - rates to probe first (refer BaudProbeOrder)
+    # Return : rate port is left at, None if modem didn't answer at any
+    def DetectBaud (self, First) :
+        for Baud in BaudProbeOrder (First) :
+            if self.ProbeBaud (Baud) : return Baud
+        return None
+    # Switch modem and port to faster baud rates, fastest first, till one
+    # passes the stress check
+    # Usage  : FastestBaud (Baud, Top)
+    #          Baud - rate modem and port are at
+    #          Top  - fastest rate to try
+    # Return : rate port is left at, None if modem is lost
+    def FastestBaud (self, Baud, Top) :
+        Start = Baud
+        for Rate in sorted (SerBauds, reverse=True) :
+            if Rate > Top : continue
+            if Rate <= Start : break
+            if self.SwitchBaud (Rate) : return Rate
+            # Modem may be at either rate now, find it again
+            Baud = self.DetectBaud ([Start, Rate])
+            if not Baud : return None
+        return Baud
+    # Switch modem and port to a baud rate with bdrcmd and stress check it
+    # with BaudChecks scvcmd sessions, switching back on failure
+    # Usage  : SwitchBaud (Rate)
+    # Return : True if port is at Rate and it works
+    def SwitchBaud (self, Rate) :
+        Prev = self.port.baudrate
+        # Don't ask modem for a rate the port can't do
+        try : self.port.baudrate = Rate; self.port.baudrate = Prev
+        except (ValueError, IOError, serial.SerialException) :
+            self.port.baudrate = Prev
+            return False
+        Resp = self.Exchange (self.conf.bdrcmd + str (Rate))
+        if Resp is None or self.conf.scvrsp not in Resp :
+            self.slogprint ("Modem refused " + str (Rate) + " baud")
+            return False
+        # Modem switches once its response is out
+        time.sleep (BaudSwitchDelay)
+        self.port.baudrate = Rate
+        for i in range (BaudChecks) :
+            if not self.ProbeBaud () :
+                self.slogprint (str (Rate) + " baud failed " + \
+                        "stress check, switching back to " + str (Prev))
+                self.Exchange (self.conf.bdrcmd + str (Prev))
+                time.sleep (BaudSwitchDelay)
+                self.port.baudrate = Prev
+                return False
+        self.slogprint ("Switched to " + str (Rate) + " baud")
+        return True
+    # Check modem answers scvcmd with scvrsp
+    # Usage  : ProbeBaud (Baud)
+    #          Baud - rate to set port to first, None to keep it
+    # Return : True if it does
+    def ProbeBaud (self, Baud=None) :
+        try :
+            if Baud : self.port.baudrate = Baud
+        except (ValueError, IOError, serial.SerialException) : return False
+        # Garbage sent at a wrong rate may still be in modem's command line,
+        # its error response is skipped and scvcmd is sent again
+        for Try in range (2) :
+            Resp = self.Exchange (self.conf.scvcmd, Try == 0)
+            if Resp is None : return False
+            if self.conf.scvrsp in Resp : return True
+        return False
+    # Send a command and get its response quietly (not shown, logged or
+    # recorded in stats), e.g. to probe a baud rate
+    # Usage  : Exchange (Cmd, Flush)
+    #          Flush - end any partial command line in modem first
+    # Return : response, None if timed-out
+    def Exchange (self, Cmd, Flush=False) :
+        Tout = BaudProbeTime (self.port.baudrate, 2 * len (Cmd) + 64)
+        self.portlock.acquire ()
+        try :
+            if Flush :
+                SendSerialData (self.port, "\r")
+                time.sleep (BaudSwitchDelay)
+            self.port.reset_input_buffer ()
+            if SendSerialData (self.port, Cmd + "\r") < 0 : return None
+            # Blocking recv, even in subclasses (refer AioSercomSession)
+            RxTimedOut, Resp = SercomSession.recv (self, Tout)[:2]
+        finally : self.portlock.release ()
+        return None if RxTimedOut else Resp
+    # Close serial port, log and capture files
+    # Usage  : close ()
+    # Return : None
+    def close (self) :
+        self.urcalive = False
+        if self.port :
+            self.portlock.acquire ()
+            self.port.close ()
+            self.portlock.release ()
+        if self.logger : self.logger.close ()
+        if self.capture : self.capture.close ()
+    # Write text to console output, if any
+    def write (self, text) :
+        if self.out : self.out.write (text)
+    # Flush console output, if any
+    def flush (self) :
+        if self.out : self.out.flush ()
+    # Log any debug/error messages to log file and/or capture
+    # Usage  : logmsg (msg)
+    # Return : None
+    def logmsg (self, msg) :
+        if self.logger : self.logger.debug (msg)
+        if self.capture : self.capture.write ("S", "M", msg)
+    # Log serial IO data to log file and/or binary capture file
+    # repr() formatting is deferred to the log writer thread (refer slog.py)
+    # Usage  : logio (tag, data, cmd, sentry)
+    #          tag    - IO tag e.g. AO for Auto Output (refer -l of sercom.py)
+    #          data   - data sent/received
+    #          cmd    - command data belongs to (for capture index)
+    #          sentry - index of sentry which ended the response, if any,
+    #                   CapTimedOut if it timed-out
+    # Return : None
+    def logio (self, tag, data, cmd="", sentry=None) :
+        if self.logger : self.logger.io (tag, data)
+        if self.capture : self.capture.write (tag[0], tag[1], data, cmd, sentry)
+    # Write msg to console and log file (if open)
+    # Usage  : slogprint (msg)
+    # Return : None
+    def slogprint (self, msg) :
+        self.logmsg ("***SERCOM: " + msg + "\n")
+        self.write ("***SERCOM: " + msg + "\n\n")
+        self.flush ()
+    # Recv full response before 'RespTout' seconds
+    # Usage  : recv (RespTout)
+    #          RespTout   - Response timeout value for this session, an overall
+    #                       deadline (a trickle of data doesn't extend it)
+    # Return : On Success - False, "String buffer with Rx data",
+    #                       (SentryIdx, EoR), FirstRx, nRx
+    #          On Failure - True, "Incomplete String buffer Rx data", None,
+    #                       FirstRx, nRx
+    #          SentryIdx is the index of the sentry which ended the response
+    #          and EoR is the byte offset in the response right after that
+    #          sentry. FirstRx is MonoTime of first byte received (None if
+    #          none) and nRx is number of bytes received
+    def recv (self, RespTout) :
+        BlkSz = self.conf.rxblks
+        nRx = 0
+        FirstRx = None
+        RxTimedOut = False
+        Sentry = None
+        self.sentries.reset ()
+        # Response is timed-out if it's not complete by this deadline
+        deadline = MonoTime () + RespTout
+        while 1 :
+            remaining = deadline - MonoTime ()
+            # Break the loop if reception timed-out
+            if remaining <= 0 : RxTimedOut = True; break
+            # Sleep till data arrives or there's no time left for response
+            if WaitSerialRx (self.port, remaining) == 0 : continue
+            # Keep at least a block of free space in rx buffer before reading
+            if len (self.rxbuf) - nRx < BlkSz :
+                self.rxbuf.extend (bytearray (max (len (self.rxbuf), BlkSz)))
+            nBytes = RecvSerialData (self.port, memoryview (self.rxbuf)[nRx:])
+            if nBytes == 0 : continue
+            if nRx == 0 : FirstRx = MonoTime ()
+            nRx += nBytes
+            # Break if response has (any of) the sentry string(s)
+            # Only the new chunk (plus sentry tail overlap) is scanned here
+            Sentry = self.sentries.scan (self.rxbuf, nRx)
+            if Sentry : break
+        # Decode the response just once, now that it's complete
+        Resp = memoryview (self.rxbuf)[:nRx]
+        if gPyVer != 2 : Resp = self.rxdecoder.decode (Resp)
+        else : Resp = Resp.tobytes ()
+        return RxTimedOut, Resp, Sentry, FirstRx, nRx
+    # Get response timeout of a command
+    # Usage  : timeout (Cmd)
+    #          Cmd - Command string
+    # Return : timeout in seconds (refer rstout/cmtout/adtout in sample.conf)
+    def timeout (self, Cmd) :
+        Tout = self.rsptout
+        # Longest matching command prefix wins
+        Key = Cmd.upper ()
+        Best = ""
+        for Prefix in self.cmdtouts :
+            if len (Prefix) > len (Best) and Key.startswith (Prefix) :
+                Best = Prefix
+        if Best : Tout = self.cmdtouts[Best]
+        # Learn from this command's responses so far in this session
+        Stats = self.stats.cmds.get (Cmd) if self.conf.adtout else None
+        if Stats and Stats.tts.count >= AdaptMinResps :
+            Tout = min (Tout, max (AdaptMinTout, \
+                    self.conf.adtout * Stats.tts.quantile (0.99)))
+        return Tout
+    # Handle a Command-Response session
+    # Usage  : command (Cmd, CmdSrc, Tout)
+    #          Cmd        - Command string
+    #          CmdSrc     - refer cmd_src_types
+    #          Tout       - response timeout in seconds, None for the
+    #                       configured one (refer timeout())
+    # Return : String buffer containing Serial data received
+    def command (self, Cmd, CmdSrc, Tout=None) :
+        _cmd, Cmd, RespTout = self.CmdBegin (Cmd, CmdSrc, Tout)
+        # Own the serial port for this session, so URC rx loop keeps off it
+        self.portlock.acquire ()
+        try :
+            TxTime = MonoTime ()
+            ret = SendSerialData (self.port, Cmd)
+            if ret < 0 :
+                self.slogprint ("Serial Write Timeout")
+                self.timedout = True; self.iterfail = True
+                return ''
+            Rx = self.recv (RespTout)
+        finally : self.portlock.release ()
+        return self.CmdEnd (_cmd, CmdSrc, RespTout, TxTime, ret, Rx)
+    # Start a Command-Response session: echo and log the command
+    # Usage  : CmdBegin (Cmd, CmdSrc, Tout)
+    #          Cmd        - Command string
+    #          CmdSrc     - refer cmd_src_types
+    #          Tout       - response timeout, None for the configured one
+    # Return : Cmd, Cmd to send (with CR), response timeout
+    def CmdBegin (self, Cmd, CmdSrc, Tout=None) :
+        # TODO make generic for linux CLI and AT modem interfaces - handle CRLFs
+        _cmd = Cmd
+        Cmd = Cmd + "\r"
+        RespTout = Tout if Tout is not None else self.timeout (_cmd)
+        self.urcseq = self.urcs.seq
+        if CmdSrc == SCmd and not self.soak : self.write (Cmd + "\n")
+        self.logio (["A", "M"][CmdSrc] + "O", Cmd, _cmd)
+        return _cmd, Cmd, RespTout
+    # Finish a Command-Response session: record, route URCs, log and show
+    # the response
+    # Usage  : CmdEnd (Cmd, CmdSrc, RespTout, TxTime, nTx, Rx)
+    #          Cmd        - Command string (without CR)
+    #          CmdSrc     - refer cmd_src_types
+    #          RespTout   - response timeout the command had
+    #          TxTime     - MonoTime the command was sent at
+    #          nTx        - number of bytes sent
+    #          Rx         - what recv() returned
+    # Return : String buffer containing Serial data received
+    def CmdEnd (self, Cmd, CmdSrc, RespTout, TxTime, nTx, Rx) :
+        RxTime = MonoTime ()
+        RxTimedOut, Resp, Sentry, FirstRx, nRx = Rx
+        self.timedout = RxTimedOut
+        CmdSrcID = ["A", "M"][CmdSrc]
+        self.stats.record (Cmd, FirstRx - TxTime if FirstRx else None, \
+                None if RxTimedOut else RxTime - TxTime, nTx, nRx, \
+                Sentry[0] if Sentry else None)
+        if not Sentry or Sentry[0] != 0 : self.iterfail = True
+        # URCs received along with response are not part of it, route them
+        Resp = self.urcs.filter (Resp, Cmd)
+        if RxTimedOut == True :
+            self.slogprint ("'" + Cmd + "' Timed-out with no/incomplete " + \
+                    "response in " + str (RespTout) + " seconds")
+            # Keep whatever was received, to debug the time-out
+            self.logio (CmdSrcID + "I", Resp, Cmd, CapTimedOut)
+        elif len (Resp) != 0 :
+            # With echo off, only the <CR><LF> framing of AT responses
+            if self.echo : Resp = StripStartOfString (Resp)
+            elif Resp[:2] == "\r\n" : Resp = Resp[2:]
+            self.logio (CmdSrcID + "I", Resp, Cmd, \
+                    Sentry[0] if Sentry else None)
+            # Soak mode shows summaries instead of scom responses
+            if CmdSrc == MCmd or not self.soak : self.write (Resp)
+        self.flush ()
+        if self.soak : self.SoakTick ()
+        return Resp
+    # Handle a Command-Response session, yielding the response as it arrives
+    # instead of returning it at the end. Sentries are checked on the stream
+    # and only a window of it (sentry tail overlap, refer SentryMatcher) is
+    # kept, so memory stays bounded however long the response is
+    # Usage  : for Piece in stream (Cmd, CmdSrc, Tout, Lines) : ...
+    #          Cmd        - Command string
+    #          CmdSrc     - refer cmd_src_types, default SCmd
+    #          Tout       - response timeout, None for the configured one
+    #          Lines      - True (default) to yield decoded lines, without
+    #                       command echo and URCs (a line longer than
+    #                       StreamMaxLine comes in pieces), False to yield raw
+    #                       byte blocks as received
+    # Return : generator of response pieces, self.timedout tells if response
+    #          timed-out once it's exhausted. Serial port is owned by the
+    #          generator till it's exhausted or closed
+    def stream (self, Cmd, CmdSrc=SCmd, Tout=None, Lines=True) :
+        _cmd, Cmd, RespTout = self.CmdBegin (Cmd, CmdSrc, Tout)
+        CmdSrcID = ["A", "M"][CmdSrc]
+        self.portlock.acquire ()
+        try :
+            TxTime = MonoTime ()
+            nTx = SendSerialData (self.port, Cmd)
+            if nTx < 0 :
+                self.slogprint ("Serial Write Timeout")
+                self.timedout = True; self.iterfail = True
+                return
+            RxBuf = memoryview (self.rxbuf)
+            Decoder = codecs.getincrementaldecoder ("utf-8") (errors="replace")
+            # Sentry scan window, holding stream bytes from offset WinBase on
+            Win = bytearray ()
+            WinBase = 0
+            Partial = ""
+            Echo = True
+            nRx = 0
+            FirstRx = None
+            Sentry = None
+            RxTimedOut = False
+            self.sentries.reset ()
+            deadline = MonoTime () + RespTout
+            while Sentry is None :
+                remaining = deadline - MonoTime ()
+                if remaining <= 0 : RxTimedOut = True; break
+                if WaitSerialRx (self.port, remaining) == 0 : continue
+                nBytes = RecvSerialData (self.port, RxBuf)
+                if nBytes == 0 : continue
+                if nRx == 0 : FirstRx = MonoTime ()
+                Blk = RxBuf[:nBytes].tobytes ()
+                nRx += nBytes
+                # Drop what next scan won't look at, then scan the new block
+                Drop = self.sentries.resume () - WinBase
+                if Drop > 0 : del Win[:Drop]; WinBase += Drop
+                Win += Blk
+                Sentry = self.sentries.scan (Win, nRx, WinBase)
+                SentryIdx = Sentry[0] if Sentry else None
+                if not Lines :
+                    self.logio (CmdSrcID + "I", Blk, _cmd, SentryIdx)
+                    yield Blk
+                    continue
+                if gPyVer != 2 : Text = Partial + Decoder.decode (Blk)
+                else : Text = Partial + Blk
+                # Hold back the partial last line, unless response is complete
+                Pieces = Text.split ("\n")
+                Partial = Pieces.pop ()
+                Pieces = [p + "\n" for p in Pieces]
+                if Partial and (Sentry or len (Partial) > StreamMaxLine) :
+                    Pieces.append (Partial); Partial = ""
+                # Command echo is the first line (as in StripStartOfString),
+                # with echo off it's the <CR><LF> framing of AT responses
+                if Echo and Pieces :
+                    if self.echo or Pieces[0] in ("\r\n", "\n") :
+                        Pieces.pop (0)
+                    Echo = False
+                Pieces = [p for p in Pieces if not self.urcs.dispatch (p, _cmd)]
+                if not Pieces : continue
+                Out = "".join (Pieces)
+                self.logio (CmdSrcID + "I", Out, _cmd, SentryIdx)
+                if CmdSrc == MCmd or not self.soak : self.write (Out)
+                self.flush ()
+                for Piece in Pieces : yield Piece
+            # Loop ends with a partial line only on time-out, which is
+            # marked on it, or on an empty record if nothing is left
+            if RxTimedOut :
+                if Echo : Partial = ""
+                self.logio (CmdSrcID + "I", Partial, _cmd, CapTimedOut)
+            if Partial :
+                if CmdSrc == MCmd or not self.soak : self.write (Partial)
+                yield Partial
+        finally : self.portlock.release ()
+        self.timedout = RxTimedOut
+        self.stats.record (_cmd, FirstRx - TxTime if FirstRx else None, \
+                None if RxTimedOut else MonoTime () - TxTime, nTx, nRx, \
+                Sentry[0] if Sentry else None)
+        if not Sentry or Sentry[0] != 0 : self.iterfail = True
+        if RxTimedOut : self.slogprint ("'" + _cmd + "' Timed-out with " + \
+                "no/incomplete response in " + str (RespTout) + " seconds")
+        self.flush ()
+        if self.soak : self.SoakTick ()
+    # Send a file over the serial port at line rate (refer
+    # sercomlib/xfer.py) and report its throughput
+    # Usage  : sendfile (Path, Proto)
+    #          Path  - file to send
+    #          Proto - raw (default), xmodem, xmodem1k or ymodem
+    # Return : (bytes sent, seconds), raises XferError on failure
+    #          Recorded in stats as command 'scom_sendfile <file-name>',
+    #          a failure as its time-out
+    def sendfile (self, Path, Proto="raw") :
+        Name = os.path.basename (Path)
+        Err = None
+        nSent = 0
+        Start = MonoTime ()
+        self.portlock.acquire ()
+        try :
+            fh = open (Path, "rb")
+            Size = os.fstat (fh.fileno ()).st_size
+            self.slogprint ("Sending " + Path + " (" + str (Size) + \
+                    " bytes, " + Proto + ")")
+            try : nSent = XferSend (self.port, fh, Name, Size, Proto)
+            finally : fh.close ()
+        except XferError as e : Err = e
+        except (IOError, OSError, serial.SerialException) as e :
+            Err = XferError (str (e))
+        finally : self.portlock.release ()
+        Secs = MonoTime () - Start
+        self.stats.record ("scom_sendfile " + Name, None, \
+                None if Err else Secs, nSent, 0, None)
+        if Err :
+            self.iterfail = True
+            self.slogprint ("Sending " + Name + " failed - " + str (Err))
+            raise Err
+        Rate = nSent / max (Secs, 1e-6)
+        Msg = "Sent " + str (nSent) + " bytes in " + \
+                "%.2f seconds, %.0f bytes/s" % (Secs, Rate)
+        if self.port.baudrate : Msg += " (%.0f%% of %d baud line rate)" % \
+                (100 * Rate / LineRate (self.conf, self.port.baudrate), \
+                self.port.baudrate)
+        self.slogprint (Msg)
+        return nSent, Secs
+    # Send a scom/manual command, its response is shown/logged as it arrives
+    # if self.streamed, else once it's complete
+    # Usage  : RunCmd (Cmd, CmdSrc)
+    # Return : None
+    def RunCmd (self, Cmd, CmdSrc) :
+        if not self.streamed : self.command (Cmd, CmdSrc); return
+        for Piece in self.stream (Cmd, CmdSrc) : pass
+    # Show and log a URC as soon as it's received
+    # Usage  : ShowUrc (line)
+    # Return : None
+    def ShowUrc (self, line) :
+        self.logio ("UI", line)
+        self.write (line + "\n")
+        self.flush ()
+    # Thread: receive data while no command is in flight and route the
+    # URCs in it (refer self.urcs)
+    def UrcRxLoop (self) :
+        SerialPort = self.port
+        RxBuf = bytearray (self.conf.rxblks)
+        Decoder = codecs.getincrementaldecoder ("utf-8") (errors="replace")
+        while self.urcalive :
+            try :
+                if WaitSerialRx (SerialPort, 0.5) == 0 : continue
+                # A session owns the data waiting now; wait till it's done
+                if not self.portlock.acquire (False) :
+                    self.portlock.acquire (); self.portlock.release ()
+                    continue
+                try :
+                    nBytes = 0
+                    if SerialPort.in_waiting :
+                        nBytes = RecvSerialData (SerialPort, memoryview (RxBuf))
+                finally : self.portlock.release ()
+            except (serial.SerialException, OSError, ValueError, TypeError) :
+                break # serial port closed/gone
+            if nBytes == 0 : continue
+            Data = RxBuf[:nBytes]
+            if gPyVer != 2 : Data = Decoder.decode (bytes (Data))
+            else : Data = str (Data)
+            # Anything that's not a URC is shown/logged as is
+            for line in self.urcs.feed (Data) :
+                self.logio ("UI", line)
+                self.write (line)
+            self.flush ()
+    # Start URC rx loop thread if not yet running
+    # Usage  : StartUrcRx ()
+    # Return : None
+    def StartUrcRx (self) :
+        if self.urcthread : return
+        self.urcalive = True
+        self.urcthread = threading.Thread (target=self.UrcRxLoop)
+        self.urcthread.daemon = True
+        self.urcthread.start ()
+    # Wait for a URC from scom
+    # Usage  : WaitForUrc (Tout, Pat)
+    #          Tout - max time in seconds to wait
+    #          Pat  - URC line prefix to wait for
+    # Return : URC line, None if timed-out
+    def WaitForUrc (self, Tout, Pat) :
+        # URC must be routed for us to see it
+        if not self.urcs.match (Pat) : self.urcs.register (Pat, self.ShowUrc)
+        self.StartUrcRx ()
+        Seq, Urc = self.urcs.wait (Pat, Tout, self.urcseq)
+        # A URC is waited for only once
+        if Urc is not None : self.urcseq = Seq
+        if Urc is None : self.slogprint ("'" + Pat + "' URC not received in " \
+                + str (Tout) + " seconds")
+        return Urc
+    # Controlled loop for handling manual commands from stdin, till
+    # scom_break is entered
+    # Usage  : manual ()
+    # Return : None
+    def manual (self) :
+        while 1 :
+            Cmd = ReadConsoleInput ("")
+            if len (Cmd) == 0 : continue
+            elif Cmd[0:10] == "scom_break" : break
+            elif Cmd[0:11] == "scom_enscom" :
+                arg = SkipToNextWord (Cmd, 11)
+                try : Prog = CompileScom (arg)
+                except ScomError as e :
+                    self.slogprint (str (e) + \
+                            "\nContinuing in Manual Cmd mode..")
+                    continue
+                self.RunScomStack ([Prog])
+            else :
+                # Not Manual-mode control command, send to modem
+                self.RunCmd (Cmd, MCmd)
+    # Run compiled scom instructions (refer sercomlib/scomc.py)
+    # Usage  : RunScomInstrs (Instrs, ScomPath)
+    #          Instrs     - instruction list of a scom file or of a loop in it
+    #          ScomPath   - path of the scom file Instrs belong to
+    # Return : True if scom_break was hit (leave current scom file), else False
+    def RunScomInstrs (self, Instrs, ScomPath) :
+        for Instr in Instrs :
+            Op = Instr[0]
+            if Op == SOP_CMD :
+                # Not scom command, send to modem and get response
+                self.RunCmd (Instr[1], SCmd)
+            elif Op == SOP_SLEEP : time.sleep (Instr[1])
+            elif Op == SOP_WAITURC : self.WaitForUrc (Instr[1], Instr[2])
+            elif Op == SOP_LOOP :
+                if self.RunScomLoop (Instr, ScomPath) : return True
+            elif Op == SOP_SCOM :
+                self.slogprint ("Switching to child scom: " + Instr[1])
+                self.RunScomFile (Instr)
+                self.slogprint ("Continuing mother scom: " + ScomPath)
+            elif Op == SOP_BREAK : return True
+            elif Op == SOP_ENMAN :
+                if not self.manualen :
+                    self.slogprint ("Manual mode not available, " + \
+                            "ignoring scom_enman")
+                    continue
+                self.slogprint ("Switching to Manual mode")
+                self.manual ()
+                # At this point, Manual mode ends by 'break', continue normally
+            elif Op == SOP_TIMEOUT :
+                if Instr[2] : self.cmdtouts[Instr[2].upper ()] = Instr[1]
+                else : self.rsptout = Instr[1]
+            elif Op == SOP_SENDFILE :
+                # Failure is reported (and counted as a time-out), go on
+                try : self.sendfile (Instr[1], Instr[2])
+                except XferError : pass
+            elif Op == SOP_EXPECT :
+                raise SessionError ("Need to update!")
+        return False
+    # Run a scom loop, iterations starting every period seconds if it has
+    # one (refer LoopSchedule)
+    # Usage  : RunScomLoop (Instr, ScomPath)
+    #          Instr      - (SOP_LOOP, iters, instrs, period, where)
+    #          ScomPath   - path of the scom file loop is in
+    # Return : True if scom_break was hit (leave current scom file), else False
+    def RunScomLoop (self, Instr, ScomPath) :
+        # Let the loop begin! Crowd cheering Yaaaaaay
+        # If no iteration count specified (-1), loop indefinitely
+        Iters = Instr[1]
+        # Soak mode times every loop
+        Sched = LoopSchedule (Instr[3]) if Instr[3] or self.soak else None
+        try :
+            while Iters :
+                Iter = self.IterBegin (Sched)
+                try : Break = self.RunScomInstrs (Instr[2], ScomPath)
+                finally : Wait = self.IterEnd (Instr[4], Sched, Iter)
+                if Break : return True
+                Iters -= 1
+                if Iters and Wait : time.sleep (Wait)
+        finally :
+            if Sched : self.LoopReport (Instr[4], Sched)
+        return False
+    # Start a loop iteration: track its failures apart from the enclosing
+    # iteration's and, in soak mode, hold back capture of an outermost one
+    # Usage  : IterBegin (Sched)
+    #          Sched - LoopSchedule of the loop, None if not timed
+    # Return : (enclosing iteration's iterfail, lateness), for IterEnd
+    def IterBegin (self, Sched) :
+        Iter = (self.iterfail, Sched.begin () if Sched else 0.0)
+        self.iterfail = False
+        if self.soak and self.capture and not self.loopdepth :
+            self.capture.hold ()
+        self.loopdepth += 1
+        return Iter
+    # End a loop iteration started by IterBegin: record it and, in soak
+    # mode, keep capture of an outermost one only if it failed
+    # Usage  : IterEnd (Where, Sched, Iter)
+    #          Where - "scomfile:line" of the loop
+    # Return : seconds to wait till next iteration is due
+    def IterEnd (self, Where, Sched, Iter) :
+        self.loopdepth -= 1
+        Failed = self.iterfail
+        # A failure fails the enclosing iteration too
+        self.iterfail = Iter[0] or Failed
+        # Iteration's timing record goes with its capture
+        Wait = self.LoopTick (Where, Sched, Iter[1], Failed) if Sched else 0
+        if self.soak and not self.loopdepth :
+            if self.capture : self.capture.release (Failed)
+            self.soakiters += 1
+            self.soakfails += Failed
+        if self.soak : self.SoakTick ()
+        return Wait
+    # Record a timed loop iteration that just ended, log its timing and
+    # report an overrun
+    # Usage  : LoopTick (Where, Sched, Late, Failed)
+    #          Where  - "scomfile:line" of the loop
+    #          Sched  - LoopSchedule of the loop
+    #          Late   - what Sched.begin () returned for the iteration
+    #          Failed - True if a command in the iteration failed
+    # Return : seconds to wait till next iteration is due
+    def LoopTick (self, Where, Sched, Late, Failed=False) :
+        Busy, Wait, Overrun, Missed = Sched.end ()
+        self.stats.RecordLoop (Where, Sched.period, Busy, Late, Overrun, \
+                Missed, Failed)
+        self.logmsg ("***SERCOM: loop %s #%d late %.1fms busy %.1fms%s%s" % \
+                (Where, Sched.iters, Late * 1000, Busy * 1000, \
+                " OVERRUN" if Overrun else "", " FAILED" if Failed else ""))
+        if Overrun : self.LoopMsg ("Loop " + Where + " iteration " + \
+                str (Sched.iters) + " overran its " + str (Sched.period) + \
+                " second period (%.3f seconds)" % Busy + \
+                (", skipping " + str (Missed) + " due" if Missed else ""))
+        return Wait
+    # Show and log a loop message, soak mode only logs it (its summary
+    # counts overruns)
+    def LoopMsg (self, msg) :
+        if self.soak : self.logmsg ("***SERCOM: " + msg + "\n")
+        else : self.slogprint (msg)
+    # Report iteration timing of a timed loop when it ends
+    # Usage  : LoopReport (Where, Sched)
+    # Return : None
+    def LoopReport (self, Where, Sched) :
+        if not Sched.iters : return
+        Every = " every " + str (Sched.period) + " seconds" if Sched.period \
+                else ""
+        Msg = "Loop " + Where + Every + ": " + str (Sched.iters) + \
+                " iterations, busy max %.1fms" % (Sched.busymax * 1000)
+        if Sched.period : Msg += ", late max %.1fms, " % (Sched.latemax * \
+                1000) + str (Sched.overruns) + " overruns, " + \
+                str (Sched.missed) + " missed"
+        self.LoopMsg (Msg)
+    # Enter soak mode: scom responses aren't shown (they're still logged),
+    # a summary line is shown every Secs seconds instead, and with capture,
+    # only failing outermost loop iterations are kept in it
+    # Usage  : StartSoak (Secs, StatsFile)
+    #          Secs      - summary interval in seconds
+    #          StatsFile - export statistics to it with every summary (refer
+    #                      RunStats.export), None for no export
+    # Return : None
+    def StartSoak (self, Secs, StatsFile=None) :
+        self.soak = Secs
+        self.soakfile = StatsFile
+        self.soakstart = MonoTime ()
+        self.soaknext = self.soakstart + Secs
+        # Outermost loop iterations run and failed
+        self.soakiters = 0
+        self.soakfails = 0
+    # Show soak summary if it's due
+    # Usage  : SoakTick ()
+    # Return : None
+    def SoakTick (self) :
+        if MonoTime () < self.soaknext : return
+        self.slogprint (self.SoakSummary ())
+        if self.soakfile :
+            try : self.stats.export (self.soakfile)
+            except (IOError, OSError) as e :
+                self.slogprint ("Unable to write statistics to " + \
+                        self.soakfile + ": " + str (e))
+        # Next one is due a whole interval from now, not in a burst
+        self.soaknext = MonoTime () + self.soak
+    # Get soak summary line: run time, iterations, commands, time-outs,
+    # error responses, loop overruns, response time quantiles of all
+    # commands and peak memory use
+    # Usage  : SoakSummary ()
+    # Return : string
+    def SoakSummary (self) :
+        Secs = int (MonoTime () - self.soakstart)
+        nCmds = nTouts = nErrs = 0
+        Tts = Histogram ()
+        for St in self.stats.cmds.values () :
+            nCmds += St.count
+            nTouts += St.timeouts
+            nErrs += sum (n for i, n in St.sentries.items () if i != 0)
+            Tts.merge (St.tts)
+        nOverruns = sum (St.overruns for St in self.stats.loops.values ())
+        Msg = "SOAK %dd%02d:%02d:%02d " % (Secs // 86400, Secs // 3600 % \
+                24, Secs // 60 % 60, Secs % 60) + str (self.soakiters) + \
+                " iterations (" + str (self.soakfails) + " failed), " + \
+                str (nCmds) + " commands, " + str (nTouts) + " timed-out, " + \
+                str (nErrs) + " error responses"
+        if nOverruns : Msg += ", " + str (nOverruns) + " loop overruns"
+        if Tts.count : Msg += ", response p50/p99 %.1f/%.1fms" % \
+                (Tts.quantile (0.5) * 1000, Tts.quantile (0.99) * 1000)
+        if resource : Msg += ", max RSS %.1fMB" % (resource.getrusage ( \
+                resource.RUSAGE_SELF).ru_maxrss / RssPerMB)
+        return Msg
+    # Run a compiled scom file
+    # Usage  : RunScomFile (Prog)
+    #          Prog       - (SOP_SCOM, path, instrs) from CompileScom
+    # Return : None
+    def RunScomFile (self, Prog) :
+        if self.RunScomInstrs (Prog[2], Prog[1]) : reason = "scom_break"
+        else : reason = "EOF"
+        self.slogprint (reason + " on " + os.path.basename (Prog[1]))
+    # Run compiled scom files sequentially
+    # Usage  : RunScomStack (ScomStack)
+    #          ScomStack  - Stack of compiled Scom files for this scom session
+    # Return : None
+    def RunScomStack (self, ScomStack) :
+        while ScomStack != [] :
+            self.RunScomFile (ScomStack.pop ())
+            if ScomStack != [] : self.slogprint ("Continuing mother scom: " + \
+                    ScomStack[-1][1])
+        self.slogprint ("Exiting scom mode")
+#}
+
+# Sercom session for library use, e.g. by a test suite which reuses one open
+# and validated port across thousands of test cases. Unlike SercomSession
+# (as used by sercom.py), it's quiet by default, open() also validates the
+# port, send_command() raises CommandTimeout on a timed-out command and it
+# can be used as a context manager:
+#   with Session ("/dev/ttyUSB0", "sample.conf") as s :
+#       Resp = s.send_command ("AT+CSQ")
+#       s.run_scom ("example.scom")
+class Session (SercomSession) : #{
+    """ Sercom session as a library: open, send_command, run_scom, close """
+    # Manual mode reads stdin, not for library use
+    manualen = False
+    # Setup session on class instantiation, call open() to open the port
+    # Usage  : Session (portid, conf, out, logfile, logmax, capfile)
+    #          Same as SercomSession, except out defaults to None (quiet)
+    def __init__ (self, portid, conf, out=None, logfile=None, logmax=0, \
+            capfile=None) :
+        SercomSession.__init__ (self, portid, conf, out, logfile, logmax, \
+                capfile)
+    # Open, configure and validate the serial port
+    # Usage  : open (validate)
+    #          validate - check scvcmd gets scvrsp (default True)
+    # Return : None, raises SessionError if port can't be opened/validated
+    def open (self, validate=True) :
+        SercomSession.open (self)
+        if validate and not self.validate () :
+            self.close ()
+            raise SessionError ("Basic " + self.conf.scvcmd + "-" + \
+                    self.conf.scvrsp + " session failed")
+    # Send a command and get its response
+    # Usage  : send_command (Cmd, Tout)
+    #          Cmd  - Command string (without CR)
+    #          Tout - response timeout in seconds, None for the configured
+    #                 one (rstout/cmtout/adtout/scom_timeout)
+    # Return : response (without the command echo), raises CommandTimeout
+    #          (partial response in its resp) if it timed-out
+    def send_command (self, Cmd, Tout=None) :
+        Resp = self.command (Cmd, SCmd, Tout)
+        if self.timedout :
+            raise CommandTimeout (Cmd, Resp, Tout if Tout is not None \
+                    else self.timeout (Cmd))
+        return Resp
+    # Send a command and get its response as it arrives (refer stream())
+    # Usage  : for Line in stream_command (Cmd, Tout, lines) : ...
+    #          lines - True to get lines, False to get raw byte blocks
+    # Return : generator of response lines/blocks, raises CommandTimeout
+    #          (with no resp, response isn't kept) at the end if timed-out
+    def stream_command (self, Cmd, Tout=None, lines=True) :
+        for Piece in self.stream (Cmd, SCmd, Tout, lines) : yield Piece
+        if self.timedout :
+            raise CommandTimeout (Cmd, "", Tout if Tout is not None \
+                    else self.timeout (Cmd))
+    # Send a file over the serial port (refer sendfile())
+    # Usage  : send_file (path, proto)
+    #          proto - raw (default), xmodem, xmodem1k or ymodem
+    # Return : (bytes sent, seconds), raises XferError on failure
+    def send_file (self, path, proto="raw") :
+        return self.sendfile (path, proto)
+    # Run a scom file; command time-outs don't stop it (refer stats)
+    # Usage  : run_scom (Scom)
+    #          Scom - scom file path, or compiled scom from CompileScom
+    # Return : None, raises ScomError on a bad scom file
+    def run_scom (self, Scom) :
+        if not isinstance (Scom, tuple) : Scom = CompileScom (Scom)
+        self.RunScomFile (Scom)
+    # Context manager: open (if not yet) on entry, close on exit
+    def __enter__ (self) :
+        if self.port is None : self.open ()
+        return self
+    def __exit__ (self, *exc) :
+        self.close ()
+        return False
+#}
@@ -0,0 +1,145 @@
+# Asynchronous batched session logger
+#
+# Logging from the command/response path must not cost a repr(), a
+# strftime() and a file write between sending a command and receiving its
+# response. AsyncLogger only timestamps and queues a record on the caller's
+# side; a background writer thread formats queued records, writes them in
+# batches and flushes on batch size or on time. The log line format is the
+# same as sercom's logging.basicConfig one:
+#   <Mon> <DD> <HH:MM:SS> <message>
+# e.g. May 27 14:24:50 [AO] 'AT\r'
+# Optionally the log file is rotated by size (file.1, file.2 ... file.N).
+# The queue is bounded: if the disk can't keep up, records beyond qmax are
+# dropped (and the count logged) rather than growing memory without bound.
+
+import os
+import sys
+import time
+import atexit
+import threading
+
+if sys.version_info[0] == 2 : import Queue as queue; LogEnc = {}
+else : import queue; LogEnc = {"encoding" : "utf-8"}
+
+class AsyncLogger : #{
+    """ Queue backed logger with a batching background writer thread """
+    # Log file name
+    filename = ""
+    # Rotate log file when it grows beyond this many bytes, 0 never rotates
+    maxbytes = 0
+    # Number of rotated log files to keep
+    backups = 9
+    # Max number of records written per batch
+    batch = 256
+    # Max seconds a record may wait in queue before it's flushed to file
+    flushint = 0.5
+    # Max number of records waiting to be written
+    qmax = 65536
+    # Open log file and start writer thread on class instantiation
+    def __init__ (self, filename, maxbytes=0, backups=9, batch=256, \
+            flushint=0.5) :
+        self.filename = filename
+        self.maxbytes = maxbytes
+        self.backups = backups
+        self.batch = batch
+        self.flushint = flushint
+        self.fh = open (filename, "w", **LogEnc)
+        self.size = 0
+        self.q = queue.Queue (maxsize=self.qmax)
+        # Records dropped as queue was full, and how many of them are
+        # already reported in the log
+        self.dropped = 0
+        self.reported = 0
+        # strftime cache: records in the same second share timestamp string
+        self.lastsec = -1
+        self.laststamp = ""
+        self.closed = False
+        self.writer = threading.Thread (target=self.WriterLoop)
+        self.writer.daemon = True
+        self.writer.start ()
+        atexit.register (self.close)
+    # Queue a message to be logged as is
+    # Usage  : debug (msg)
+    # Return : None
+    def debug (self, msg) :
+        self.put ((time.time (), None, msg))
+    # Queue serial IO data, formatted as "[tag] repr(data)" by writer thread
+    # Usage  : io (tag, data)
+    #          tag  - IO tag, e.g. AO, AI, MO, MI, UI
+    #          data - data sent/received
+    # Return : None
+    def io (self, tag, data) :
+        self.put ((time.time (), tag, data))
+    # Queue a record, dropping it if the queue is full or logger is closed
+    def put (self, rec) :
+        if self.closed : return
+        try : self.q.put_nowait (rec)
+        except queue.Full : self.dropped += 1
+    # Flush all queued records to file, stop writer thread and close file
+    # Usage  : close ()
+    # Return : None
+    def close (self) :
+        if self.closed : return
+        self.closed = True
+        self.q.put (None)
+        self.writer.join ()
+        self.fh.close ()
+    # Format a queued record into a log line
+    def FormatRecord (self, rec) :
+        ts, tag, data = rec
+        sec = int (ts)
+        if sec != self.lastsec :
+            self.lastsec = sec
+            self.laststamp = time.strftime ("%b %d %H:%M:%S", \
+                    time.localtime (sec))
+        if tag is None : return self.laststamp + " " + data + "\n"
+        return self.laststamp + " [" + tag + "] " + repr (data) + "\n"
+    # Write a batch of log lines to file, rotating it if needed
+    def WriteBatch (self, lines) :
+        if self.dropped != self.reported :
+            lines.append (self.laststamp + " ***SERCOM: Log queue full, " + \
+                    str (self.dropped - self.reported) + \
+                    " record(s) dropped\n")
+            self.reported = self.dropped
+        buf = "".join (lines)
+        # Rotation size is in bytes, not characters
+        nbytes = len (buf.encode ("utf-8")) if sys.version_info[0] != 2 \
+                else len (buf)
+        if self.maxbytes and self.size and \
+                self.size + nbytes > self.maxbytes :
+            self.Rotate ()
+        self.fh.write (buf)
+        self.fh.flush ()
+        self.size += nbytes
+    # Rotate log file: file -> file.1 -> file.2 ... -> file.backups
+    def Rotate (self) :
+        self.fh.close ()
+        for i in range (self.backups - 1, 0, -1) :
+            src = self.filename + "." + str (i)
+            if os.path.exists (src) :
+                dst = self.filename + "." + str (i + 1)
+                if os.path.exists (dst) : os.remove (dst)
+                os.rename (src, dst)
+        if self.backups > 0 :
+            dst = self.filename + ".1"
+            if os.path.exists (dst) : os.remove (dst)
+            os.rename (self.filename, dst)
+        self.fh = open (self.filename, "w", **LogEnc)
+        self.size = 0
+    # Writer thread: batch queued records and flush on size or time
+    def WriterLoop (self) :
+        lines = []
+        due = None
+        while 1 :
+            timeout = None if due is None else max (0, due - time.time ())
+            try : rec = self.q.get (True, timeout)
+            except queue.Empty : rec = False
+            if rec : lines.append (self.FormatRecord (rec))
+            if lines and due is None : due = time.time () + self.flushint
+            if lines and (rec is None or rec is False or \
+                    len (lines) >= self.batch or time.time () >= due) :
+                self.WriteBatch (lines)
+                lines = []
+                due = None
+            if rec is None : break
+#}
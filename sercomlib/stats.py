@@ -0,0 +1,328 @@
+# Per-command run statistics
+#
+# Every Command-Response session is recorded with its time to first byte
+# (ttfb), time to sentry (tts, i.e. full response), bytes out/in and the
+# sentry that ended it (or a time-out). Records are aggregated per command
+# string into log-bucketed histograms, which use bounded memory however long
+# the run is and give quantiles within HistRelErr relative error.
+# Aggregates can be printed as a summary table, or exported as JSON or as a
+# Prometheus textfile (node_exporter textfile collector format).
+# Iterations of fixed-rate scom loops (scom_loopbegin period=), and of all
+# loops in soak mode, are recorded the same way, per loop, with their busy
+# time, start lateness, overruns and failures.
+
+import os
+import math
+import json
+import tempfile
+
+# Histogram bucket i holds values in (HistGamma^(i-1), HistGamma^i]
+HistRelErr = 0.02
+HistGamma = (1 + HistRelErr) / (1 - HistRelErr)
+HistLogGamma = math.log (HistGamma)
+# Prometheus histogram bucket bounds in seconds
+PromBuckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, \
+        2.5, 5, 10, 20, 60]
+
+class Histogram : #{
+    """ Log-bucketed histogram of positive values with quantile queries """
+    # Create an empty histogram on class instantiation
+    def __init__ (self) :
+        # {bucket-index: count}, only buckets in use are kept
+        self.buckets = {}
+        # Count of values <= 0
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+    # Add a value
+    # Usage  : add (value)
+    # Return : None
+    def add (self, value) :
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min : self.min = value
+        if self.max is None or value > self.max : self.max = value
+        if value <= 0 : self.zeros += 1; return
+        i = int (math.ceil (math.log (value) / HistLogGamma))
+        self.buckets[i] = self.buckets.get (i, 0) + 1
+    # Merge another histogram into this one
+    # Usage  : merge (other)
+    # Return : None
+    def merge (self, other) :
+        for i, n in other.buckets.items () :
+            self.buckets[i] = self.buckets.get (i, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        for v in (other.min, other.max) :
+            if v is None : continue
+            if self.min is None or v < self.min : self.min = v
+            if self.max is None or v > self.max : self.max = v
+    # Get value at quantile q (0..1), None if histogram is empty
+    # Usage  : quantile (q)
+    # Return : value within HistRelErr of the exact quantile
+    def quantile (self, q) :
+        if not self.count : return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen : return 0.0
+        for i in sorted (self.buckets) :
+            seen += self.buckets[i]
+            if rank < seen :
+                v = 2 * HistGamma ** i / (HistGamma + 1)
+                return min (max (v, self.min), self.max)
+        return self.max
+    # Get count of values <= bound (a bucket counts if its representative
+    # value, as used by quantile(), is <= bound)
+    # Usage  : CountLE (bound)
+    # Return : cumulative count
+    def CountLE (self, bound) :
+        n = self.zeros
+        for i, c in self.buckets.items () :
+            if 2 * HistGamma ** i / (HistGamma + 1) <= bound : n += c
+        return n
+    # Summary of histogram as a dict
+    # Usage  : summary (scale)
+    #          scale - multiply values by this e.g. 1000 for ms
+    # Return : dict of count, mean, min, p50, p95, p99, max
+    def summary (self, scale=1) :
+        if not self.count : return {"count" : 0}
+        res = {"count" : self.count, "mean" : self.sum * scale / self.count, \
+                "min" : self.min * scale, "max" : self.max * scale}
+        for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)) :
+            res[name] = self.quantile (q) * scale
+        return res
+#}
+
+class CmdStats : #{
+    """ Aggregated statistics of one command string """
+    def __init__ (self) :
+        # Number of Command-Response sessions and time-outs among them
+        self.count = 0
+        self.timeouts = 0
+        # Time to first byte and time to sentry, in seconds
+        self.ttfb = Histogram ()
+        self.tts = Histogram ()
+        # Bytes received per response
+        self.rxbytes = Histogram ()
+        self.bytesout = 0
+        self.bytesin = 0
+        # {sentry-index: count} of sentries which ended responses
+        self.sentries = {}
+#}
+
+class LoopStats : #{
+    """ Aggregated iteration timing of one scom loop """
+    def __init__ (self, period) :
+        self.period = period
+        self.iters = 0
+        # Iterations with a failed command (refer SercomSession.iterfail)
+        self.fails = 0
+        # Iterations ending after the next one was due, and iteration start
+        # times dropped as they were a whole period or more behind
+        self.overruns = 0
+        self.missed = 0
+        # Seconds each iteration was busy for, and started after it was due
+        self.busy = Histogram ()
+        self.late = Histogram ()
+#}
+
+class RunStats : #{
+    """ Per-command statistics of a sercom run """
+    # Create empty statistics on class instantiation
+    def __init__ (self) :
+        # {command: CmdStats}
+        self.cmds = {}
+        # {"scomfile:line": LoopStats} of loops
+        self.loops = {}
+    # Record a Command-Response session
+    # Usage  : record (cmd, ttfb, tts, nout, nin, sentry)
+    #          cmd    - command string
+    #          ttfb   - seconds from send to first response byte, None if
+    #                   nothing was received
+    #          tts    - seconds from send to sentry, None if timed-out
+    #          nout   - bytes sent
+    #          nin    - bytes received
+    #          sentry - index of sentry which ended the response, None if
+    #                   timed-out
+    # Return : None
+    def record (self, cmd, ttfb, tts, nout, nin, sentry) :
+        st = self.cmds.get (cmd)
+        if st is None : st = self.cmds[cmd] = CmdStats ()
+        st.count += 1
+        if ttfb is not None : st.ttfb.add (ttfb)
+        if tts is None : st.timeouts += 1
+        else : st.tts.add (tts)
+        st.rxbytes.add (nin)
+        st.bytesout += nout
+        st.bytesin += nin
+        if sentry is not None :
+            st.sentries[sentry] = st.sentries.get (sentry, 0) + 1
+    # Record an iteration of a scom loop
+    # Usage  : RecordLoop (where, period, busy, late, overrun, missed, failed)
+    #          where   - "scomfile:line" of scom_loopbegin
+    #          period  - seconds between iteration starts, 0 if not fixed
+    #          busy    - seconds the iteration ran for
+    #          late    - seconds it started after it was due
+    #          overrun - True if it ended after the next one was due
+    #          missed  - iteration starts dropped after it
+    #          failed  - True if a command in it failed
+    # Return : LoopStats of the loop
+    def RecordLoop (self, where, period, busy, late, overrun, missed, \
+            failed=False) :
+        st = self.loops.get (where)
+        if st is None : st = self.loops[where] = LoopStats (period)
+        st.iters += 1
+        st.busy.add (busy)
+        st.late.add (late)
+        st.overruns += overrun
+        st.missed += missed
+        st.fails += failed
+        return st
+    # Get loop statistics as a JSON-able dict, times in milliseconds
+    # Usage  : LoopsDict ()
+    # Return : {"scomfile:line": {period_ms, iterations, overruns, ...}}
+    def LoopsDict (self) :
+        res = {}
+        for where, st in self.loops.items () :
+            res[where] = {"period_ms" : st.period * 1000, \
+                    "iterations" : st.iters, "failed" : st.fails, \
+                    "overruns" : st.overruns, \
+                    "missed" : st.missed, "busy_ms" : st.busy.summary (1000), \
+                    "late_ms" : st.late.summary (1000)}
+        return res
+    # Get statistics as a JSON-able dict, times in milliseconds
+    # Usage  : todict ()
+    # Return : {command: {count, timeouts, ttfb_ms, tts_ms, ...}}
+    def todict (self) :
+        res = {}
+        for cmd, st in self.cmds.items () :
+            res[cmd] = {"count" : st.count, "timeouts" : st.timeouts, \
+                    "ttfb_ms" : st.ttfb.summary (1000), \
+                    "tts_ms" : st.tts.summary (1000), \
+                    "rx_bytes" : st.rxbytes.summary (), \
+                    "bytes_out" : st.bytesout, "bytes_in" : st.bytesin, \
+                    "sentries" : dict ((str (k), v) for k, v in \
+                            st.sentries.items ())}
+        return res
+    # Get a text summary table, slowest (p95 time to sentry) command first,
+    # followed by a table of loops, if any
+    # Usage  : SummaryText ()
+    # Return : multi-line string
+    def SummaryText (self) :
+        fmt = "{0:<24} {1:>7} {2:>5} {3:>9} {4:>9} {5:>9} {6:>9} {7:>9}"
+        lines = [fmt.format ("Command", "Count", "T/O", "ttfb-p50", \
+                "tts-p50", "tts-p95", "tts-p99", "tts-max"), \
+                "  (times in ms)"]
+        ms = lambda v : "-" if v is None else "%.2f" % (v * 1000)
+        order = sorted (self.cmds.items (), key=lambda kv : \
+                -(kv[1].tts.quantile (0.95) or 0))
+        for cmd, st in order :
+            name = cmd if len (cmd) <= 24 else cmd[:21] + "..."
+            lines.append (fmt.format (name, st.count, st.timeouts, \
+                    ms (st.ttfb.quantile (0.5)), ms (st.tts.quantile (0.5)), \
+                    ms (st.tts.quantile (0.95)), ms (st.tts.quantile (0.99)), \
+                    ms (st.tts.max)))
+        if not self.loops : return "\n".join (lines)
+        fmt = "{0:<18} {1:>7} {2:>5} {3:>5} {4:>5} {5:>9} {6:>9} {7:>9} " + \
+                "{8:>9}"
+        lines += ["", fmt.format ("Loop", "Iters", "Fail", "Over", "Miss", \
+                "period", "busy-p50", "busy-max", "late-max"), \
+                "  (times in ms)"]
+        for where, st in sorted (self.loops.items ()) :
+            lines.append (fmt.format (where[-18:], st.iters, st.fails, \
+                    st.overruns, st.missed, ms (st.period), \
+                    ms (st.busy.quantile (0.5)), ms (st.busy.max), \
+                    ms (st.late.max)))
+        return "\n".join (lines)
+    # Get statistics in Prometheus text exposition format
+    # Usage  : PromText ()
+    # Return : multi-line string
+    def PromText (self) :
+        out = []
+        def metric (name, kind, hlp) :
+            out.append ("# HELP " + name + " " + hlp)
+            out.append ("# TYPE " + name + " " + kind)
+        def label (cmd) :
+            return cmd.replace ("\\", "\\\\").replace ("\"", "\\\"") \
+                    .replace ("\n", "\\n")
+        def histogram (name, lbl, h) :
+            for le in PromBuckets :
+                out.append (name + "_bucket{" + lbl + ",le=\"" + \
+                        str (le) + "\"} " + str (h.CountLE (le)))
+            out.append (name + "_bucket{" + lbl + ",le=\"+Inf\"} " + \
+                    str (h.count))
+            out.append (name + "_sum{" + lbl + "} " + repr (h.sum))
+            out.append (name + "_count{" + lbl + "} " + str (h.count))
+        cmds = sorted (self.cmds.items ())
+        for name, attr, hlp in ( \
+                ("sercom_cmd_total", "count", "Command-Response sessions"), \
+                ("sercom_cmd_timeouts_total", "timeouts", \
+                        "Sessions timed-out with no/incomplete response"), \
+                ("sercom_cmd_bytes_out_total", "bytesout", "Bytes sent"), \
+                ("sercom_cmd_bytes_in_total", "bytesin", "Bytes received")) :
+            metric (name, "counter", hlp)
+            for cmd, st in cmds :
+                out.append (name + "{cmd=\"" + label (cmd) + "\"} " + \
+                        str (getattr (st, attr)))
+        metric ("sercom_cmd_sentry_total", "counter", \
+                "Responses ended by each sentry")
+        for cmd, st in cmds :
+            for k, v in sorted (st.sentries.items ()) :
+                out.append ("sercom_cmd_sentry_total{cmd=\"" + label (cmd) + \
+                        "\",sentry=\"" + str (k) + "\"} " + str (v))
+        for name, attr, hlp in ( \
+                ("sercom_cmd_ttfb_seconds", "ttfb", "Time to first byte"), \
+                ("sercom_cmd_tts_seconds", "tts", "Time to sentry")) :
+            metric (name, "histogram", hlp)
+            for cmd, st in cmds :
+                histogram (name, "cmd=\"" + label (cmd) + "\"", \
+                        getattr (st, attr))
+        if not self.loops : return "\n".join (out) + "\n"
+        loops = sorted (self.loops.items ())
+        for name, kind, attr, hlp in ( \
+                ("sercom_loop_period_seconds", "gauge", "period", \
+                        "Seconds between iteration starts of scom loop"), \
+                ("sercom_loop_iterations_total", "counter", "iters", \
+                        "Iterations of scom loop"), \
+                ("sercom_loop_failed_total", "counter", "fails", \
+                        "Iterations with a failed command"), \
+                ("sercom_loop_overruns_total", "counter", "overruns", \
+                        "Iterations ending after the next one was due"), \
+                ("sercom_loop_missed_total", "counter", "missed", \
+                        "Iteration starts dropped after overruns")) :
+            metric (name, kind, hlp)
+            for where, st in loops :
+                out.append (name + "{loop=\"" + label (where) + "\"} " + \
+                        str (getattr (st, attr)))
+        for name, attr, hlp in ( \
+                ("sercom_loop_busy_seconds", "busy", "Iteration run time"), \
+                ("sercom_loop_late_seconds", "late", \
+                        "Iteration start time after it was due")) :
+            metric (name, "histogram", hlp)
+            for where, st in loops :
+                histogram (name, "loop=\"" + label (where) + "\"", \
+                        getattr (st, attr))
+        return "\n".join (out) + "\n"
+    # Write statistics to a file, Prometheus textfile if name ends with
+    # .prom, JSON otherwise. File is replaced atomically, so a collector
+    # never reads it half written
+    # Usage  : export (filename)
+    # Return : None
+    def export (self, filename) :
+        if filename.endswith (".prom") : text = self.PromText ()
+        else :
+            res = self.todict ()
+            # Not a command, scom_ lines never go to the modem
+            if self.loops : res["scom_loops"] = self.LoopsDict ()
+            text = json.dumps (res, indent=2, sort_keys=True)
+        fd, tmp = tempfile.mkstemp (dir=os.path.dirname (os.path.abspath ( \
+                filename)))
+        fh = os.fdopen (fd, "w")
+        os.chmod (tmp, 0o644)
+        fh.write (text)
+        fh.close ()
+        getattr (os, "replace", os.rename) (tmp, filename)
+#}
@@ -0,0 +1,305 @@
+# Non-serial transports - targets driven over ssh, a subprocess or TCP
+#
+# A session talks to its target through a handle with the serial port
+# interface sercom uses (pollable fd, in_waiting, read/write/flush, refer
+# RecvSerialData/WaitSerialRx in session.py), so commands, sentries, URCs and
+# scom files work the same over any of them. Instead of a serial device, the
+# port id names the transport:
+#   ssh://[user@]host[:port][/command] - ssh to host, running its login
+#                                        shell (or command) on a pty
+#   tcp://host:port                    - raw TCP socket, e.g. a terminal
+#                                        server or ser2net ([addr] for an
+#                                        IPv6 address, e.g. tcp://[::1]:23)
+#   exec:<command line>                - local command on a pty, e.g.
+#                                        exec:adb shell
+# All are non-blocking fds driven by select(), so a response is taken as
+# soon as it arrives. ssh sessions to a host share one connection (OpenSSH
+# ControlMaster), kept for SshPersist seconds after its last session ends,
+# so only the first session to a host pays for connect and authentication.
+# ssh and exec need POSIX (pty and select on pipes).
+
+import os
+import errno
+import select
+import shlex
+import socket
+import struct
+import hashlib
+import threading
+import subprocess
+import serial
+from sercomlib.scomc import ScomCacheDir
+
+if os.name == "posix" :
+    import pty
+    import fcntl
+    import termios
+
+# Port id prefixes of the transports
+TransportPrefixes = ["ssh://", "tcp://", "exec:"]
+# Seconds to connect (TCP) or for an ssh login to show its first output
+ConnectTout = 10.0
+# Seconds output must stay quiet for a new session's banner (login
+# messages, prompt) to be taken as complete
+SettleTout = 0.3
+# Seconds a shared ssh connection outlives its last session
+SshPersist = 600
+# Seconds a closing subprocess is given to exit before it's killed
+ExitTout = 2.0
+
+class TransportError (Exception) :
+    """ Transport couldn't be opened, message tells the cause """
+    pass
+
+# Function to check if a port id names a transport instead of a serial port
+# Usage  : IsTransport (portid)
+# Return : True for ssh://, tcp:// and exec: port ids
+def IsTransport (portid) :
+    for prefix in TransportPrefixes :
+        if portid.startswith (prefix) : return True
+    return False
+
+class FdTransport : #{
+    """ Serial port-like handle over a non-blocking fd """
+    # Transports have no baud rate (autobd doesn't apply to them)
+    baudrate = None
+    # Setup on class instantiation
+    # Usage  : FdTransport (name, fd, timeout, write_timeout)
+    #          name          - port id, for messages
+    #          fd            - connected fd, made non-blocking
+    #          timeout       - seconds read() waits for data (rdtout)
+    #          write_timeout - seconds write() may make no progress (wrtout)
+    def __init__ (self, name, fd, timeout, write_timeout) :
+        self.port = name
+        self.fd = fd
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self.is_open = True
+        fcntl.fcntl (fd, fcntl.F_SETFL, fcntl.fcntl (fd, fcntl.F_GETFL) | \
+                os.O_NONBLOCK)
+        # Output received while waiting for a new session to settle (refer
+        # settle())
+        self.banner = b""
+    def fileno (self) :
+        return self.fd
+    # Number of bytes waiting to be read
+    @property
+    def in_waiting (self) :
+        try :
+            return struct.unpack ("i", fcntl.ioctl (self.fd, \
+                    termios.FIONREAD, b"\0\0\0\0"))[0]
+        except (IOError, OSError) : return 0
+    # Read upto nbytes, waiting upto self.timeout for them to start arriving
+    # Return : bytes read, b"" if timed-out
+    def read (self, nbytes=1) :
+        rl, wl, el = select.select ([self.fd], [], [], self.timeout)
+        if not rl : return b""
+        try : data = os.read (self.fd, nbytes)
+        except OSError as e :
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK) : return b""
+            raise serial.SerialException (self.port + ": " + str (e))
+        if not data :
+            raise serial.SerialException (self.port + ": connection closed")
+        return data
+    # Write all of data, as the other end takes it
+    # Return : number of bytes written, raises serial.SerialTimeoutException
+    #          if a write makes no progress for self.write_timeout seconds
+    def write (self, data) :
+        sent = 0
+        while sent < len (data) :
+            try : n = os.write (self.fd, data[sent:])
+            except OSError as e :
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK) :
+                    raise serial.SerialException (self.port + ": " + str (e))
+                n = 0
+            if n : sent += n; continue
+            rl, wl, el = select.select ([], [self.fd], [], self.write_timeout)
+            if not wl : raise serial.SerialTimeoutException ("Write timeout")
+        return sent
+    # Nothing is buffered on this side
+    def flush (self) :
+        pass
+    # Discard whatever has been received and not read yet
+    def reset_input_buffer (self) :
+        while 1 :
+            try : data = os.read (self.fd, 65536)
+            except OSError : return
+            if not data : return
+    # Wait for a new session's banner (login messages, prompt) to arrive
+    # and keep it aside, so that it isn't taken as a command's response
+    # Usage  : settle (first)
+    #          first - seconds to wait for the first output
+    # Return : False if the other end hung up, else True
+    def settle (self, first) :
+        tout = first
+        while 1 :
+            rl, wl, el = select.select ([self.fd], [], [], tout)
+            if not rl : return True
+            try : data = os.read (self.fd, 65536)
+            except OSError as e :
+                return e.errno in (errno.EAGAIN, errno.EWOULDBLOCK)
+            if not data : return False
+            self.banner += data
+            tout = SettleTout
+    def close (self) :
+        if not self.is_open : return
+        self.is_open = False
+        os.close (self.fd)
+#}
+
+class ExecTransport (FdTransport) : #{
+    """ A local command run on a pty, driven like a serial port """
+    # Setup on class instantiation, the command is started on a new pty
+    # Usage  : ExecTransport (name, argv, timeout, write_timeout, first)
+    #          argv  - command and its arguments
+    #          first - seconds to wait for its first output (refer settle())
+    #          Raises TransportError if it can't be started or exits at once
+    def __init__ (self, name, argv, timeout, write_timeout, first=0) :
+        if os.name != "posix" :
+            raise TransportError (name + ": needs a POSIX system (pty)")
+        master, slave = pty.openpty ()
+        # Raw pty, so that data passes as is and only the command (or what
+        # it runs, e.g. a remote shell) echoes input
+        attr = termios.tcgetattr (slave)
+        attr[3] &= ~(termios.ECHO | termios.ICANON)
+        termios.tcsetattr (slave, termios.TCSANOW, attr)
+        try :
+            self.proc = subprocess.Popen (argv, stdin=slave, stdout=slave, \
+                    stderr=slave, close_fds=True, start_new_session=True)
+        except (IOError, OSError) as e :
+            os.close (master); os.close (slave)
+            raise TransportError (name + ": unable to run " + argv[0] + \
+                    " - " + str (e))
+        os.close (slave)
+        FdTransport.__init__ (self, name, master, timeout, write_timeout)
+        # A command failing at once (e.g. ssh can't connect) hangs up
+        if not self.settle (first or SettleTout) :
+            try : self.proc.wait (ExitTout)
+            except subprocess.TimeoutExpired : pass
+        if self.proc.poll () is not None :
+            self.close ()
+            raise TransportError (name + ": " + argv[0] + " exited (" + \
+                    str (self.proc.returncode) + ") - " + \
+                    self.banner.decode ("utf-8", "replace").strip ())
+    # Close the pty and end the command, killing it if it doesn't exit
+    def close (self) :
+        if not self.is_open : return
+        FdTransport.close (self)
+        # Closing the pty hangs the command up
+        try : self.proc.wait (ExitTout)
+        except subprocess.TimeoutExpired : self.proc.kill (); self.proc.wait ()
+#}
+
+# Locks serialising the first ssh sessions to a host, so that one becomes
+# the shared connection and the others wait to use it (refer SshTransport)
+SshHostLocks = {}
+SshHostLocksLock = threading.Lock ()
+
+# Function to get the ssh ControlPath shared by sessions to a host
+# Usage  : SshCtlPath (dest, port)
+#          dest - [user@]host
+#          port - ssh port, None for default
+# Return : socket path (short, Unix socket paths are limited to ~100 bytes)
+def SshCtlPath (dest, port) :
+    key = dest + ":" + str (port)
+    return os.path.join (ScomCacheDir, "ssh-" + \
+            hashlib.sha1 (key.encode ("utf-8")).hexdigest ()[:16])
+
+class SshTransport (ExecTransport) : #{
+    """ A login shell (or command) on a host over ssh, on a pty """
+    # Setup on class instantiation, connecting to the host
+    # Usage  : SshTransport (name, dest, port, command, timeout, write_timeout)
+    #          dest    - [user@]host
+    #          port    - ssh port, None for default
+    #          command - remote command, None for login shell
+    #          Raises TransportError if ssh fails
+    def __init__ (self, name, dest, port, command, timeout, write_timeout) :
+        ctlpath = SshCtlPath (dest, port)
+        argv = ["ssh", "-tt", "-o", "ControlMaster=auto", "-o", \
+                "ControlPath=" + ctlpath, "-o", "ControlPersist=" + \
+                str (SshPersist), "-o", "ConnectTimeout=" + \
+                str (int (ConnectTout)), "-o", "ServerAliveInterval=15"]
+        if port : argv += ["-p", str (port)]
+        argv.append (dest)
+        if command : argv.append (command)
+        try :
+            if not os.path.isdir (ScomCacheDir) : os.makedirs (ScomCacheDir)
+        except OSError : pass
+        SshHostLocksLock.acquire ()
+        lock = SshHostLocks.setdefault (ctlpath, threading.Lock ())
+        SshHostLocksLock.release ()
+        # A login shell shows a prompt once connected; a command may show
+        # nothing till it gets input, so it only gets the banner settle time
+        first = ConnectTout if not command else 0
+        # No shared connection yet, this session makes it while others
+        # to the host wait, and then use it
+        if os.path.exists (ctlpath) : lock = None
+        else :
+            lock.acquire ()
+            if os.path.exists (ctlpath) : lock.release (); lock = None
+        try :
+            ExecTransport.__init__ (self, name, argv, timeout, \
+                    write_timeout, first)
+        finally :
+            if lock : lock.release ()
+#}
+
+class TcpTransport (FdTransport) : #{
+    """ A raw TCP connection, driven like a serial port """
+    # Setup on class instantiation, connecting to host:port
+    # Usage  : TcpTransport (name, host, port, timeout, write_timeout)
+    #          Raises TransportError if it can't connect
+    def __init__ (self, name, host, port, timeout, write_timeout) :
+        try :
+            self.sock = socket.create_connection ((host, port), ConnectTout)
+        except (socket.error, OSError) as e :
+            raise TransportError (name + ": unable to connect - " + str (e))
+        # Commands are small, send them right away
+        self.sock.setsockopt (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setblocking (False)
+        FdTransport.__init__ (self, name, self.sock.fileno (), timeout, \
+                write_timeout)
+    def close (self) :
+        if not self.is_open : return
+        self.is_open = False
+        self.sock.close ()
+#}
+
+# Function to parse an ssh:// or tcp:// port id (refer file header)
+# Usage  : ParsePortId (portid)
+# Return : ("ssh" or "tcp", [user@]host, port or None, command or None),
+#          raises TransportError if it's malformed
+def ParsePortId (portid) :
+    prefix, sep, rest = portid.partition ("//")
+    dest, sep, path = rest.partition ("/")
+    user, at, hostport = dest.rpartition ("@")
+    # IPv6 address is in brackets if a port follows, e.g. [::1]:23
+    if hostport.startswith ("[") :
+        host, sep, port = hostport[1:].partition ("]")
+        if not sep or port and port[0] != ":" : host = ""
+        port = port[1:]
+    elif hostport.count (":") > 1 : host, port = hostport, ""
+    else : host, sep, port = hostport.partition (":")
+    try : port = int (port) if port else None
+    except ValueError : host = ""
+    if not host or prefix not in ("ssh:", "tcp:") :
+        raise TransportError ("Bad host[:port] - " + portid)
+    if prefix == "tcp:" and (port is None or path or at) :
+        raise TransportError ("Need tcp://host:port - " + portid)
+    return prefix[:-1], user + at + host, port, path or None
+
+# Function to open the transport a port id names (refer file header)
+# Usage  : OpenTransport (portid, conf)
+#          conf - PortConfig, rdtout and wrtout apply
+# Return : transport handle, raises TransportError on failure
+def OpenTransport (portid, conf) :
+    if portid.startswith ("exec:") :
+        try : argv = shlex.split (portid[5:])
+        except ValueError : argv = None
+        if not argv : raise TransportError ("Bad command - " + portid)
+        return ExecTransport (portid, argv, conf.rdtout, conf.wrtout)
+    kind, host, port, command = ParsePortId (portid)
+    if kind == "tcp" :
+        return TcpTransport (portid, host, port, conf.rdtout, conf.wrtout)
+    return SshTransport (portid, host, port, command, conf.rdtout, \
+            conf.wrtout)
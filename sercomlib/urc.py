@@ -0,0 +1,165 @@
+# Unsolicited result code (URC) demultiplexer
+#
+# Modems send URCs (+CREG:, RING, #WLANSCAN ...) at any time, either while
+# the port is idle or mixed into the response of an unrelated command.
+# UrcDemux keeps a registry of URC patterns and routes every received line
+# matching one of them to its callback, or to a bounded queue if it was
+# registered without one, so that command/response matching never sees it.
+
+import re
+import time
+import threading
+import collections
+
+# Monotonic clock for wait deadlines (not there in python 2)
+MonoTime = getattr (time, "monotonic", time.time)
+
+# AT command name, e.g. +CREG of AT+CREG? or AT+CREG=2
+AtNameRule = re.compile (r"\s*(?:AT)?([^=?;]*)")
+
+# Function to get names of the AT commands in a command line
+# Usage  : AtCmdNames (cmd)
+#          cmd - command line, upper case; concatenated commands (;) each
+#                give a name
+# Return : list of names e.g. ["+CSQ", "+CREG"] for AT+CSQ;+CREG?
+def AtCmdNames (cmd) :
+    return [AtNameRule.match (c).group (1).strip () for c in cmd.split (";")]
+
+class UrcDemux : #{
+    """ Registry of URC patterns routing URC lines to callbacks/queue """
+    # Registered (pattern, key, callback) tuples in registration order
+    urcs = []
+    # Max number of queued URCs and recent URCs remembered for wait()
+    qlen = 256
+    # Partial (not yet '\n' terminated) line from feed()
+    partial = ""
+    # Setup empty registry on class instantiation
+    def __init__ (self, qlen=256) :
+        self.urcs = []
+        self.qlen = qlen
+        self.queue = collections.deque (maxlen=qlen)
+        self.recent = collections.deque (maxlen=qlen)
+        self.seq = 0
+        self.cond = threading.Condition ()
+        self.partial = ""
+    # Register a URC pattern
+    # Usage  : register (pattern, callback)
+    #          pattern  - line prefix string (e.g. "+CREG:") or compiled regex
+    #                     matched against a line without its line endings
+    #          callback - function called as callback (line) for every URC
+    #                     matching pattern; if None, URCs are queued for get()
+    # Return : None
+    def register (self, pattern, callback=None) :
+        if isinstance (pattern, str) :
+            # Key is used to tell a solicited response from a URC, e.g.
+            # '+CREG: 0,1' is the response of 'AT+CREG?', not a URC
+            key = pattern.strip ().rstrip (":").upper ()
+        else : key = None
+        self.urcs.append ((pattern, key, callback))
+    # Unregister all registrations of a URC pattern
+    # Usage  : unregister (pattern)
+    # Return : None
+    def unregister (self, pattern) :
+        self.urcs = [u for u in self.urcs if u[0] != pattern]
+    # Find the registration a line matches
+    # Usage  : match (line, cmd)
+    #          line - line to check (line endings are ignored)
+    #          cmd  - command in flight, its own responses never match
+    # Return : matching (pattern, key, callback) tuple or None
+    def match (self, line, cmd="") :
+        line = line.strip ()
+        if not line : return None
+        names = AtCmdNames (cmd.upper ())
+        for urc in self.urcs :
+            pattern, key, callback = urc
+            if key is not None :
+                if not line.startswith (pattern.strip ()) : continue
+                if key and key in names : continue
+            elif not pattern.match (line) : continue
+            return urc
+        return None
+    # Route a line to its URC callback/queue if it's a URC
+    # Usage  : dispatch (line, cmd)
+    #          line - received line
+    #          cmd  - command in flight (refer match)
+    # Return : True if line was a URC and was routed, False otherwise
+    def dispatch (self, line, cmd="") :
+        urc = self.match (line, cmd)
+        if not urc : return False
+        line = line.strip ()
+        # Callback goes first, so that waiters see a URC already handled
+        if urc[2] is not None : urc[2] (line)
+        self.cond.acquire ()
+        self.seq += 1
+        self.recent.append ((self.seq, line))
+        if urc[2] is None : self.queue.append (line)
+        self.cond.notify_all ()
+        self.cond.release ()
+        return True
+    # Remove URC lines from a command response and route them
+    # Usage  : filter (resp, cmd)
+    #          resp - full response string of cmd
+    #          cmd  - command whose response this is
+    # Return : resp without URC lines
+    def filter (self, resp, cmd="") :
+        if not self.urcs : return resp
+        lines = resp.splitlines (True)
+        kept = []
+        for l in lines :
+            if not self.dispatch (l, cmd) : kept.append (l); continue
+            # URC framing is <CR><LF>URC<CR><LF>, drop its leading <CR><LF>
+            if kept and not kept[-1].strip () : kept.pop ()
+        if len (kept) == len (lines) : return resp
+        return "".join (kept)
+    # Feed data received while no command is in flight
+    # Usage  : feed (data)
+    #          data - received string, may end with a partial line
+    # Return : list of complete non-blank non-URC lines (to be shown as is)
+    def feed (self, data) :
+        lines = (self.partial + data).splitlines (True)
+        self.partial = ""
+        if lines and not lines[-1].endswith (("\n", "\r")) :
+            self.partial = lines.pop ()
+        return [l for l in lines if l.strip () and not self.dispatch (l)]
+    # Get a queued URC (of patterns registered without callback)
+    # Usage  : get (timeout)
+    #          timeout - max seconds to wait, None waits forever
+    # Return : URC line, None if timed-out
+    def get (self, timeout=None) :
+        if timeout is not None : deadline = MonoTime () + timeout
+        self.cond.acquire ()
+        try :
+            # Other URCs (e.g. routed to callbacks) wake us up too
+            while not self.queue :
+                if timeout is None : self.cond.wait (); continue
+                remaining = deadline - MonoTime ()
+                if remaining <= 0 : return None
+                self.cond.wait (remaining)
+            return self.queue.popleft ()
+        finally : self.cond.release ()
+    # Wait for a URC matching a pattern
+    # Usage  : wait (pattern, timeout, since)
+    #          pattern - line prefix string or compiled regex
+    #          timeout - max seconds to wait, None waits forever
+    #          since   - URCs routed after this seq (refer self.seq) match,
+    #                    e.g. ones routed from the response of the command
+    #                    sent before waiting; None for only new ones
+    # Return : (seq, URC line), (None, None) if timed-out
+    def wait (self, pattern, timeout=None, since=None) :
+        if isinstance (pattern, str) :
+            hit = lambda line : line.startswith (pattern.strip ())
+        else : hit = lambda line : pattern.match (line)
+        if timeout is not None : deadline = MonoTime () + timeout
+        self.cond.acquire ()
+        try :
+            seen = self.seq if since is None else since
+            while 1 :
+                for seq, line in self.recent :
+                    if seq > seen and hit (line) : return seq, line
+                seen = self.seq
+                if timeout is None : self.cond.wait (); continue
+                remaining = deadline - MonoTime ()
+                if remaining <= 0 : return None, None
+                self.cond.wait (remaining)
+        finally : self.cond.release ()
+#}
@@ -0,0 +1,260 @@
+# Virtual modem on a pseudo-terminal
+#
+# Stands in for a real modem so that sercom.py (-d <pty>) can be tested and
+# benchmarked without hardware. Commands are answered either from a
+# response table file or by replaying a recorded session (sercom -l log or
+# -b capture). Per-command latency, chunked responses, baud rate pacing and
+# injected URCs reproduce production timing locally.
+#
+# Response table file syntax (refer sample.vmt):
+#   [@latency-secs] <command> => <response>
+#   * => <response>      response to commands not in table
+#   \r and \n in response are treated as CR and LF
+# Command match is case insensitive. Like a real modem with echo enabled,
+# command characters are echoed back as they're received; ATE0/ATE1 turn
+# echo off/on. With a DTE rate set, the modem only understands the pty's
+# host side at that baud rate and AT+IPR=<rate> switches it (refer rate).
+
+import os
+import re
+import ast
+import time
+import random
+import select
+import termios
+import threading
+
+# Function to correct str with Esc-sequences \\r & \\n as \r & \n
+def VmRecodeEscSeq (s) :
+    return s.replace ("\\r", "\r").replace ("\\n", "\n")
+
+# Function to get the table key of a command
+def VmCmdKey (cmd) :
+    return cmd.strip ("\r\n").strip ().upper ()
+
+# Function to load a response table file
+# Usage  : LoadVmTable (path)
+#          path - response table file (refer syntax above)
+# Return : {command-key: [(latency, response)]}
+#          latency is None where not given in table (modem default applies)
+def LoadVmTable (path) :
+    table = {}
+    fh = open (path, "r")
+    for num, line in enumerate (fh) :
+        line = line.rstrip ("\r\n")
+        if not line.strip () or line[0] == '#' : continue
+        if " => " not in line :
+            fh.close ()
+            raise ValueError (path + ":" + str (num + 1) + ": Bad line - " \
+                    + line)
+        cmd, rsp = line.split (" => ", 1)
+        latency = None
+        m = re.match (r"@([0-9.]+)\s+(.*)$", cmd)
+        if m : latency = float (m.group (1)); cmd = m.group (2)
+        table.setdefault (VmCmdKey (cmd), []).append ((latency, \
+                VmRecodeEscSeq (rsp)))
+    fh.close ()
+    return table
+
+# Function to load a recorded session to replay
+# Usage  : LoadVmReplay (path)
+#          path - sercom -l log file or -b capture (.scap) file
+#                 Capture gives actual per-command latency, log doesn't
+# Return : {command-key: [(latency, response)]} in recorded order
+def LoadVmReplay (path) :
+    table = {}
+    pending = None
+    if path[-5:] == ".scap" :
+        from sercomlib.capture import CaptureReader
+        cap = CaptureReader (path)
+        for rec in cap.query (srcs="AM") :
+            if rec.dir == "O" : pending = (rec.data, rec.ts); continue
+            if rec.dir != "I" or pending is None : continue
+            table.setdefault (VmCmdKey (pending[0]), []).append ( \
+                    ((rec.ts - pending[1]) / 1e9, "\r\n" + rec.data))
+            pending = None
+        cap.close ()
+        return table
+    # [AO]/[MO] line is a command, next [AI]/[MI] line is its response
+    rule = re.compile (r"^\w+ +\d+ [\d:]+ \[([AM])([OI])\] (.*)$")
+    fh = open (path, "r")
+    for line in fh :
+        m = rule.match (line.rstrip ("\n"))
+        if not m : continue
+        try : data = ast.literal_eval (m.group (3))
+        except (ValueError, SyntaxError) : continue
+        if m.group (2) == "O" : pending = data; continue
+        if pending is None : continue
+        # sercom strips command echo line off the response when it logs it
+        table.setdefault (VmCmdKey (pending), []).append ((None, \
+                "\r\n" + data))
+        pending = None
+    fh.close ()
+    return table
+
+class VirtualModem : #{
+    """ Virtual modem answering commands on a pseudo-terminal """
+    # Slave side device of pty, give this to sercom.py -d
+    port = ""
+    # {command-key: [(latency, response)]}; multiple responses of a command
+    # are used in turn (cycling), e.g. to replay a loop
+    table = {}
+    # Response to a command not in table
+    default = "\r\nERROR\r\n"
+    # Default delay in seconds before responding to a command
+    latency = 0.0
+    # Send response in chunks of this many bytes (0 - in one go)
+    chunk = 0
+    # Delay in seconds between chunks
+    chunkgap = 0.0
+    # Emulated baud rate, paces output at ~10 bits per byte (0 - no pacing)
+    baud = 0
+    # Echo received command characters back (like ATE1)
+    echo = True
+    # DTE baud rate modem is at, data sent by the host at any other rate is
+    # garbled (0 - host's rate doesn't matter). AT+IPR accepts rates upto
+    # ratemax, and rates above ratebad (0 - none) garble some output bytes
+    rate = 0
+    ratemax = 921600
+    ratebad = 0
+    # Setup virtual modem on class instantiation, call start() to run it
+    def __init__ (self, table=None, default="\r\nERROR\r\n", latency=0.0, \
+            chunk=0, chunkgap=0.0, baud=0, echo=True) :
+        self.table = table if table is not None else {}
+        self.default = default
+        self.latency = latency
+        self.chunk = chunk
+        self.chunkgap = chunkgap
+        self.baud = baud
+        self.echo = echo
+        self.turn = {}
+        self.urcs = []
+        self.master = -1
+        self.slave = -1
+        self.alive = False
+        self.txlock = threading.Lock ()
+        self.threads = []
+        # Number of commands answered
+        self.ncmds = 0
+        self.newrate = 0
+    # Open the pty and start answering commands
+    # Usage  : start ()
+    # Return : slave device path of pty (same as self.port)
+    def start (self) :
+        import pty
+        import tty
+        self.master, self.slave = pty.openpty ()
+        tty.setraw (self.slave)
+        tty.setraw (self.master)
+        self.port = os.ttyname (self.slave)
+        self.alive = True
+        self.spawn (self.CmdLoop)
+        for period, urc in self.urcs : self.spawn (self.UrcLoop, period, urc)
+        return self.port
+    # Stop the modem and close the pty
+    # Usage  : stop ()
+    # Return : None
+    def stop (self) :
+        self.alive = False
+        for t in self.threads : t.join ()
+        self.threads = []
+        for fd in (self.master, self.slave) :
+            if fd >= 0 : os.close (fd)
+        self.master = self.slave = -1
+    # Inject a URC periodically (call before start)
+    # Usage  : AddUrc (period, urc)
+    #          period - seconds between URCs
+    #          urc    - URC text without CR/LF framing e.g. "+CREG: 1"
+    # Return : None
+    def AddUrc (self, period, urc) :
+        self.urcs.append ((period, urc))
+    # Inject a URC now
+    # Usage  : inject (urc)
+    # Return : None
+    def inject (self, urc) :
+        self.send ("\r\n" + urc + "\r\n")
+    def spawn (self, func, *args) :
+        t = threading.Thread (target=func, args=args)
+        t.daemon = True
+        t.start ()
+        self.threads.append (t)
+    # Baud rate host side of pty is set to, 0 if not a standard one
+    def HostRate (self) :
+        speed = termios.tcgetattr (self.slave)[5]
+        for name in dir (termios) :
+            if name[0] == "B" and name[1:].isdigit () and \
+                    getattr (termios, name) == speed :
+                return int (name[1:])
+        return 0
+    # Send data to the port, chunked and paced as configured
+    def send (self, data) :
+        if not isinstance (data, bytes) : data = data.encode ("utf-8")
+        if self.rate and self.ratebad and self.rate > self.ratebad :
+            # 1 in 50 bytes is lost to line errors
+            data = bytes (bytearray (b if random.random () >= 0.02 else \
+                    0xfe for b in bytearray (data)))
+        step = self.chunk if self.chunk > 0 else len (data)
+        self.txlock.acquire ()
+        try :
+            for i in range (0, len (data), max (step, 1)) :
+                part = data[i:i + step]
+                if self.baud : time.sleep (len (part) * 10.0 / self.baud)
+                os.write (self.master, part)
+                if self.chunkgap and i + step < len (data) :
+                    time.sleep (self.chunkgap)
+        except OSError : pass # pty closed
+        finally : self.txlock.release ()
+    # Find response (and its latency) for a command
+    def respond (self, cmd) :
+        key = VmCmdKey (cmd)
+        if key in ("ATE0", "ATE1") :
+            self.echo = key == "ATE1"
+            return None, "\r\nOK\r\n"
+        if self.rate and key.startswith ("AT+IPR=") :
+            try : rate = int (key[7:])
+            except ValueError : rate = 0
+            if rate <= 0 or rate > self.ratemax : return None, self.default
+            # New rate applies once this response is out
+            self.newrate = rate
+            return None, "\r\nOK\r\n"
+        rsps = self.table.get (key) or self.table.get ("*")
+        if not rsps : return None, self.default
+        # Use responses of a command in turn
+        n = self.turn.get (key, 0)
+        self.turn[key] = n + 1
+        return rsps[n % len (rsps)]
+    # Thread: receive commands and answer them
+    def CmdLoop (self) :
+        line = b""
+        while self.alive :
+            r, w, e = select.select ([self.master], [], [], 0.2)
+            if not r : continue
+            try : data = os.read (self.master, 4096)
+            except OSError : break
+            if not data : break
+            if self.rate and self.HostRate () != self.rate :
+                data = b"\xfe" * len (data)
+            if self.echo : self.send (data)
+            line += data
+            # AT commands end with CR, tolerate LF too
+            while 1 :
+                m = re.search (b"[\r\n]", line)
+                if not m : break
+                cmd = line[:m.start ()].decode ("utf-8", "replace")
+                line = line[m.end ():]
+                if not cmd.strip () : continue
+                latency, rsp = self.respond (cmd)
+                if latency is None : latency = self.latency
+                if latency > 0 : time.sleep (latency)
+                self.send (rsp)
+                self.ncmds += 1
+                if self.newrate : self.rate = self.newrate; self.newrate = 0
+    # Thread: inject a URC periodically
+    def UrcLoop (self, period, urc) :
+        due = time.time () + period
+        while self.alive :
+            remaining = due - time.time ()
+            if remaining > 0 : time.sleep (min (remaining, 0.2)); continue
+            self.inject (urc)
+            due += period
+#}
@@ -0,0 +1,202 @@
+# Serial bulk file transfer
+#
+# Sends a file over the serial port at line rate, either raw (as is) or with
+# XMODEM (128 byte blocks, CRC-16 or checksum), XMODEM-1K or YMODEM (1K
+# blocks with a file name/size header block) framing.
+# Unlike SendSerialData, which is meant for short commands, the file is read
+# and written in chunks and writes go to the port as fast as the serial
+# driver takes them: RTS/CTS or XON/XOFF flow control (refer flowct in
+# sample.conf) just holds the writes back and partial writes are continued.
+# Only a write making no progress for XferStallTout seconds fails the
+# transfer.
+
+import os
+import time
+import errno
+import select
+import struct
+import binascii
+
+# Transfer protocols (refer scom_sendfile)
+XferProtos = ["raw", "xmodem", "xmodem1k", "ymodem"]
+# Bytes read from file and written per chunk in raw transfer
+XferChunk = 4096
+# Seconds a write may make no progress (e.g. held by flow control)
+XferStallTout = 10.0
+# Seconds to wait for receiver to start XMODEM/YMODEM, and for it to
+# acknowledge a block; and tries per block
+XferStartTout = 60.0
+XferAckTout = 10.0
+XferRetries = 10
+
+# XMODEM/YMODEM control bytes
+SOH = b"\x01"
+STX = b"\x02"
+EOT = b"\x04"
+ACK = b"\x06"
+NAK = b"\x15"
+CAN = b"\x18"
+CRC = b"C"
+
+class XferError (Exception) :
+    """ File transfer failed, message tells the cause """
+    pass
+
+# Function to get line rate of a serial configuration
+# Usage  : LineRate (conf, baud)
+#          conf - PortConfig
+#          baud - baud rate port is at, None for conf's
+# Return : max payload bytes per second at the baud rate and conf's framing
+def LineRate (conf, baud=None) :
+    bits = 1 + conf.bytesz + (conf.parity != 'N') + conf.stpbit
+    return (baud or conf.baud) / float (bits)
+
+# Function to write all of data to serial port, continuing partial writes
+# Usage  : XferWrite (SerialPort, data)
+#          SerialPort - Serial Port Interface handle
+#          data       - bytes to write
+# Return : None, raises XferError if writes make no progress for
+#          XferStallTout seconds
+if os.name == "posix" :
+    # pyserial opens the port non-blocking, write to it as it drains
+    def XferWrite (SerialPort, data) :
+        sent = 0
+        while sent < len (data) :
+            try : n = os.write (SerialPort.fd, data[sent:])
+            except OSError as e :
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK) :
+                    raise XferError ("write failed - " + str (e))
+                n = 0
+            if n : sent += n; continue
+            # Output queue is full (or held by flow control), wait for room
+            rl, wl, el = select.select ([], [SerialPort.fd], [], \
+                    XferStallTout)
+            if not wl : raise XferError ("write stalled for " + \
+                    str (XferStallTout) + " seconds")
+else :
+    def XferWrite (SerialPort, data) :
+        Tout = SerialPort.write_timeout
+        SerialPort.write_timeout = XferStallTout
+        try : SerialPort.write (data)
+        except Exception as e : raise XferError ("write failed - " + str (e))
+        finally : SerialPort.write_timeout = Tout
+
+# Function to read a byte from serial port
+# Usage  : XferRead (SerialPort, timeout)
+# Return : byte read, b"" if timed-out
+def XferRead (SerialPort, timeout) :
+    deadline = time.time () + timeout
+    while 1 :
+        if SerialPort.in_waiting : return SerialPort.read (1)
+        remaining = deadline - time.time ()
+        if remaining <= 0 : return b""
+        if os.name == "posix" :
+            select.select ([SerialPort], [], [], remaining)
+        else : time.sleep (0.01)
+
+# Function to wait for receiver to ask for (next) XMODEM/YMODEM transfer
+# Usage  : XmodemWaitStart (SerialPort)
+# Return : True for CRC-16 mode ('C'), False for checksum mode (NAK)
+#          Raises XferError if receiver doesn't ask in time or cancels
+def XmodemWaitStart (SerialPort) :
+    deadline = time.time () + XferStartTout
+    while 1 :
+        # Anything else, e.g. response of the command starting the receiver,
+        # is skipped
+        b = XferRead (SerialPort, deadline - time.time ())
+        if b == CRC : return True
+        if b == NAK : return False
+        if b == CAN : raise XferError ("cancelled by receiver")
+        if not b : raise XferError ("receiver didn't start in " + \
+                str (XferStartTout) + " seconds")
+
+# Function to frame an XMODEM/YMODEM block
+# Usage  : XmodemBlock (num, data, size, crc, pad)
+#          num  - block number
+#          data - block payload, padded upto size with pad
+#          size - 128 or 1024
+#          crc  - CRC-16 (True) or checksum (False) trailer
+# Return : framed block bytes
+def XmodemBlock (num, data, size, crc, pad=b"\x1a") :
+    data = data + pad * (size - len (data))
+    head = (SOH if size == 128 else STX) + struct.pack ("BB", num & 0xff, \
+            0xff - (num & 0xff))
+    if crc : tail = struct.pack (">H", binascii.crc_hqx (data, 0))
+    else : tail = struct.pack ("B", sum (bytearray (data)) & 0xff)
+    return head + data + tail
+
+# Function to frame YMODEM block 0 - file name and size, it must fit in 1K
+# Usage  : YmodemHeader (name, size)
+# Return : framed block bytes, raises XferError if name is too long
+def YmodemHeader (name, size) :
+    hdr = name.encode ("utf-8") + b"\0" + str (size).encode ()
+    if len (hdr) > 1024 :
+        raise XferError ("file name too long for YMODEM header - " + name)
+    return XmodemBlock (0, hdr, 128 if len (hdr) < 128 else 1024, True, \
+            b"\0")
+
+# Function to send a framed block till receiver acknowledges it
+# Usage  : XmodemSendBlock (SerialPort, block)
+# Return : None, raises XferError after XferRetries tries or on cancel
+def XmodemSendBlock (SerialPort, block) :
+    for tries in range (XferRetries) :
+        XferWrite (SerialPort, block)
+        while 1 :
+            b = XferRead (SerialPort, XferAckTout)
+            if b == ACK : return
+            if b == CAN : raise XferError ("cancelled by receiver")
+            # NAK (or 'C' still asking to start) or time-out, send again
+            if b in (NAK, CRC, b"") : break
+    raise XferError ("block not acknowledged after " + str (XferRetries) \
+            + " tries")
+
+# Function to end an XMODEM/YMODEM file with EOT till it's acknowledged
+def XmodemSendEot (SerialPort) :
+    for tries in range (XferRetries) :
+        XferWrite (SerialPort, EOT)
+        b = XferRead (SerialPort, XferAckTout)
+        if b == ACK : return
+        if b == CAN : raise XferError ("cancelled by receiver")
+    raise XferError ("EOT not acknowledged")
+
+# Function to send a file over serial port
+# Usage  : XferSend (SerialPort, fh, name, size, proto)
+#          SerialPort - Serial Port Interface handle
+#          fh         - file opened for binary read
+#          name, size - file name (without directory) and size, YMODEM
+#                       header block tells them to the receiver
+#          proto      - one of XferProtos
+# Return : number of file bytes sent, raises XferError on failure
+def XferSend (SerialPort, fh, name, size, proto) :
+    nSent = 0
+    if proto == "raw" :
+        while 1 :
+            data = fh.read (XferChunk)
+            if not data : break
+            XferWrite (SerialPort, data)
+            nSent += len (data)
+        # Done only when it's all on the wire
+        SerialPort.flush ()
+        return nSent
+    if proto not in XferProtos :
+        raise XferError ("unknown transfer protocol - " + proto)
+    if proto == "ymodem" : hdr = YmodemHeader (name, size)
+    crc = XmodemWaitStart (SerialPort)
+    size1k = 128 if proto == "xmodem" else 1024
+    num = 1
+    if proto == "ymodem" :
+        # Receiver asks again for data after block 0
+        XmodemSendBlock (SerialPort, hdr)
+        crc = XmodemWaitStart (SerialPort)
+    while 1 :
+        data = fh.read (size1k)
+        if not data : break
+        XmodemSendBlock (SerialPort, XmodemBlock (num, data, size1k, crc))
+        nSent += len (data)
+        num += 1
+    XmodemSendEot (SerialPort)
+    if proto == "ymodem" :
+        # Empty block 0 ends the batch
+        XmodemWaitStart (SerialPort)
+        XmodemSendBlock (SerialPort, XmodemBlock (0, b"", 128, True, b"\0"))
+    return nSent
@@ -0,0 +1,42 @@
+# Tests of the asyncio session (sercomlib/aio.py) against a virtual modem
+
+import io
+import os
+import asyncio
+import unittest
+from sercomlib.portconf import PortConfig
+from sercomlib.vmodem import VirtualModem
+
+@unittest.skipIf (os.name != "posix", "needs a pty")
+class AioSessionTest (unittest.TestCase) : #{
+    def setUp (self) :
+        self.vm = VirtualModem ({"AT" : [(None, "\r\nOK\r\n")]})
+        self.vm.start ()
+        self.conf = PortConfig ()
+        self.conf.scvcmd = "AT"; self.conf.scvrsp = "OK"
+        self.conf.sentries = ["\r\nOK\r\n", "\r\nERROR\r\n"]
+        self.conf.urcpats = ["+CREG:"]
+    def tearDown (self) :
+        self.vm.stop ()
+    def test_validate_again (self) :
+        # Validating again doesn't route (show and log) URCs twice
+        from sercomlib.aio import AioSercomSession
+        out = io.StringIO ()
+        async def run () :
+            sess = AioSercomSession (self.vm.port, self.conf, out)
+            await sess.open ()
+            try :
+                self.assertTrue (await sess.validate ())
+                self.assertTrue (await sess.validate ())
+                self.vm.inject ("+CREG: 1")
+                await asyncio.sleep (0.3)
+                self.assertEqual (len (sess.urcs.urcs), 1)
+            finally : sess.close ()
+        loop = asyncio.new_event_loop ()
+        asyncio.set_event_loop (loop)
+        try : loop.run_until_complete (run ())
+        finally : loop.close ()
+        self.assertEqual (out.getvalue ().count ("+CREG: 1"), 1)
+#}
+
+if __name__ == "__main__" : unittest.main ()
@@ -0,0 +1,126 @@
+# Tests of the binary session capture (sercomlib/capture.py) and of its
+# export against the -l log of the same session
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from sercomlib import slog, capture
+from sercomlib.capture import CaptureWriter, CaptureReader, CapFormatText, \
+        CapTimedOut, CapNoSentry
+from sercomlib.portconf import PortConfig
+from sercomlib.session import SercomSession, SCmd, MCmd
+
+class FakeClock : #{
+    """ Wall and monotonic clock of log and capture writers, moved by hand """
+    now = 1700000000.0
+    strftime = staticmethod (time.strftime)
+    localtime = staticmethod (time.localtime)
+    def time (self) :
+        return self.now
+    def MonoNs (self) :
+        return int (self.now * 1e9)
+#}
+
+class CaptureTest (unittest.TestCase) : #{
+    def setUp (self) :
+        self.dir = tempfile.mkdtemp ()
+        self.clock = FakeClock ()
+        self.saved = (slog.time, capture.time, capture.CapMonoNs)
+        slog.time = capture.time = self.clock
+        capture.CapMonoNs = self.clock.MonoNs
+    def tearDown (self) :
+        slog.time, capture.time, capture.CapMonoNs = self.saved
+        shutil.rmtree (self.dir)
+    def path (self, name) :
+        return os.path.join (self.dir, name)
+    def test_round_trip (self) :
+        w = CaptureWriter (self.path ("a.scap"))
+        w.write ("A", "O", "AT\r", "AT")
+        self.clock.now += 1.5
+        w.write ("A", "I", "\r\nOK\r\n", "AT", 0)
+        w.write ("U", "I", "RING")
+        self.clock.now += 1.0
+        w.write ("M", "O", "AT+CSQ\r", "AT+CSQ")
+        w.write ("M", "I", "+CSQ: 9,9\r\n", "AT+CSQ")
+        w.write ("M", "I", "", "AT+CSQ", CapTimedOut)
+        w.write ("S", "M", "***SERCOM: \xe9\n")
+        w.close ()
+        r = CaptureReader (self.path ("a.scap"))
+        recs = [(x.ts, x.src, x.dir, x.sentry, x.data) for x in r.query ()]
+        self.assertEqual (recs, [(0, "A", "O", CapNoSentry, "AT\r"), \
+                (1500000000, "A", "I", 0, "\r\nOK\r\n"), \
+                (1500000000, "U", "I", CapNoSentry, "RING"), \
+                (2500000000, "M", "O", CapNoSentry, "AT+CSQ\r"), \
+                (2500000000, "M", "I", CapNoSentry, "+CSQ: 9,9\r\n"), \
+                (2500000000, "M", "I", CapTimedOut, ""), \
+                (2500000000, "S", "M", CapNoSentry, "***SERCOM: \xe9\n")])
+        self.assertEqual (next (r.query ()).wallns, 1700000000 * 10 ** 9)
+        # Queries on the index
+        data = lambda recs : [x.data for x in recs]
+        self.assertEqual (data (r.query (cmd="AT+CSQ")), \
+                ["AT+CSQ\r", "+CSQ: 9,9\r\n", ""])
+        self.assertEqual (data (r.query (start=1, end=2)), \
+                ["\r\nOK\r\n", "RING"])
+        self.assertEqual (data (r.query (start=2.5)), \
+                ["AT+CSQ\r", "+CSQ: 9,9\r\n", "", "***SERCOM: \xe9\n"])
+        self.assertEqual (data (r.query (sentry=0)), ["\r\nOK\r\n"])
+        self.assertEqual (data (r.query (srcs="US")), \
+                ["RING", "***SERCOM: \xe9\n"])
+        # Timed-out responses only, not URCs or other records with no sentry
+        self.assertEqual (data (r.query (sentry=CapTimedOut)), [""])
+        r.close ()
+    def test_hold (self) :
+        w = CaptureWriter (self.path ("a.scap"))
+        w.write ("A", "O", "AT\r", "AT")
+        w.hold ()
+        w.write ("A", "O", "ATI\r", "ATI")
+        w.release (False)
+        w.hold ()
+        w.write ("A", "O", "AT+CSQ\r", "AT+CSQ")
+        w.release (True)
+        w.hold ()
+        w.write ("A", "O", "AT+CREG?\r", "AT+CREG?")
+        w.close ()
+        self.assertEqual (w.dropped, 1)
+        r = CaptureReader (self.path ("a.scap"))
+        self.assertEqual ([x.data for x in r.query ()], \
+                ["AT\r", "AT+CSQ\r", "AT+CREG?\r"])
+        r.close ()
+    def test_export_is_log (self) :
+        # A session's capture exported whole is its -l log, line for line
+        conf = PortConfig ()
+        conf.scvcmd = "AT"; conf.scvrsp = "OK"
+        conf.sentries = ["\r\nOK\r\n", "\r\nERROR\r\n"]
+        conf.urcpats = ["+CREG:"]
+        sess = SercomSession ("/dev/null", conf, None, self.path ("a.log"), \
+                0, self.path ("a.scap"))
+        sess.urcs.register ("+CREG:", sess.ShowUrc)
+        for cmd, src, rx in [ \
+                ("AT", SCmd, (False, "AT\r\r\nOK\r\n", (0, 10), 0, 10)), \
+                ("AT+X", MCmd, (False, "AT+X\r\r\nERROR\r\n", (1, 13), 0, \
+                13)), \
+                ("AT+COPS=0", SCmd, (False, "AT+COPS=0\r\r\nOK\r\n\r\n" + \
+                "+CREG: 1\r\n", (0, 17), 0, 27)), \
+                ("AT+CSQ", SCmd, (True, "AT+CSQ\r\r\n+CSQ: 9", None, 0, \
+                15)), \
+                ("ATI", SCmd, (True, "", None, None, 0))] :
+            cmd, cr, tout = sess.CmdBegin (cmd, src)
+            self.clock.now += 0.7
+            sess.CmdEnd (cmd, src, tout, 0, len (cr), rx)
+        sess.slogprint ("Done")
+        sess.close ()
+        r = CaptureReader (self.path ("a.scap"))
+        export = "".join ([CapFormatText (x) for x in r.query ()])
+        self.assertEqual ([x.data for x in r.query (sentry=CapTimedOut)], \
+                ["AT+CSQ\r\r\n+CSQ: 9", ""])
+        r.close ()
+        fh = open (self.path ("a.log"))
+        log = fh.read ()
+        fh.close ()
+        self.assertEqual (export, log)
+        self.assertIn ("[UI] '+CREG: 1'", log)
+#}
+
+if __name__ == "__main__" : unittest.main ()
@@ -0,0 +1,60 @@
+# Tests of the fixed-rate scom loop schedule (LoopSchedule in
+# sercomlib/session.py), on a fake clock
+
+import unittest
+from sercomlib import session
+from sercomlib.session import LoopSchedule
+
+class LoopScheduleTest (unittest.TestCase) : #{
+    def setUp (self) :
+        self.now = 100.0
+        self.saved = session.MonoTime
+        session.MonoTime = lambda : self.now
+    def tearDown (self) :
+        session.MonoTime = self.saved
+    # Run an iteration on the fake clock
+    # Return : (start lateness, what end() returned)
+    def iterate (self, ls, start, end) :
+        self.now = 100.0 + start
+        late = ls.begin ()
+        self.now = 100.0 + end
+        return round (late, 6), tuple (round (v, 6) if type (v) is float \
+                else v for v in ls.end ())
+    def test_on_time (self) :
+        ls = LoopSchedule (1.0)
+        self.assertEqual (self.iterate (ls, 0, 0.3), (0, (0.3, 0.7, False, 0)))
+        # Latency of one iteration doesn't delay the next due time
+        self.assertEqual (self.iterate (ls, 1.0, 1.6), \
+                (0, (0.6, 0.4, False, 0)))
+        self.assertEqual (self.iterate (ls, 2.0, 2.0), \
+                (0, (0, 1.0, False, 0)))
+        self.assertEqual ((ls.iters, ls.overruns, ls.missed), (3, 0, 0))
+    def test_overrun (self) :
+        ls = LoopSchedule (1.0)
+        # Ends after the next one was due, which then starts at once
+        self.assertEqual (self.iterate (ls, 0, 1.4), (0, (1.4, 0, True, 0)))
+        # and the one after that is back in phase
+        self.assertEqual (self.iterate (ls, 1.4, 1.5), \
+                (0.4, (0.1, 0.5, False, 0)))
+        self.assertEqual ((ls.overruns, ls.missed), (1, 0))
+        self.assertEqual ((round (ls.busymax, 6), round (ls.latemax, 6)), \
+                (1.4, 0.4))
+    def test_missed (self) :
+        ls = LoopSchedule (0.5)
+        # Due times at 0.5, 1.0 and 1.5 passed, the ones at 0.5 and 1.0 are
+        # dropped and 1.5 runs at once
+        self.assertEqual (self.iterate (ls, 0, 1.6), (0, (1.6, 0, True, 2)))
+        self.assertEqual (self.iterate (ls, 1.6, 1.7), \
+                (0.1, (0.1, 0.3, False, 0)))
+        # Ending exactly a period late misses that one due time
+        self.assertEqual (self.iterate (ls, 2.0, 3.0), (0, (1.0, 0, True, 1)))
+        self.assertEqual ((ls.iters, ls.overruns, ls.missed), (3, 2, 3))
+    def test_no_period (self) :
+        # Back to back iterations are only timed
+        ls = LoopSchedule (0)
+        self.assertEqual (self.iterate (ls, 0, 5), (0, (5, 0, False, 0)))
+        self.assertEqual (self.iterate (ls, 5.5, 6), (0.5, (0.5, 0, False, 0)))
+        self.assertEqual ((ls.overruns, ls.missed, ls.busymax), (0, 0, 5))
+#}
+
+if __name__ == "__main__" : unittest.main ()
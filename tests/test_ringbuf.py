@@ -0,0 +1,70 @@
+# Tests of the rx ring buffer (sercomlib/ringbuf.py)
+
+import unittest
+from sercomlib.ringbuf import RingBuffer
+
+class RingBufferTest (unittest.TestCase) : #{
+    # Empty ring of capacity bytes with its head at offset at (skipping
+    # all data puts it back to 0)
+    def ring (self, capacity, at) :
+        r = RingBuffer (capacity)
+        r.head = at
+        return r
+    def test_wrap (self) :
+        r = self.ring (8, 5)
+        self.assertEqual (r.write (b"abcdef"), 0)
+        self.assertEqual (len (r), 6)
+        self.assertEqual ([v.tobytes () for v in r.views ()], [b"abc", b"def"])
+        self.assertEqual (r.read (4), b"abcd")
+        self.assertEqual (r.read (10), b"ef")
+        self.assertEqual (len (r), 0)
+    def test_find_across_wrap (self) :
+        # sub at every position of a ring wrapped at every point
+        data = b"0123456789"
+        for at in range (10) :
+            r = self.ring (10, at)
+            r.write (data)
+            for start in range (10) :
+                for size in range (1, 4) :
+                    for pos in range (10 - size + 1) :
+                        sub = data[pos:pos + size]
+                        self.assertEqual (r.find (sub, start), \
+                                pos if pos >= start else -1)
+            self.assertEqual (r.find (b"90"), -1)
+            self.assertEqual (r.find (b"234", 0, 4), -1)
+            self.assertEqual (r.find (b"234", 0, 5), 2)
+    def test_overflow (self) :
+        r = self.ring (8, 6)
+        r.write (b"abcdef")
+        # Oldest bytes dropped to make room
+        self.assertEqual (r.write (b"ghij"), 2)
+        self.assertEqual (r.dropped, 2)
+        self.assertEqual (r.read (8), b"cdefghij")
+        # Data bigger than the whole ring keeps its tail
+        r.write (b"klm")
+        self.assertEqual (r.write (b"0123456789"), 5)
+        self.assertEqual (r.dropped, 7)
+        self.assertEqual (r.read (8), b"23456789")
+    def test_base (self) :
+        # base is the stream offset of the oldest byte, whether it got
+        # there by skip/read or by overflow
+        r = RingBuffer (8)
+        r.write (b"abcdef")
+        r.skip (2)
+        self.assertEqual (r.base, 2)
+        r.write (b"ghijk")
+        self.assertEqual (r.base, 3)
+        self.assertEqual (r.find (b"ij") + r.base, 8)
+        r.read (3)
+        self.assertEqual (r.base, 6)
+        self.assertEqual (r.find (b"ij") + r.base, 8)
+        r.write (b"0123456789")
+        self.assertEqual (r.base, 13)
+        self.assertEqual (r.base + len (r), 21)
+        r.skip (100)
+        self.assertEqual ((r.base, len (r), r.head), (21, 0, 0))
+    def test_bad_capacity (self) :
+        self.assertRaises (ValueError, RingBuffer, 0)
+#}
+
+if __name__ == "__main__" : unittest.main ()
@@ -0,0 +1,120 @@
+# Tests of the scom compiler and its cache (sercomlib/scomc.py)
+
+import os
+import time
+import marshal
+import shutil
+import tempfile
+import unittest
+from sercomlib import scomc
+from sercomlib.scomc import CompileScom, LoadScomCache, ScomCachePath, \
+        ScomError, SOP_CMD, SOP_LOOP, SOP_SCOM, SOP_SLEEP, SOP_SENDFILE
+
+class ScomCompilerTest (unittest.TestCase) : #{
+    # Scom files are written to a temp directory, made PWD, and the cache
+    # goes to another one
+    def setUp (self) :
+        self.dir = tempfile.mkdtemp ()
+        self.cachedir = tempfile.mkdtemp ()
+        self.env = os.environ.get ("SERCOM_CACHE_DIR")
+        os.environ["SERCOM_CACHE_DIR"] = self.cachedir
+        self.saved = scomc.ScomCacheDir
+        scomc.ScomCacheDir = self.cachedir
+        self.pwd = os.getcwd ()
+        os.chdir (self.dir)
+    def tearDown (self) :
+        os.chdir (self.pwd)
+        scomc.ScomCacheDir = self.saved
+        if self.env is None : del os.environ["SERCOM_CACHE_DIR"]
+        else : os.environ["SERCOM_CACHE_DIR"] = self.env
+        shutil.rmtree (self.dir)
+        shutil.rmtree (self.cachedir)
+    # Write a file in the temp directory
+    def put (self, name, text) :
+        fh = open (os.path.join (self.dir, name), "w")
+        fh.write (text)
+        fh.close ()
+    def assertScomError (self, msg, path, **kw) :
+        try : CompileScom (path, **kw)
+        except ScomError as e : self.assertIn (msg, str (e)); return
+        self.fail ("no ScomError for " + path)
+    def test_program (self) :
+        self.put ("a.scom", "# comment\nAT\n\nscom_loopbegin iter=2\n" + \
+                "scom_loopbegin period=0.5\nAT+CSQ\nscom_loopend\n" + \
+                "scom_sleep 1.5\nscom_loopend\nscom_enscom b.scom\n")
+        self.put ("b.scom", "ATI\n")
+        prog = CompileScom ("a.scom", False)
+        inner = (SOP_LOOP, -1, [(SOP_CMD, "AT+CSQ")], 0.5, "a.scom:5")
+        self.assertEqual (prog, (SOP_SCOM, "a.scom", [(SOP_CMD, "AT"), \
+                (SOP_LOOP, 2, [inner, (SOP_SLEEP, 1.5)], 0.0, "a.scom:4"), \
+                (SOP_SCOM, "b.scom", [(SOP_CMD, "ATI")])]))
+    def test_include_cycle (self) :
+        self.put ("a.scom", "AT\nscom_enscom b.scom\n")
+        self.put ("b.scom", "scom_enscom a.scom\n")
+        self.assertScomError ("Scom include cycle - a.scom -> b.scom -> " + \
+                "a.scom", "a.scom")
+    def test_missing_child (self) :
+        self.put ("a.scom", "AT\nscom_enscom nochild.scom\n")
+        self.assertScomError ("a.scom:2: Scom file not found or invalid - " + \
+                "nochild.scom", "a.scom")
+    def test_bad_syntax (self) :
+        for line, msg in [("scom_sleep x", "Bad sleep"), \
+                ("scom_loopbegin iter=1.5", "Bad loop"), \
+                ("scom_timeout -1", "Bad timeout"), \
+                ("scom_waiturc 5", "Bad syntax"), \
+                ("scom_sendfile nofile.bin", "File not found"), \
+                ("scom_bogus", "Unknown scom directive")] :
+            self.put ("a.scom", "AT\n" + line + "\n")
+            self.assertScomError ("a.scom:2: " + msg, "a.scom", \
+                    usecache=False)
+        self.put ("a.scom", "scom_loopbegin\nAT\n")
+        self.assertScomError ("EOF before scom_loopend", "a.scom")
+        self.put ("a.scom", "AT\nscom_loopend\n")
+        self.assertScomError ("a.scom:2: scom_loopend without", "a.scom")
+    def test_cache (self) :
+        self.put ("a.scom", "AT\nscom_enscom b.scom\n")
+        self.put ("b.scom", "ATI\n")
+        prog = CompileScom ("a.scom")
+        entry = LoadScomCache ("a.scom")
+        self.assertEqual (entry["prog"], prog)
+        # Plain data, not a pickle
+        fh = open (ScomCachePath ("a.scom"), "rb")
+        self.assertEqual (marshal.load (fh)["prog"], prog)
+        fh.close ()
+        # Size of a child changes
+        self.put ("b.scom", "ATI\nAT+CSQ\n")
+        self.assertEqual (LoadScomCache ("a.scom"), None)
+        prog = CompileScom ("a.scom")
+        self.assertEqual (prog[2][1][2], [(SOP_CMD, "ATI"), \
+                (SOP_CMD, "AT+CSQ")])
+        # Only mtime of a child changes
+        self.assertNotEqual (LoadScomCache ("a.scom"), None)
+        os.utime ("b.scom", (time.time () + 10, time.time () + 10))
+        self.assertEqual (LoadScomCache ("a.scom"), None)
+    def test_sendfile_deps (self) :
+        self.put ("f.bin", "data")
+        self.put ("a.scom", "scom_sendfile ymodem f.bin\n")
+        prog = CompileScom ("a.scom")
+        self.assertEqual (prog[2], [(SOP_SENDFILE, \
+                os.path.abspath ("f.bin"), "ymodem")])
+        self.assertIn (os.path.realpath ("f.bin"), \
+                LoadScomCache ("a.scom")["deps"])
+        # A sent file gone is caught on compile, cache or not
+        os.remove ("f.bin")
+        self.assertEqual (LoadScomCache ("a.scom"), None)
+        self.assertScomError ("a.scom:1: File not found - f.bin", "a.scom")
+    def test_cwd (self) :
+        # Paths relative to a given directory, e.g. a daemon client's
+        os.mkdir ("job")
+        self.put ("job/a.scom", "scom_enscom b.scom\nscom_sendfile f.bin\n")
+        self.put ("job/b.scom", "AT\n")
+        self.put ("job/f.bin", "data")
+        job = os.path.join (self.dir, "job")
+        os.chdir (self.pwd)
+        prog = CompileScom ("a.scom", cwd=job)
+        self.assertEqual (prog[2], [(SOP_SCOM, "b.scom", [(SOP_CMD, "AT")]), \
+                (SOP_SENDFILE, os.path.join (job, "f.bin"), "raw")])
+        self.assertEqual (LoadScomCache ("a.scom", job)["prog"], prog)
+#}
+
+if __name__ == "__main__" : unittest.main ()
@@ -0,0 +1,79 @@
+# Tests of the sentry matching engine (sercomlib/sentry.py)
+
+import re
+import unittest
+from sercomlib.sentry import SentryMatcher
+
+class SentryMatcherTest (unittest.TestCase) : #{
+    # Feed resp to a fresh matcher in chunks of size bytes
+    # Return : what the scan ending the response returned, None if none did
+    def feed (self, m, resp, size) :
+        m.reset ()
+        for end in range (size, len (resp) + size, size) :
+            end = min (end, len (resp))
+            found = m.scan (resp, end)
+            if found : return found
+        return None
+    def test_literal (self) :
+        m = SentryMatcher (["\r\nOK\r\n", "\r\nERROR\r\n"])
+        resp = b"AT\r\r\nERROR\r\n"
+        self.assertEqual (m.scan (resp, len (resp)), (1, len (resp)))
+        m.reset ()
+        self.assertEqual (m.scan (b"AT\r\r\nOK", 7), None)
+    def test_wildcard (self) :
+        m = SentryMatcher (["\r\nOK\r\n", "\r\n+CME ERROR:.*\r\n"])
+        resp = b"AT+X\r\r\n+CME ERROR: 10\r\n"
+        # Not ended till the whole error line has arrived
+        self.assertEqual (m.scan (resp, len (resp) - 2), None)
+        self.assertEqual (m.scan (resp, len (resp)), (1, len (resp)))
+    def test_regex (self) :
+        m = SentryMatcher (["\r\nOK\r\n"], [r"\r\n\+CMS ERROR: \d+\r\n"])
+        resp = b"AT+CMGS\r\r\n+CMS ERROR: 500\r\n"
+        self.assertEqual (m.scan (resp, len (resp)), (1, len (resp)))
+    def test_priority (self) :
+        # Earliest match wins, else regex/wildcard before literal, else
+        # the longer literal
+        m = SentryMatcher (["OK", "\r\nOK\r\n", "O.*K"], [r"\r\nO"])
+        self.assertEqual (m.scan (b"\r\nOK\r\n", 6), (3, 3))
+        m = SentryMatcher (["OK", "\r\nOK\r\n"])
+        self.assertEqual (m.scan (b"\r\nOK\r\n", 6), (1, 6))
+        m = SentryMatcher (["OK\r\n", "ERROR\r\n"])
+        self.assertEqual (m.scan (b"ERROR\r\nOK\r\n", 11), (1, 7))
+    def test_chunk_boundary (self) :
+        # A sentry split across chunks is found by the resumed scan
+        m = SentryMatcher (["\r\nOK\r\n", "\r\n+CME ERROR:.*\r\n"], \
+                [r"\r\nRING \d+\r\n"])
+        data = b"x" * 50
+        for resp, idx in [(data + b"\r\nOK\r\n", 0), \
+                (data + b"\r\n+CME ERROR: 123\r\n", 1), \
+                (data + b"\r\nRING 42\r\n", 2)] :
+            for size in range (1, 9) :
+                self.assertEqual (self.feed (m, resp, size), \
+                        (idx, len (resp)))
+    def test_base_offset (self) :
+        m = SentryMatcher (["\r\nOK\r\n"])
+        m.reset (100)
+        self.assertEqual (m.scan (b"ab\r\nO", 105, 100), None)
+        start = m.resume ()
+        self.assertEqual (m.scan (b"ab\r\nOK\r\n"[start - 100:], 108, start), \
+                (0, 108))
+    def test_regex_backreference (self) :
+        m = SentryMatcher (["OK\r\n"], [r"(\w)\1 DONE"])
+        self.assertEqual (m.scan (b"ab DONE", 7), None)
+        m.reset ()
+        self.assertEqual (m.scan (b"xaa DONE", 8), (1, 8))
+        self.assertEqual (self.feed (m, b"OK\r\n", 2), (0, 4))
+    def test_regex_global_flags (self) :
+        m = SentryMatcher (["\r\nERROR\r\n"], [r"(?i)\r\nok\r\n"])
+        self.assertEqual (self.feed (m, b"AT\r\r\nOk\r\n", 3), (1, 9))
+        self.assertEqual (self.feed (m, b"AT\r\r\nERROR\r\n", 3), (0, 12))
+    def test_regex_named_groups (self) :
+        # Same group name in two sentries, and one clashing with the
+        # matcher's own group names
+        m = SentryMatcher ([], [r"(?P<s0>A)B", r"(?P<s0>C)D"])
+        self.assertEqual (m.scan (b"xCD", 3), (1, 3))
+    def test_bad_regex (self) :
+        self.assertRaises (re.error, SentryMatcher, [], [r"(unclosed"])
+#}
+
+if __name__ == "__main__" : unittest.main ()
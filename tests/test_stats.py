@@ -0,0 +1,62 @@
+# Tests of the run statistics histograms (sercomlib/stats.py)
+
+import random
+import unittest
+from sercomlib.stats import Histogram, HistRelErr
+
+class HistogramTest (unittest.TestCase) : #{
+    # Check h's quantiles against the exact ones of values (a value at a
+    # bucket's edge is off by HistRelErr exactly, give float rounding room)
+    def check (self, h, values) :
+        values = sorted (values)
+        for q in (0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 1.0) :
+            exact = values[int (q * (len (values) - 1))]
+            got = h.quantile (q)
+            if exact <= 0 : self.assertEqual (got, 0.0); continue
+            self.assertTrue (abs (got - exact) <= \
+                    HistRelErr * exact * 1.000001, \
+                    "q=%s exact=%s got=%s" % (q, exact, got))
+    def test_empty (self) :
+        h = Histogram ()
+        self.assertEqual (h.quantile (0.5), None)
+        self.assertEqual (h.CountLE (1.0), 0)
+    def test_known (self) :
+        h = Histogram ()
+        for v in range (1, 101) : h.add (v)
+        self.check (h, range (1, 101))
+        self.assertEqual ((h.count, h.sum, h.min, h.max), (100, 5050, 1, 100))
+        # Ends are clamped to the exact min and max
+        self.assertEqual (h.quantile (0), 1)
+        self.assertEqual (h.quantile (1), 100)
+        self.assertEqual (h.CountLE (10), 10)
+    def test_single (self) :
+        h = Histogram ()
+        h.add (0.0123)
+        for q in (0, 0.5, 1) : self.assertEqual (h.quantile (q), 0.0123)
+    def test_zeros (self) :
+        h = Histogram ()
+        for v in [0, 0, 0, 0.5, 1.5] : h.add (v)
+        self.assertEqual (h.quantile (0.5), 0.0)
+        self.assertEqual (h.quantile (1), 1.5)
+        self.assertEqual (h.CountLE (0.1), 3)
+    def test_spread (self) :
+        # Latencies over 6 decades, from 10us to 10s
+        rnd = random.Random (7)
+        values = [10 ** rnd.uniform (-5, 1) for i in range (5000)]
+        h = Histogram ()
+        for v in values : h.add (v)
+        self.check (h, values)
+    def test_merge (self) :
+        values = [i * 0.001 for i in range (1, 1001)]
+        a = Histogram ()
+        b = Histogram ()
+        for v in values[::2] : a.add (v)
+        for v in values[1::2] : b.add (v)
+        a.merge (b)
+        self.assertEqual ((a.count, a.min, a.max), (1000, 0.001, 1.0))
+        self.check (a, values)
+        a.merge (Histogram ())
+        self.assertEqual (a.count, 1000)
+#}
+
+if __name__ == "__main__" : unittest.main ()
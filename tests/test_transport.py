@@ -0,0 +1,50 @@
+# Tests of transport port id parsing (sercomlib/transport.py)
+
+import unittest
+from sercomlib.transport import ParsePortId, TransportError, IsTransport
+
+# Port ids and what they parse to, None if they're rejected
+PortIds = [
+    ("tcp://localhost:23", ("tcp", "localhost", 23, None)),
+    ("tcp://10.0.0.5:4001", ("tcp", "10.0.0.5", 4001, None)),
+    ("tcp://[::1]:23", ("tcp", "::1", 23, None)),
+    ("tcp://[fe80::1%eth0]:2000", ("tcp", "fe80::1%eth0", 2000, None)),
+    ("tcp://localhost", None),
+    ("tcp://::1", None),
+    ("tcp://[::1]", None),
+    ("tcp://[::1]23", None),
+    ("tcp://[::1:23", None),
+    ("tcp://user@host:23", None),
+    ("tcp://host:23/cmd", None),
+    ("tcp://host:telnet", None),
+    ("tcp://:23", None),
+    ("ssh://host", ("ssh", "host", None, None)),
+    ("ssh://host:2222", ("ssh", "host", 2222, None)),
+    ("ssh://pi@host", ("ssh", "pi@host", None, None)),
+    ("ssh://pi@host:2222/adb shell", ("ssh", "pi@host", 2222, "adb shell")),
+    ("ssh://a@b@host", ("ssh", "a@b@host", None, None)),
+    ("ssh://::1", ("ssh", "::1", None, None)),
+    ("ssh://fe80::1:2", ("ssh", "fe80::1:2", None, None)),
+    ("ssh://pi@[::1]:2222", ("ssh", "pi@::1", 2222, None)),
+    ("ssh://pi@[::1]/cat", ("ssh", "pi@::1", None, "cat")),
+    ("ssh://host:ssh", None),
+    ("ssh://host:", ("ssh", "host", None, None)),
+    ("ssh://pi@", None),
+    ("ssh:///cmd", None),
+    ("ftp://host:21", None),
+]
+
+class ParsePortIdTest (unittest.TestCase) : #{
+    def test_port_ids (self) :
+        for portid, want in PortIds :
+            if want is None :
+                self.assertRaises (TransportError, ParsePortId, portid)
+            else : self.assertEqual (ParsePortId (portid), want, portid)
+    def test_is_transport (self) :
+        self.assertTrue (IsTransport ("exec:adb shell"))
+        self.assertTrue (IsTransport ("tcp://host:23"))
+        self.assertFalse (IsTransport ("/dev/ttyUSB0"))
+        self.assertFalse (IsTransport ("COM3"))
+#}
+
+if __name__ == "__main__" : unittest.main ()
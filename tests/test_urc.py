@@ -0,0 +1,54 @@
+# Tests of the URC demultiplexer (sercomlib/urc.py)
+
+import time
+import threading
+import unittest
+from sercomlib.urc import UrcDemux, AtCmdNames
+
+class UrcDemuxTest (unittest.TestCase) : #{
+    def test_at_names (self) :
+        self.assertEqual (AtCmdNames ("AT+CREG?"), ["+CREG"])
+        self.assertEqual (AtCmdNames ("AT+CRING=1"), ["+CRING"])
+        self.assertEqual (AtCmdNames ("AT+CSQ;+CREG=2"), ["+CSQ", "+CREG"])
+    def test_solicited (self) :
+        # A command's own response isn't a URC
+        u = UrcDemux ()
+        u.register ("+CREG:")
+        self.assertEqual (u.match ("+CREG: 0,1", "AT+CREG?"), None)
+        self.assertEqual (u.match ("+CREG: 0,1", "AT+CSQ;+CREG?"), None)
+        self.assertNotEqual (u.match ("+CREG: 1", "AT+CSQ"), None)
+    def test_name_not_substring (self) :
+        # RING isn't solicited by AT+CRING=1
+        u = UrcDemux ()
+        u.register ("RING")
+        resp = "AT+CRING=1\r\r\nRING\r\n\r\nOK\r\n"
+        self.assertEqual (u.filter (resp, "AT+CRING=1"), \
+                "AT+CRING=1\r\r\nOK\r\n")
+        self.assertEqual (u.get (0), "RING")
+    def test_get_other_urc (self) :
+        # A URC routed to a callback doesn't end get() early
+        u = UrcDemux ()
+        u.register ("+CREG:", lambda line : None)
+        u.register ("RING")
+        t = threading.Timer (0.05, u.dispatch, ["+CREG: 1"])
+        t.start ()
+        start = time.time ()
+        self.assertEqual (u.get (0.3), None)
+        self.assertTrue (time.time () - start >= 0.25)
+        t.join ()
+        u.dispatch ("RING")
+        self.assertEqual (u.get (0.3), "RING")
+    def test_wait_since (self) :
+        # A URC routed before waiting is seen if it came after since
+        u = UrcDemux ()
+        u.register ("+CREG:", lambda line : None)
+        since = u.seq
+        u.filter ("AT+COPS=0\r\r\nOK\r\n\r\n+CREG: 1\r\n", "AT+COPS=0")
+        self.assertEqual (u.wait ("+CREG:", 0.1), (None, None))
+        seq, line = u.wait ("+CREG:", 0.1, since)
+        self.assertEqual (line, "+CREG: 1")
+        # and only once, if the waiter moves on to its seq
+        self.assertEqual (u.wait ("+CREG:", 0.1, seq), (None, None))
+#}
+
+if __name__ == "__main__" : unittest.main ()
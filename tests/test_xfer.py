@@ -0,0 +1,69 @@
+# Tests of XMODEM/YMODEM block framing (sercomlib/xfer.py)
+
+import unittest
+from sercomlib.xfer import XmodemBlock, YmodemHeader, XferSend, XferError
+
+# Bitwise CRC-16/XMODEM (poly 0x1021, init 0), as the spec gives it
+def Crc16 (data) :
+    crc = 0
+    for b in bytearray (data) :
+        crc ^= b << 8
+        for i in range (8) :
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xffff
+    return crc
+
+class XmodemBlockTest (unittest.TestCase) : #{
+    def test_crc_reference (self) :
+        # Check value of CRC-16/XMODEM
+        self.assertEqual (Crc16 (b"123456789"), 0x31c3)
+    def test_crc_block (self) :
+        block = XmodemBlock (1, b"hello", 128, True)
+        data = b"hello" + b"\x1a" * 123
+        self.assertEqual (len (block), 133)
+        self.assertEqual (block[:3], b"\x01\x01\xfe")
+        self.assertEqual (block[3:131], data)
+        crc = Crc16 (data)
+        self.assertEqual (block[131:], bytes (bytearray ([crc >> 8, \
+                crc & 0xff])))
+    def test_checksum_block (self) :
+        block = XmodemBlock (2, b"\xff" * 128, 128, False)
+        self.assertEqual (len (block), 132)
+        self.assertEqual (block[:3], b"\x01\x02\xfd")
+        self.assertEqual (block[-1:], b"\x80")
+        block = XmodemBlock (3, b"\x01\x02", 128, False)
+        self.assertEqual (block[-1:], bytes (bytearray ([(3 + 126 * 0x1a) \
+                & 0xff])))
+    def test_1k_block (self) :
+        data = bytes (bytearray (range (256))) * 4
+        block = XmodemBlock (256, data, 1024, True)
+        # STX, and block number wraps to 0
+        self.assertEqual (block[:3], b"\x02\x00\xff")
+        self.assertEqual (block[3:1027], data)
+        self.assertEqual (Crc16 (data), 0xc2e0)
+        self.assertEqual (block[1027:], b"\xc2\xe0")
+    def test_ymodem_header (self) :
+        block = YmodemHeader ("foo.bin", 12345)
+        # 128 byte block 0, name and size padded with NULs, CRC-16
+        self.assertEqual (len (block), 133)
+        self.assertEqual (block[:3], b"\x01\x00\xff")
+        data = b"foo.bin\x0012345" + b"\0" * 115
+        self.assertEqual (block[3:131], data)
+        self.assertEqual (block[131:], bytes (bytearray ([Crc16 (data) >> 8, \
+                Crc16 (data) & 0xff])))
+        # Header not fitting 128 bytes takes a 1K block
+        block = YmodemHeader ("n" * 200, 1)
+        self.assertEqual (len (block), 1029)
+        self.assertEqual (block[:3], b"\x02\x00\xff")
+        self.assertEqual (block[3:206], b"n" * 200 + b"\x001\0")
+        self.assertEqual (block[1026:1027], b"\0")
+    def test_ymodem_header_too_long (self) :
+        # Name + NUL + size, 1024 bytes fits and 1025 doesn't
+        self.assertEqual (len (YmodemHeader ("n" * 1021, 10)), 1029)
+        self.assertRaises (XferError, YmodemHeader, "n" * 1022, 10)
+        self.assertRaises (XferError, YmodemHeader, "é" * 512, 1)
+        # and the transfer fails before the port is touched
+        self.assertRaises (XferError, XferSend, None, None, "n" * 1100, 1, \
+                "ymodem")
+#}
+
+if __name__ == "__main__" : unittest.main ()
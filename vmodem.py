@@ -0,0 +1,86 @@
+#!/bin/env python
+
+VmodemUsageStr = "\n\
+Usage: vmodem.py <args> [optionals]\n\
+Mandatory args: One of below\n\
+     -t <TableFile> : Response table file, refer sample.vmt for syntax\n\
+     -r <Recording> : Replay responses recorded by sercom.py, either a -l log\n\
+                      file (*_sercom.log) or a -b capture file (*.scap)\n\
+optionals:\n\
+     -L <Latency>   : Default delay in seconds before responding to a\n\
+                      command, e.g. -L 0.05 (default 0)\n\
+     -k <Bytes>     : Send responses in chunks of this many bytes\n\
+     -g <Gap>       : Delay in seconds between chunks, e.g. -g 0.002\n\
+     -B <Baud>      : Pace output as a serial link at this baud rate\n\
+     -u <Period>:<Urc> : Inject URC every Period seconds, e.g.\n\
+                      -u 5:'+CREG: 1'. Give -u multiple times for more URCs\n\
+     -E             : Start with echo off (like ATE0)\n\
+     -R <Rate>[:<Max>[:<Bad>]] : Emulate DTE baud rate, modem understands\n\
+                      only a host at Rate (until AT+IPR=<rate> upto Max\n\
+                      switches it), rates above Bad lose some bytes, e.g.\n\
+                      -R 115200:921600:460800\n\
+NOTE:\n\
+1. Prints pty device name of virtual modem, give it to sercom.py -d\n\
+2. A command not in table/recording gets ERROR (or '*' entry of table)\n\
+3. A command recorded multiple times is answered with its recorded\n\
+   responses in turn. With a capture file, recorded latency of each\n\
+   response is used, unless -L is given\n\
+4. Runs till Ctrl+C\n\
+"
+
+import os
+import sys
+import time
+import getopt
+from sercomlib.vmodem import VirtualModem, LoadVmTable, LoadVmReplay
+
+######################### Start-Of-Python-Script (SOPS)
+
+if len (sys.argv) == 1 : sys.exit (VmodemUsageStr)
+if os.name != "posix" : sys.exit ("vmodem.py needs a posix pty")
+
+Table = None
+Latency = None
+Modem = VirtualModem ()
+
+try : opts, args = getopt.getopt (sys.argv[1:], 't:r:L:k:g:B:u:ER:')
+except getopt.GetoptError as e : sys.exit (str (e) + "\n" + VmodemUsageStr)
+try :
+    for opt, arg in opts :
+        if opt == "-t" : Table = LoadVmTable (arg)
+        elif opt == "-r" : Table = LoadVmReplay (arg)
+        elif opt == "-L" : Latency = float (arg)
+        elif opt == "-k" : Modem.chunk = int (arg)
+        elif opt == "-g" : Modem.chunkgap = float (arg)
+        elif opt == "-B" : Modem.baud = int (arg)
+        elif opt == "-u" :
+            Period, Urc = arg.split (":", 1)
+            Modem.AddUrc (float (Period), Urc)
+        elif opt == "-E" : Modem.echo = False
+        elif opt == "-R" :
+            Rates = [int (r) for r in arg.split (":")]
+            Modem.rate = Rates[0]
+            if len (Rates) > 1 : Modem.ratemax = Rates[1]
+            if len (Rates) > 2 : Modem.ratebad = Rates[2]
+except (IOError, OSError) :
+    sys.exit ("Unable to read " + arg + ": " + str (sys.exc_info ()[1]))
+except ValueError :
+    sys.exit ("Bad " + opt + " " + arg + ": " + str (sys.exc_info ()[1]))
+
+if Table is None : sys.exit ("Need table file or recording\n" + VmodemUsageStr)
+
+# -L overrides recorded latencies too
+if Latency is not None :
+    Modem.latency = Latency
+    for Key in Table :
+        Table[Key] = [(None, Rsp) for Lat, Rsp in Table[Key]]
+Modem.table = Table
+
+print ("Virtual modem on " + Modem.start () + " (" + str (len (Table)) + \
+        " commands)")
+sys.stdout.flush ()
+try :
+    while 1 : time.sleep (1)
+except KeyboardInterrupt : pass
+Modem.stop ()
+print ("Answered " + str (Modem.ncmds) + " commands")
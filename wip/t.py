@@ -14,6 +14,10 @@ import threading
 import functools
 from functools import partial
 
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), ".."))
+from sercomlib.ringbuf import RingBuffer
+from sercomlib.sentry import SentryMatcher
+
 # Set python-version identifier as:
 # 2 for 2.x, 3 for 3.x, etc
 gPyVer = int (platform.python_version()[0])
@@ -28,28 +32,29 @@ MODEM_CLI = 1
 gModem = MODEM_AT
 # serial port identifier
 gSerPort = ""
-# global serial rx data buffer
-gRxBuf = ""
+# global serial rx data buffer - bounded ring, oldest data dropped on overflow
+gRxBufSize = 64 * 1024
+gRxBuf = RingBuffer (gRxBufSize)
 # flag used at setup time to use threaded/non-threaded rx-loop
 gSerialRxThread = True
-# global/input sentries list
+# global/input sentries list ('.*' is a wildcard, refer sercomlib/sentry.py)
 gWildSentries = ['\r\nOK\r\n', '\r\nERROR\r\n', '\r\n+CME ERROR:.*\r\n']
-# list with string after wildcards (i.e. after .*) or else have ''
-gWildCards = []
-# list of sentries removed with patterns from wildcard and after
-gSentries = []
-# length of sentries in gSentries list
-gSentryLens = []
+# matcher compiled once from gWildSentries
+gSentryMatcher = SentryMatcher (gWildSentries)
+# Modem's command echo, cleared once EchoOff disables it - responses then
+# carry no echo to find and strip
+gEcho = True
+# AT command disabling modem's echo
+gEchoOffCmd = "ATE0"
 
 # Function to receive data over Serial port in python-version independent way
 # Usage  : RecvSerialData (SerialPort, nBytes)
 #          SerialPort - Serial Port Interface handle
 #          nBytes     - number of bytes to recv
-# Return : String containing the data received on serial port
+# Return : Raw bytes received on serial port
 def RecvSerialData (SerialPort, nBytes) :
     try : Data = SerialPort.read (nBytes)
-    except serial.serialutil.SerialTimeoutException : Data = ''
-    if gPyVer == 3 : Data = Data.decode ()
+    except serial.serialutil.SerialTimeoutException : Data = b''
     return Data
 
 # Function to send data over Serial port in python-version independent way
@@ -75,11 +80,11 @@ else : ReadConsoleInput = raw_input
 # Usage  : StripStartOfString (buf)
 #          buf        - buffer containing data to be processed
 # Return : Stripped string
+gStripRule = re.compile (r'([^\n]+)')
 def StripStartOfString (buf) :
-    _rule = re.compile (r'([^\n]+)')
-    stripStr = re.search(_rule, buf).group(1) + "\n"
-    buf = buf[len (stripStr):]
-    return buf
+    m = gStripRule.search (buf)
+    if not m : return buf
+    return buf[len (m.group (1)) + 1:]
 
 # Function to skip first word and following spaces to point to next word
 # Usage  : SkipToNextWord (line, word1len)
@@ -119,74 +124,95 @@ else :
             except : timeout = 0
         return 0
 
-def SetupSentries () :
-    global gWildCards
-    global gSentries
-    global gSentryLens
-    i = 0
-    # do wildcard match till '\r\n'    or  '\r'    or  '\n'
-    # if a sentry ends with  '.*\r\n'  or  '.*\r'  or  '.*\n' 
-    for sentry in gWildSentries :
-        if ".*\r\n" in sentry :
-            gWildCards.append ("\r\n")
-            gSentries.append (sentry.split(".*\r\n")[0])
-        elif ".*\r" in sentry :
-            gWildCards.append ("\r")
-            gSentries.append (sentry.split(".*\r")[0])
-        elif ".*\n" in sentry :
-            gWildCards.append ("\n")
-            gSentries.append (sentry.split(".*\n")[0])
-        else :
-            gWildCards.append ("")
-            gSentries.append (sentry)
-        i += 1
-        # length of given sentries list
-        gSentryLens = [len(sentry) for sentry in gSentries]
-
 #gSerPort = serial.Serial (port="COM6", timeout=0.01, baudrate=115200)
 gSerPort = serial.Serial (port="/dev/ttyS6", timeout=0.01, baudrate=115200)
 
-def GetResponse (cmd, timeout) :
-    global gRxBuf
+# Function to get stream offset (refer RingBuffer.base) of the next byte
+# to be received, i.e. where the response of a command sent now starts
+# Usage  : RxMark ()
+# Return : stream offset
+def RxMark () :
+    gRxBufCond.acquire ()
+    mark = gRxBuf.base + len (gRxBuf)
+    gRxBufCond.release ()
+    return mark
+
+# Function to wait for the full response of cmd in gRxBuf
+# Usage  : GetResponse (cmd, timeout, since)
+#          cmd     - command string sent (its echo marks start of response)
+#          timeout - max time in seconds to wait for the full response
+#          since   - RxMark () taken before cmd was sent, response starts
+#                    there when echo is off
+# Return : Response string without cmd echo, '' if timed-out
+# Wakes up only when SerialRxLoop signals new data in gRxBuf and rescans
+# just the new data (plus pattern-length overlap) on each wakeup.
+def GetResponse (cmd, timeout, since) :
     # For AT-type Modems (not CLI based), it's per AT cmd
     if cmd == '' : return ''
-    # Find the first cmd occurrence in gRxBuf
-    delay = 0.01
-    while timeout > 0 :
-        SoC = gRxBuf.find (cmd)
-        if SoC >= 0 : break
-        timeout -= delay; time.sleep (delay)
-    if timeout <= 0 or SoC < 0 : return ''
-    # Found the cmd, check for full-response
-    fullrsp = ''
-    while timeout > 0 :
-        # list with element: sentry find-indexes or -1
-        sentryPos = [gRxBuf.find (i) for i in gSentries]
-        # Now find first valid sentry 
-        pos = len (gRxBuf)
-        sentryIdx = -1
-        i = 0
-        while i < len (sentryPos) :
-            if pos > sentryPos[i] and sentryPos[i] >= 0: 
-                pos = sentryPos[i]
-                sentryIdx = i
-            i += 1
-        if sentryIdx != -1 :
-            # Found a full ATCmdResp
-            EoR = pos + gSentryLens[sentryIdx]
-            # If sentry's a wildcard, match it properly
-            wcard = gWildCards[sentryIdx]
-            if wcard : EoR += gRxBuf[EoR:].find (wcard) + len (wcard)
-            fullrsp = StripStartOfString (gRxBuf)[SoC:EoR]
-            # Yay..  a full ATCmdResp, handle it
-            gLockRxBuf.acquire ()
-            gRxBuf = gRxBuf[:SoC] + gRxBuf[EoR:]
-            gLockRxBuf.release ()
+    if gPyVer == 3 : cmd = cmd.encode ()
+    deadline = time.time () + timeout
+    # Stream offsets (refer RingBuffer.base) of cmd echo and its scan progress
+    SoC = -1
+    cmdScanned = gRxBuf.base
+    fullrsp = b''
+    # logical offset in gRxBuf of stream offset x
+    lpos = lambda x : max (0, x - gRxBuf.base)
+    gRxBufCond.acquire ()
+    # No echo to look for, response is whatever arrived since cmd was sent
+    if not gEcho :
+        SoC = max (since, gRxBuf.base)
+        gSentryMatcher.reset (SoC)
+    while 1 :
+        end = gRxBuf.base + len (gRxBuf)
+        if SoC < 0 :
+            # Find the first cmd occurrence in new data of gRxBuf
+            pos = gRxBuf.find (cmd, lpos (cmdScanned - len (cmd) + 1))
+            cmdScanned = end
+            if pos >= 0 :
+                SoC = gRxBuf.base + pos
+                gSentryMatcher.reset (SoC)
+        EoR = -1
+        if SoC >= 0 :
+            # Found the cmd, scan data after it from where the matcher left
+            # off; only that part of the ring is copied out
+            start = lpos (gSentryMatcher.resume ())
+            data = b"".join (gRxBuf.views (start))
+            Sentry = gSentryMatcher.scan (data, end, gRxBuf.base + start)
+            if Sentry : EoR = lpos (Sentry[1])
+        if EoR >= 0 :
+            # Yay..  a full ATCmdResp, claim it from gRxBuf
+            # Unclaimed data before the cmd (already on console) is dropped
+            SoC = lpos (SoC)
+            gRxBuf.skip (SoC)
+            fullrsp = gRxBuf.read (EoR - SoC)
             break
-            #print ("now, gRxBuf: " + repr (gRxBuf))
-        timeout -= delay; time.sleep (delay)
+        remaining = deadline - time.time ()
+        if remaining <= 0 : break
+        # Sleep till SerialRxLoop appends data or time is up
+        gRxBufCond.wait (remaining)
+    gRxBufCond.release ()
+    if gPyVer == 3 : fullrsp = fullrsp.decode (errors="replace")
+    # With echo off, only the <CR><LF> framing of AT responses
+    if gEcho : fullrsp = StripStartOfString (fullrsp)
+    elif fullrsp[:2] == '\r\n' : fullrsp = fullrsp[2:]
     return fullrsp
 
+# Function to disable modem's echo with gEchoOffCmd and confirm it with AT
+# Usage  : EchoOff ()
+# Return : True if echo is off, else gEcho stays set and echo is stripped
+def EchoOff () :
+    global gEcho
+    since = RxMark ()
+    SendSerialData (gSerPort, gEchoOffCmd + '\r')
+    if 'OK' not in GetResponse (gEchoOffCmd + '\r', 3, since) : return False
+    gEcho = False
+    since = RxMark ()
+    SendSerialData (gSerPort, 'AT\r')
+    rsp = GetResponse ('AT\r', 3, since)
+    # Modem still echoing, keep stripping the echo
+    if 'OK' not in rsp or rsp.startswith ('AT') : gEcho = True
+    return not gEcho
+
 def SerialRxLoop (name) :
     global gRxBuf
 
@@ -195,15 +221,18 @@ def SerialRxLoop (name) :
         if nBytes <= 0 : continue
         #print ("Rx-Count: " + str (nBytes))
         rxchunk = RecvSerialData (gSerPort, nBytes)
-        if rxchunk == "": continue
-        # append the rxchunk to global rx buffer
-        gLockRxBuf.acquire ()
-        gRxBuf += rxchunk
-        gLockRxBuf.release ()
+        if not rxchunk : continue
+        # append the rxchunk to global rx buffer and wake up waiters
+        gRxBufCond.acquire ()
+        gRxBuf.write (rxchunk)
+        gRxBufCond.notify_all ()
+        gRxBufCond.release ()
         # Write Serial data on console
         rxd = rxchunk
+        if gPyVer == 3 : rxd = rxd.decode (errors="replace")
         if gModem == MODEM_AT :
             if rxd[0:2] == '\r\n' : rxd = rxd[2:]
+        if gModem == MODEM_AT and gEcho :
             cmd = gSerCmd
             soc = rxd.find (cmd)
             if soc >= 0 :
@@ -215,20 +244,26 @@ def SerialRxLoop (name) :
 
 #if __name__ == "__main__":
 gLockRxBuf = threading.Lock ()
-SetupSentries ()
+# SerialRxLoop notifies on this whenever it appends data to gRxBuf
+gRxBufCond = threading.Condition (gLockRxBuf)
+
+# Command whose echo SerialRxLoop keeps off the console
+gSerCmd = gEchoOffCmd + '\r'
 
 if gSerialRxThread :
     x = threading.Thread(target=SerialRxLoop, args=("SerialRxLoop",))
     x.start()
+    if gModem == MODEM_AT : EchoOff ()
 
 while True : 
     try :
         cmd = ReadConsoleInput ('')
         if not cmd : continue
         gSerCmd = cmd+'\r'
+        since = RxMark ()
         SendSerialData (gSerPort, cmd+'\r')
         if not gSerialRxThread : SerialRxLoop ('rxloop')
-        rsp = GetResponse (cmd+'\r', 3)
+        rsp = GetResponse (cmd+'\r', 3, since)
         # process rsp and/or call handlers/callbacks as required
         #sys.stdout.write (rsp)
     except IOError : pass